@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+
+import database
+from database import (get_analytics_rollups, get_analytics_backfill, backfill_analytics_batch,
+                      reset_analytics, prune_analytics, ANALYTICS_SOURCES)
+
+# Pre-existing rows rolled up per transaction by the backfill
+ANALYTICS_BACKFILL_BATCH_SIZE = int(os.environ.get('ANALYTICS_BACKFILL_BATCH_SIZE', '5000'))
+# Hourly buckets older than this are deleted (daily buckets are kept)
+ANALYTICS_HOURLY_RETENTION_DAYS = int(os.environ.get('ANALYTICS_HOURLY_RETENTION_DAYS', '14'))
+# How often the background thread prunes old hourly buckets
+ANALYTICS_PRUNE_INTERVAL = float(os.environ.get('ANALYTICS_PRUNE_INTERVAL', '3600'))
+
+METRICS = ('new_users', 'orders', 'revenue')
+
+# ?period= -> (granularity, number of buckets)
+PERIODS = {
+    '24h': ('hour', 24),
+    '7d': ('day', 7),
+    '30d': ('day', 30),
+    '90d': ('day', 90),
+}
+
+def bucket_start(now, granularity):
+    """Truncate a UTC datetime to the start of its hour or day"""
+    if granularity == 'hour':
+        return now.replace(minute=0, second=0, microsecond=0)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def format_bucket(moment, granularity):
+    """Bucket key as stored by the rollup triggers"""
+    return moment.strftime('%Y-%m-%d %H:00:00' if granularity == 'hour' else '%Y-%m-%d')
+
+def summarize(values):
+    """Totals dict for one window, with the average order value derived from it"""
+    totals = {metric: values.get(metric, 0) for metric in METRICS}
+    totals['new_users'] = int(totals['new_users'])
+    totals['orders'] = int(totals['orders'])
+    totals['revenue'] = round(totals['revenue'], 2)
+    totals['average_order_value'] = round(totals['revenue'] / totals['orders'], 2) if totals['orders'] else 0
+    return totals
+
+def percent_change(current, previous):
+    if not previous:
+        return None
+    return round((current - previous) / previous * 100, 1)
+
+class AnalyticsRollups:
+    """Admin analytics answered from the hourly/daily rollup tables
+
+    Triggers keep the rollups current as users and orders are inserted, so a
+    report reads at most two windows of buckets (180 rows for 90d) whatever
+    the size of the raw tables. Rows that existed before the rollups are
+    counted by a batched backfill that runs in the background thread.
+    """
+
+    def __init__(self, batch_size=ANALYTICS_BACKFILL_BATCH_SIZE,
+                 hourly_retention_days=ANALYTICS_HOURLY_RETENTION_DAYS, prune_interval=ANALYTICS_PRUNE_INTERVAL):
+        self.batch_size = batch_size
+        self.hourly_retention_days = hourly_retention_days
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._backfilled = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'backfill_batches': 0,
+            'backfilled_ids': 0,
+            'pruned_buckets': 0,
+            'errors': 0,
+        }
+
+    # Maintenance
+    def backfill_pending(self):
+        """Whether pre-existing rows are still being rolled up"""
+        if self._backfilled:
+            return False
+        pending = any(last_id < max_id for last_id, max_id in get_analytics_backfill().values())
+        self._backfilled = not pending
+        return pending
+
+    def backfill(self, max_batches=None):
+        """Roll up pre-existing rows in batches; returns the number of ids covered"""
+        total = 0
+        batches = 0
+        for source in ANALYTICS_SOURCES:
+            while True:
+                if self._stop.is_set() or (max_batches is not None and batches >= max_batches):
+                    return total
+                covered = backfill_analytics_batch(source, self.batch_size)
+                if not covered:
+                    break
+                total += covered
+                batches += 1
+                with self._lock:
+                    self._stats['backfill_batches'] += 1
+                    self._stats['backfilled_ids'] += covered
+        self._backfilled = True
+        return total
+
+    def rebuild(self):
+        """Recompute every rollup from the raw tables"""
+        reset_analytics()
+        self._backfilled = False
+        return self.backfill()
+
+    def prune(self, now=None):
+        """Delete hourly buckets past the retention window; returns the number deleted"""
+        now = now or datetime.now(timezone.utc)
+        cutoff = bucket_start(now, 'day') - timedelta(days=self.hourly_retention_days)
+        deleted = prune_analytics('hour', format_bucket(cutoff, 'hour'))
+        with self._lock:
+            self._stats['pruned_buckets'] += deleted
+        return deleted
+
+    # Reports
+    def report(self, period, now=None):
+        """Totals, change against the previous window and a zero-filled series for a period"""
+        granularity, count = PERIODS[period]
+        step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+        end = bucket_start(now or datetime.now(timezone.utc), granularity)
+        start = end - step * (count - 1)
+        previous_start = start - step * count
+
+        buckets = {}  # bucket -> {metric: value}
+        for row in get_analytics_rollups(granularity, METRICS, format_bucket(previous_start, granularity),
+                                         format_bucket(end, granularity)):
+            buckets.setdefault(row['bucket'], {})[row['metric']] = row['value']
+
+        current, previous = {}, {}
+        series = []
+        for index in range(count * 2):
+            key = format_bucket(previous_start + step * index, granularity)
+            values = buckets.get(key, {})
+            window = previous if index < count else current
+            for metric in METRICS:
+                window[metric] = window.get(metric, 0) + values.get(metric, 0)
+            if index >= count:
+                series.append({'bucket': key, **summarize(values)})
+
+        totals = summarize(current)
+        previous = summarize(previous)
+        return {
+            'period': period,
+            'granularity': granularity,
+            'start': format_bucket(start, granularity),
+            'end': format_bucket(end, granularity),
+            'totals': totals,
+            'previous': previous,
+            'change_percent': {metric: percent_change(totals[metric], previous[metric]) for metric in totals},
+            'series': series,
+            'complete': not self.backfill_pending(),
+        }
+
+    def dashboard(self, now=None):
+        """Headline numbers: today, the last 24 hours by hour, and 7/30 day totals"""
+        now = now or datetime.now(timezone.utc)
+        last_24h = self.report('24h', now)
+        week = self.report('7d', now)
+        month = self.report('30d', now)
+        return {
+            'today': week['series'][-1],
+            'last_24h': {key: last_24h[key] for key in ('totals', 'change_percent', 'series')},
+            'last_7d': {key: week[key] for key in ('totals', 'change_percent')},
+            'last_30d': {key: month[key] for key in ('totals', 'change_percent')},
+            'complete': month['complete'],
+        }
+
+    def _run(self):
+        while True:
+            try:
+                self.backfill()
+                self.prune()
+            except Exception:
+                # The backfill resumes from its last committed batch
+                with self._lock:
+                    self._stats['errors'] += 1
+            if self._stop.wait(self.prune_interval):
+                return
+
+    def start(self):
+        """Start the background backfill/prune thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='analytics', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['backfill_complete'] = self._backfilled
+        return stats
+
+analytics = AnalyticsRollups()
+atexit.register(analytics.stop)
+
+def main(argv=None):
+    """Command line entry point: python analytics.py [--rebuild] [--report 30d]"""
+    parser = argparse.ArgumentParser(description='Backfill and inspect the analytics rollups')
+    parser.add_argument('--rebuild', action='store_true', help='recompute every rollup from the raw tables')
+    parser.add_argument('--report', choices=sorted(PERIODS), help='print the report for a period')
+    parser.add_argument('--batch-size', type=int, default=ANALYTICS_BACKFILL_BATCH_SIZE,
+                        help='rows rolled up per transaction')
+    parser.add_argument('--database', help='SQLite database file (defaults to DATABASE_PATH)')
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error('--batch-size must be positive')
+
+    if args.database:
+        database.DATABASE_PATH = args.database
+    database.init_database()
+
+    rollups = AnalyticsRollups(batch_size=args.batch_size)
+    started = time.perf_counter()
+    covered = rollups.rebuild() if args.rebuild else rollups.backfill()
+    print(f"Rolled up {covered} ids in {rollups.stats()['backfill_batches']} batches "
+          f"in {time.perf_counter() - started:.2f}s")
+    if args.report:
+        print(json.dumps(rollups.report(args.report), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""ASGI entry point: the Flask app wrapped for uvicorn and other ASGI servers
+
+Run through `python serve.py --server uvicorn`, which initializes the
+database once before starting workers. Requests run on a2wsgi's thread pool.
+The lifespan shutdown (sent once in-flight requests are done) does what
+gunicorn's worker_exit hook does: flush pending inventory and analytics,
+stop the background threads and close the connections.
+"""
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from main import create_app
+from serve import shutdown_worker
+
+wsgi_application = WSGIMiddleware(create_app(initialize_database=False),
+                                  workers=int(os.environ.get('WEB_THREADS', '4')))
+
+async def application(scope, receive, send):
+    if scope['type'] != 'lifespan':
+        return await wsgi_application(scope, receive, send)
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                shutdown_worker()
+            except Exception as e:
+                await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+            else:
+                await send({'type': 'lifespan.shutdown.complete'})
+            return
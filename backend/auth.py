@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_admin_by_id
+from passwords import session_stamp
+
+# Password hashes computed at once per process; hashing releases the GIL, so
+# this caps the CPU logins can take no matter how many request threads wait
+AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', '2'))
+# Logins allowed to queue for a hash worker before new ones are turned away
+AUTH_MAX_PENDING = int(os.environ.get('AUTH_MAX_PENDING', '16'))
+
+# Token buckets: a burst of attempts, refilled at a steady rate per minute
+LOGIN_IP_BURST = float(os.environ.get('LOGIN_IP_BURST', '10'))
+LOGIN_IP_PER_MINUTE = float(os.environ.get('LOGIN_IP_PER_MINUTE', '10'))
+LOGIN_USER_BURST = float(os.environ.get('LOGIN_USER_BURST', '5'))
+LOGIN_USER_PER_MINUTE = float(os.environ.get('LOGIN_USER_PER_MINUTE', '5'))
+# Buckets tracked in memory; the least recently used are dropped beyond this
+LOGIN_TRACKER_SIZE = int(os.environ.get('LOGIN_TRACKER_SIZE', '10000'))
+
+# How long a verified admin session stamp is trusted before it is re-read
+ADMIN_SESSION_CACHE_TTL = float(os.environ.get('ADMIN_SESSION_CACHE_TTL', '30'))
+
+class AuthBusy(Exception):
+    """Too many logins are already waiting for a password check"""
+
+class TokenBuckets:
+    """Bounded LRU map of token buckets, one per key"""
+
+    def __init__(self, burst, per_minute, max_keys=LOGIN_TRACKER_SIZE):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def _level(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def take(self, key):
+        """Spend a token; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._level(key, now)
+            if tokens < 1:
+                return (1 - tokens) / self.rate if self.rate else float('inf')
+            self._buckets[key] = (tokens - 1, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+class LoginThrottle:
+    """Per-IP and per-username login attempt limits"""
+
+    def __init__(self):
+        self.by_ip = TokenBuckets(LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE)
+        self.by_user = TokenBuckets(LOGIN_USER_BURST, LOGIN_USER_PER_MINUTE)
+        self._lock = threading.Lock()
+        self._stats = {'attempts': 0, 'throttled_ip': 0, 'throttled_user': 0, 'succeeded': 0, 'failed': 0}
+
+    def check(self, ip, username):
+        """Spend one attempt; returns seconds to wait (0 if the attempt may proceed)"""
+        with self._lock:
+            self._stats['attempts'] += 1
+        wait = self.by_ip.take(ip)
+        if wait:
+            with self._lock:
+                self._stats['throttled_ip'] += 1
+            return wait
+        wait = self.by_user.take(username.lower())
+        if wait:
+            with self._lock:
+                self._stats['throttled_user'] += 1
+        return wait
+
+    def record(self, ip, username, success):
+        with self._lock:
+            self._stats['succeeded' if success else 'failed'] += 1
+        if success:
+            self.by_user.reset(username.lower())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['tracked_ips'] = len(self.by_ip)
+        stats['tracked_users'] = len(self.by_user)
+        return stats
+
+class PasswordChecker:
+    """Runs password verification on a small dedicated thread pool"""
+
+    def __init__(self, workers=AUTH_HASH_WORKERS, max_pending=AUTH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _get_executor(self):
+        # Thread pools don't survive fork(), so each worker process makes its own
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='auth')
+            self._pid = os.getpid()
+        return self._executor
+
+    def run(self, func, *args):
+        """Call func(*args) on the pool and wait for it; raises AuthBusy if the queue is full"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise AuthBusy()
+            self._pending += 1
+            executor = self._get_executor()
+        try:
+            return executor.submit(func, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'pending': self._pending, 'max_pending': self.max_pending}
+
+class AdminSessionCache:
+    """admin_id -> current session stamp, re-read from the database after a TTL"""
+
+    def __init__(self, ttl=ADMIN_SESSION_CACHE_TTL):
+        self.ttl = ttl
+        self._stamps = {}
+        self._lock = threading.Lock()
+
+    def stamp(self, admin_id):
+        """Return the admin's current stamp, or None if the admin no longer exists"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._stamps.get(admin_id)
+        if cached is not None and now - cached[1] < self.ttl:
+            return cached[0]
+        admin = get_admin_by_id(admin_id)
+        stamp = session_stamp(admin['password']) if admin else None
+        with self._lock:
+            self._stamps[admin_id] = (stamp, now)
+        return stamp
+
+    def forget(self, admin_id):
+        with self._lock:
+            self._stamps.pop(admin_id, None)
+
+login_throttle = LoginThrottle()
+password_checker = PasswordChecker()
+admin_sessions = AdminSessionCache()
+
+def is_admin_session(session):
+    """True if the Flask session belongs to a logged-in admin whose password hasn't changed since"""
+    admin_id = session.get('admin_id')
+    if admin_id is None:
+        return False
+    stamp = session.get('admin_stamp')
+    return stamp is not None and stamp == admin_sessions.stamp(admin_id)
@@ -0,0 +1,424 @@
+"""Benchmark suite for the database layer and the Flask API
+
+Layers:
+  seed    fill a database with synthetic users and products
+  micro   time database.py functions directly
+  app     drive the Flask app in-process through its test client
+  http    multi-process HTTP load against a running server
+  compare diff two result files and flag regressions
+
+Examples:
+  python benchmark.py all --scale 10000 --output before.json
+  python benchmark.py http --url http://localhost:5000 --workers 8 --duration 20
+  python benchmark.py compare before.json after.json --threshold 10
+
+`seed`, `micro`, `app` and `all` work on a throwaway database in a temp
+directory unless --database is given, so they never touch database.db.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+import http.client
+import multiprocessing
+from urllib.parse import urlsplit
+
+WORDS = (
+    'wireless bluetooth premium organic cotton smart fitness gaming mechanical '
+    'keyboard headphones watch coffee maker yoga mat laptop phone case cable '
+    'charger lamp desk chair shirt shoes jacket backpack bottle speaker camera '
+    'monitor mouse ultra pro mini max classic deluxe portable compact steel'
+).split()
+
+# Benchmarks stop after this many iterations or seconds, whichever comes first
+DEFAULT_ITERATIONS = 2000
+DEFAULT_DURATION = 5.0
+
+def summarize(name, latencies, elapsed, errors=0):
+    """Turn raw latencies (seconds) into throughput and percentile stats"""
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def percentile(fraction):
+        if not count:
+            return None
+        return round(latencies[min(count - 1, int(fraction * count))] * 1000, 4)
+
+    return {
+        'name': name,
+        'operations': count,
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(count / elapsed, 1) if elapsed > 0 else None,
+        'mean_ms': round(sum(latencies) / count * 1000, 4) if count else None,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1] * 1000, 4) if count else None,
+    }
+
+def measure(name, operation, iterations=DEFAULT_ITERATIONS, duration=DEFAULT_DURATION):
+    """Call operation(i) repeatedly and summarize its latency
+
+    An operation that returns False (or raises) counts as an error.
+    """
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    for i in range(iterations):
+        op_started = time.perf_counter()
+        try:
+            ok = operation(i)
+        except Exception:
+            ok = False
+        finished = time.perf_counter()
+        if ok is False:
+            errors += 1
+        else:
+            latencies.append(finished - op_started)
+        if finished >= deadline:
+            break
+    result = summarize(name, latencies, time.perf_counter() - started, errors)
+    print(f"  {name:<44} {result['throughput_per_second'] or 0:>10.1f}/s  "
+          f"p50 {result['p50_ms'] or 0:.3f}ms  p95 {result['p95_ms'] or 0:.3f}ms  "
+          f"p99 {result['p99_ms'] or 0:.3f}ms  errors {errors}")
+    return result
+
+# Seeding
+def use_database(path):
+    """Point database.py at `path` (must run before database/main are imported)"""
+    os.environ['DATABASE_PATH'] = path
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def seed(scale, users=None, batch_size=10000, rng_seed=42):
+    """Insert `scale` products and `users` (default scale // 10) users"""
+    import database
+
+    database.init_database()
+    rng = random.Random(rng_seed)
+    users = scale // 10 if users is None else users
+    started = time.perf_counter()
+    conn = database.get_db_connection()
+    try:
+        for offset in range(0, scale, batch_size):
+            rows = [
+                (random_text(rng, 3).title(), round(rng.uniform(1, 2000), 2), random_text(rng, 20),
+                 rng.choice((None, rng.randint(0, 500))))
+                for _ in range(min(batch_size, scale - offset))
+            ]
+            conn.executemany("INSERT INTO products (name, price, description, stock) VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+        for offset in range(0, users, batch_size):
+            rows = [
+                (random_text(rng, 2).title(), f'user{offset + i}-{rng.random():.8f}@example.com')
+                for i in range(min(batch_size, users - offset))
+            ]
+            conn.executemany("INSERT INTO users (name, email) VALUES (?, ?)", rows)
+            conn.commit()
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {scale} products and {users} users in {elapsed:.1f}s")
+    return {'products': scale, 'users': users, 'seconds': round(elapsed, 2)}
+
+def id_range(table):
+    import database
+    row = database.execute_query(f"SELECT MIN(id), MAX(id) FROM {table}", fetch='one')
+    return (row[0] or 1), (row[1] or 1)
+
+# Micro-benchmarks
+def run_micro(iterations, duration, rng_seed=42):
+    """Time each database.py read/write function in isolation"""
+    import database
+    from sessions import SessionStore
+
+    rng = random.Random(rng_seed)
+    low, high = id_range('products')
+    user_low, user_high = id_range('users')
+    first_page = database.get_products_page(50)
+    store = SessionStore()
+    uncached_store = SessionStore(cache_ttl=0)
+    token, _ = store.create(user_low)
+    print('Database micro-benchmarks:')
+
+    def cursor_page(i):
+        row = first_page[-1] if first_page else None
+        after = (row['created_at'], row['id']) if row else None
+        return database.get_products_page(50, after=after)
+
+    def checkout(i):
+        cart_id = database.create_cart()
+        database.add_cart_item(cart_id, rng.randint(low, high), 1)
+        try:
+            database.checkout_cart(cart_id)
+        except ValueError:
+            pass  # out of stock is a valid outcome here
+
+    benches = [
+        ('db.get_product_by_id', lambda i: database.get_product_by_id(rng.randint(low, high))),
+        ('db.get_user_by_id', lambda i: database.get_user_by_id(rng.randint(user_low, user_high))),
+        ('db.get_products_page[created_at]', lambda i: database.get_products_page(50)),
+        ('db.get_products_page[price,filtered]',
+         lambda i: database.get_products_page(50, sort='price', descending=False, min_price=100, max_price=500)),
+        ('db.get_products_page[name]', lambda i: database.get_products_page(50, sort='name', descending=False)),
+        ('db.get_products_page[cursor]', cursor_page),
+        ('db.search_products', lambda i: database.search_products(rng.choice(WORDS), 20)),
+        ('db.search_products[prefix]', lambda i: database.search_products(rng.choice(WORDS)[:3], 20)),
+        ('db.get_available_stock[50]',
+         lambda i: database.get_available_stock(rng.randint(low, high) for _ in range(50))),
+        ('db.create_product', lambda i: database.create_product(f'Bench {i}', 9.99, 'benchmark product')),
+        ('db.update_product',
+         lambda i: database.update_product(rng.randint(low, high), f'Bench {i}', 19.99, 'updated')),
+        ('db.create_user', lambda i: database.create_user('Bench User', f'bench-{time.time_ns()}@example.com')),
+        ('db.checkout_cart', checkout),
+        ('db.apply_inventory_journal', lambda i: database.apply_inventory_journal()),
+        ('sessions.validate[cached]', lambda i: store.validate(token)),
+        ('sessions.validate[uncached]', lambda i: uncached_store.validate(token)),
+    ]
+    results = [measure(name, op, iterations, duration) for name, op in benches]
+    # Whole-table reads scale with the data, so run them only a few times
+    results.append(measure('db.get_all_users', lambda i: database.get_all_users(), 20, duration))
+    results.append(measure('db.get_all_products', lambda i: database.get_all_products(), 20, duration))
+    return results
+
+# In-process Flask benchmarks
+def run_app(iterations, duration, rng_seed=42):
+    """Drive the Flask app through its test client (no network)"""
+    # Every request comes from the test client's one address, so the per-IP and
+    # per-route limits would turn most of them into 429s; measure the app instead
+    # unless RATE_LIMIT_ENABLED is set (read when main is imported)
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    import main
+
+    rng = random.Random(rng_seed)
+    low, high = id_range('products')
+    app = main.create_app()
+    client = app.test_client()
+    admin = app.test_client()
+    admin.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'})
+    print('In-process Flask benchmarks:')
+
+    def ok(response, *statuses):
+        return response.status_code in (statuses or (200,))
+
+    benches = [
+        ('app GET /api/products', lambda i: ok(client.get('/api/products'))),
+        ('app GET /api/products?sort=price&min_price',
+         lambda i: ok(client.get(f'/api/products?sort=price&min_price={rng.randint(1, 1500)}'))),
+        ('app GET /api/products/<id>', lambda i: ok(client.get(f'/api/products/{rng.randint(low, high)}'), 200, 404)),
+        ('app GET /api/products/search',
+         lambda i: ok(client.get(f'/api/products/search?q={rng.choice(WORDS)}&limit=20'))),
+        ('app POST /api/admin/products',
+         lambda i: ok(admin.post('/api/admin/products', json={'name': f'Bench {i}', 'price': 5}), 201)),
+        ('app PUT /api/admin/products/<id>',
+         lambda i: ok(admin.put(f'/api/admin/products/{rng.randint(low, high)}',
+                                json={'name': f'Bench {i}', 'price': 6}), 200, 404)),
+    ]
+    return [measure(name, op, iterations, duration) for name, op in benches]
+
+# HTTP load generator
+def _http_worker(args):
+    """One load-generating process: loops over the request mix until the deadline"""
+    base_url, duration, mix, id_high, worker_seed = args
+    rng = random.Random(worker_seed)
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+
+    if any(kind.startswith('admin') for kind, _ in mix):
+        body = json.dumps({'username': 'admin', 'password': 'admin123'})
+        while True:
+            conn.request('POST', '/api/admin/login', body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status not in (429, 503):
+                break
+            # Many workers logging in at once trip the login rate limit
+            time.sleep(float(response.getheader('Retry-After', '1')))
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            headers['Cookie'] = cookie.split(';', 1)[0]
+
+    kinds = [kind for kind, _ in mix]
+    weights = [weight for _, weight in mix]
+    latencies = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        body = None
+        if kind == 'products':
+            method, path = 'GET', '/api/products'
+        elif kind == 'product':
+            method, path = 'GET', f'/api/products/{rng.randint(1, id_high)}'
+        elif kind == 'admin_create':
+            method, path = 'POST', '/api/admin/products'
+            body = json.dumps({'name': f'Load {rng.random():.6f}', 'price': 1})
+        else:  # admin_update
+            method, path = 'PUT', f'/api/admin/products/{rng.randint(1, id_high)}'
+            body = json.dumps({'name': f'Load {rng.random():.6f}', 'price': 2})
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            # 429 (rate limited) and 503 (shed) are errors: the server turned the request away
+            failed = response.status >= 500 or response.status in (401, 403, 429)
+        except (OSError, http.client.HTTPException):
+            failed = True
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        if failed:
+            errors[kind] += 1
+        else:
+            latencies[kind].append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+def run_http(base_url, workers, duration, mix):
+    """Run `workers` processes against a live server and merge their latencies"""
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    conn.request('GET', '/api/products?limit=1&fields=id')
+    newest = json.loads(conn.getresponse().read()).get('products') or [{'id': 1}]
+    conn.close()
+
+    print(f'HTTP load: {workers} workers x {duration}s against {base_url}')
+    started = time.perf_counter()
+    jobs = [(base_url, duration, mix, newest[0]['id'], seed) for seed in range(workers)]
+    with multiprocessing.Pool(workers) as pool:
+        outcomes = pool.map(_http_worker, jobs)
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for kind, _ in mix:
+        latencies = [value for worker_latencies, _ in outcomes for value in worker_latencies[kind]]
+        errors = sum(worker_errors[kind] for _, worker_errors in outcomes)
+        result = summarize(f'http {kind}', latencies, elapsed, errors)
+        print(f"  {result['name']:<44} {result['throughput_per_second'] or 0:>10.1f}/s  "
+              f"p50 {result['p50_ms'] or 0:.3f}ms  p95 {result['p95_ms'] or 0:.3f}ms  "
+              f"p99 {result['p99_ms'] or 0:.3f}ms  errors {errors}")
+        results.append(result)
+    return results
+
+# Results
+def environment_info(**extra):
+    try:
+        import orjson  # noqa: F401
+        json_backend = 'orjson'
+    except ImportError:
+        json_backend = 'stdlib'
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'json_backend': json_backend,
+        **extra,
+    }
+
+def save_results(path, meta, results):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print(f'Results written to {path}')
+
+def compare(old_path, new_path, threshold):
+    """Print a comparison of two runs; returns the number of regressions"""
+    with open(old_path) as f:
+        old = {result['name']: result for result in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {result['name']: result for result in json.load(f)['results']}
+
+    regressions = 0
+    print(f"{'benchmark':<44} {'ops/s old':>11} {'ops/s new':>11} {'p95 old':>9} {'p95 new':>9}  change")
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name], new[name]
+        throughput_change = _change(before['throughput_per_second'], after['throughput_per_second'])
+        p95_change = _change(before['p95_ms'], after['p95_ms'])
+        regressed = (throughput_change is not None and throughput_change < -threshold) or \
+                    (p95_change is not None and p95_change > threshold)
+        regressions += regressed
+        print(f"{name:<44} {before['throughput_per_second'] or 0:>11.1f} {after['throughput_per_second'] or 0:>11.1f} "
+              f"{before['p95_ms'] or 0:>9.3f} {after['p95_ms'] or 0:>9.3f}  "
+              f"{throughput_change or 0:+.1f}% ops, {p95_change or 0:+.1f}% p95"
+              f"{'  REGRESSION' if regressed else ''}")
+    for name in sorted(set(old) ^ set(new)):
+        print(f"{name:<44} only in {'old' if name in old else 'new'} run")
+    return regressions
+
+def _change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def local_options(p):
+        p.add_argument('--scale', type=int, default=10000, help='products to seed (users = scale / 10)')
+        p.add_argument('--database', help='database file to use instead of a temp copy')
+        p.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+        p.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='seconds per benchmark')
+        p.add_argument('--output', help='write results JSON here')
+
+    p = sub.add_parser('seed', help='seed a database with synthetic data')
+    p.add_argument('--scale', type=int, default=10000)
+    p.add_argument('--database', required=True)
+    for name in ('micro', 'app', 'all'):
+        local_options(sub.add_parser(name, help=f'run the {name} benchmarks'))
+    p = sub.add_parser('http', help='multi-process HTTP load test against a running server')
+    p.add_argument('--url', default='http://localhost:5000')
+    p.add_argument('--workers', type=int, default=4)
+    p.add_argument('--duration', type=float, default=10.0)
+    p.add_argument('--write-ratio', type=float, default=0.05, help='fraction of admin write requests')
+    p.add_argument('--output')
+    p = sub.add_parser('compare', help='compare two result files')
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=10.0, help='allowed change in percent')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        return 1 if compare(args.old, args.new, args.threshold) else 0
+
+    if args.command == 'http':
+        reads = 1 - args.write_ratio
+        mix = [('products', reads * 0.3), ('product', reads * 0.7),
+               ('admin_create', args.write_ratio / 2), ('admin_update', args.write_ratio / 2)]
+        results = run_http(args.url, args.workers, args.duration, [m for m in mix if m[1] > 0])
+        if args.output:
+            save_results(args.output, environment_info(url=args.url, workers=args.workers), results)
+        return 0
+
+    if args.command == 'seed':
+        use_database(args.database)
+        seed(args.scale)
+        return 0
+
+    path = args.database or os.path.join(tempfile.mkdtemp(prefix='shophub-bench-'), 'bench.db')
+    use_database(path)
+    seeded = None
+    if not args.database:
+        seeded = seed(args.scale)
+    results = []
+    if args.command in ('micro', 'all'):
+        results += run_micro(args.iterations, args.duration)
+    if args.command in ('app', 'all'):
+        results += run_app(args.iterations, args.duration)
+    if args.output:
+        save_results(args.output, environment_info(scale=args.scale, database=path, seeded=seeded), results)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import io
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+
+import database
+from database import init_database, upsert_products_batch
+from validation import validate_product
+
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', '1000'))
+
+# Only the first errors are reported back, so a bad file can't blow up the response
+MAX_REPORTED_ERRORS = 100
+
+# Content-Type -> import format
+IMPORT_FORMATS = {
+    'text/csv': 'csv',
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+def parse_records(stream, fmt):
+    """Yield (row number, record, error) tuples from a binary stream
+
+    CSV and NDJSON are parsed incrementally; a JSON body must be an array of
+    objects (or {"products": [...]}) and is loaded in one go.
+    """
+    if fmt == 'json':
+        try:
+            data = json.load(stream)
+        except ValueError as e:
+            yield 1, None, f"Invalid JSON: {e}"
+            return
+        if isinstance(data, dict):
+            data = data.get('products')
+        if not isinstance(data, list):
+            yield 1, None, "JSON body must be an array of products"
+            return
+        for number, record in enumerate(data, start=1):
+            if isinstance(record, dict):
+                yield number, record, None
+            else:
+                yield number, None, "Row must be an object"
+        return
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        # Row numbers count the header as row 1, matching spreadsheet line numbers
+        for number, record in enumerate(csv.DictReader(text), start=2):
+            yield number, record, None
+    elif fmt == 'ndjson':
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Invalid JSON: {e}"
+                continue
+            if isinstance(record, dict):
+                yield number, record, None
+            else:
+                yield number, None, "Row must be an object"
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+def parse_product_id(value):
+    """Parse the optional id column; blank means insert a new product"""
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        product_id = int(value)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid id")
+    if product_id < 1:
+        raise ValueError("Invalid id")
+    return product_id
+
+def import_products(records, batch_size=BULK_IMPORT_BATCH_SIZE):
+    """Validate records and write them in batches of batch_size per transaction
+
+    Returns a report with row counts, per-row errors and throughput.
+    """
+    started = time.perf_counter()
+    report = {'total': 0, 'imported': 0, 'failed': 0, 'batches': 0, 'errors': []}
+    batch = []
+    numbers = []
+
+    def record_error(number, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': number, 'error': message})
+
+    def flush():
+        failures = upsert_products_batch(batch)
+        for index, message in failures:
+            record_error(numbers[index], message)
+        report['imported'] += len(batch) - len(failures)
+        report['batches'] += 1
+        batch.clear()
+        numbers.clear()
+
+    for number, record, error in records:
+        report['total'] += 1
+        if error is None:
+            try:
+                name, price, description = validate_product(record)
+                product_id = parse_product_id(record.get('id'))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            record_error(number, error)
+            continue
+
+        batch.append((product_id, name, price, description))
+        numbers.append(number)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    elapsed = time.perf_counter() - started
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['rows_per_second'] = round(report['imported'] / elapsed, 1) if elapsed > 0 else None
+    return report
+
+def main(argv=None):
+    """Command line entry point: python bulk_import.py products.csv"""
+    parser = argparse.ArgumentParser(description='Bulk import products into the database')
+    parser.add_argument('path', help="CSV, JSON or NDJSON file, or '-' for stdin")
+    parser.add_argument('--format', choices=sorted(set(IMPORT_FORMATS.values())),
+                        help='input format (defaults to the file extension)')
+    parser.add_argument('--batch-size', type=int, default=BULK_IMPORT_BATCH_SIZE,
+                        help='rows written per transaction')
+    parser.add_argument('--database', help='SQLite database file (defaults to DATABASE_PATH)')
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        extension = os.path.splitext(args.path)[1].lower().lstrip('.')
+        fmt = {'csv': 'csv', 'json': 'json', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}.get(extension)
+        if fmt is None:
+            parser.error('cannot infer the format from the file name, pass --format')
+    if args.batch_size < 1:
+        parser.error('--batch-size must be positive')
+
+    if args.database:
+        database.DATABASE_PATH = args.database
+    init_database()
+
+    if args.path == '-':
+        report = import_products(parse_records(sys.stdin.buffer, fmt), args.batch_size)
+    else:
+        with open(args.path, 'rb') as stream:
+            report = import_products(parse_records(stream, fmt), args.batch_size)
+
+    print(json.dumps(report, indent=2))
+    return 0 if report['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+# Catalog cache settings
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', '1024'))
+# The cache is per process: a write only invalidates the worker that handled
+# it, so other workers can serve the old response for up to
+# CATALOG_CACHE_TTL + CATALOG_CACHE_STALE_TTL seconds
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', '30'))
+# Expired entries are still served for this long while one request rebuilds them
+CATALOG_CACHE_STALE_TTL = float(os.environ.get('CATALOG_CACHE_STALE_TTL', '30'))
+# Longest a request waits for an identical in-flight build before building itself
+CATALOG_COALESCE_TIMEOUT = float(os.environ.get('CATALOG_COALESCE_TIMEOUT', '10'))
+
+# `variants` holds compressed copies of `body`, filled in lazily per encoding
+CacheEntry = namedtuple('CacheEntry', ['body', 'mimetype', 'etag', 'expires', 'variants'])
+
+def make_etag(body):
+    """Build a strong ETag value from a response body"""
+    return hashlib.sha1(body).hexdigest()
+
+class ResponseCache:
+    """Thread-safe LRU cache of serialized response bodies with a per-entry TTL"""
+
+    def __init__(self, max_entries=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL, stale_ttl=CATALOG_CACHE_STALE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key):
+        """Return the live entry for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry.expires <= time.monotonic():
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def lookup(self, key):
+        """Return (entry, fresh) for key, or (None, False)
+
+        An entry up to stale_ttl seconds past its expiry is returned with
+        fresh=False, for the caller to serve while it is rebuilt.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None, False
+            now = time.monotonic()
+            if entry.expires + self.stale_ttl <= now:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None, False
+            self._entries.move_to_end(key)
+            fresh = entry.expires > now
+            self._stats['hits' if fresh else 'stale_hits'] += 1
+            return entry, fresh
+
+    def set(self, key, body, mimetype):
+        """Store a response body and return its entry"""
+        entry = self._entry(body, mimetype)
+        with self._lock:
+            self._store(key, entry)
+        return entry
+
+    def _entry(self, body, mimetype):
+        return CacheEntry(body, mimetype, make_etag(body), time.monotonic() + self.ttl, {})
+
+    def _store(self, key, entry):
+        # Caller holds self._lock
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def delete(self, key):
+        """Remove a single entry"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """Return a snapshot of cache counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+            return stats
+
+class CatalogCache(ResponseCache):
+    """Response cache for product reads
+
+    Single products are keyed by id and dropped when that product changes.
+    List pages are keyed by the catalog version plus their query parameters,
+    so bumping the version on any write makes every cached page unreachable
+    without scanning the cache; the stale pages then age out through LRU/TTL.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._version = 0
+        # Recommendation refreshes, which drop their own keys without a version bump
+        self._refreshes = 0
+        # Wall-clock time of the last invalidation (catalog snapshots older than this are stale)
+        self.changed_at = 0.0
+        # Called with changed_at after each invalidation
+        self.on_change = None
+
+    @property
+    def version(self):
+        """Changes on every invalidation; pass the value from before a build to set()"""
+        return (self._version, self._refreshes)
+
+    def product_key(self, product_id):
+        return ('product', product_id)
+
+    def list_key(self, name, params):
+        return (name, self._version, tuple(sorted(params)))
+
+    def featured_key(self):
+        return self.list_key('featured', ())
+
+    def recommended_key(self, product_id):
+        return self.list_key(f'recommended:{product_id}', ())
+
+    def set(self, key, body, mimetype, version=None):
+        """Store a response body built while the catalog was at `version`
+
+        If a write happened in the meantime the body may be stale, so it is
+        returned to the caller but not cached. The version is compared under
+        the same lock as the insert, so a write can't slip in between.
+        """
+        entry = self._entry(body, mimetype)
+        with self._lock:
+            if version is not None and version != self.version:
+                return entry._replace(expires=0)
+            self._store(key, entry)
+        return entry
+
+    def invalidate_product(self, product_id=None):
+        """Invalidate one product (if given) and every cached list page"""
+        with self._lock:
+            self._version += 1
+            self.changed_at = changed_at = time.time()
+        if product_id is not None:
+            self.delete(self.product_key(product_id))
+        if self.on_change is not None:
+            self.on_change(changed_at)
+
+    def invalidate_recommendations(self, product_ids):
+        """Drop the featured list and the given products' details and recommendation lists
+
+        Recomputed recommendations don't change any list page, so unlike
+        invalidate_product() this leaves the list keys (and changed_at) alone.
+        Counting the refresh still keeps a build that started before it out
+        of the cache.
+        """
+        with self._lock:
+            self._refreshes += 1
+        self.delete(self.featured_key())
+        for product_id in product_ids:
+            self.delete(self.product_key(product_id))
+            self.delete(self.recommended_key(product_id))
+
+    def stats(self):
+        stats = super().stats()
+        stats['version'] = self._version
+        return stats
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+# Returned by SingleFlight.do(wait=False) when the key is already being computed
+IN_FLIGHT = object()
+
+class SingleFlight:
+    """Collapse concurrent computations of the same key into one
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for it and get the same result (or exception) instead of
+    repeating the work. Nothing is remembered once the call finishes;
+    caching the result is up to the caller.
+    """
+
+    def __init__(self, timeout=CATALOG_COALESCE_TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'coalesced': 0, 'stale_served': 0, 'wait_timeouts': 0}
+
+    def do(self, key, func, wait=True):
+        """Return func(), sharing one call among concurrent callers with the same key
+
+        With wait=False a caller that finds the key in flight gets IN_FLIGHT
+        straight away (e.g. to serve a stale copy meanwhile). A caller that
+        waits longer than the timeout runs func() itself.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+                leader = True
+            elif not wait:
+                self._stats['stale_served'] += 1
+                return IN_FLIGHT
+            else:
+                self._stats['coalesced'] += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self._stats['wait_timeouts'] += 1
+                return func()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+            return stats
+
+catalog_cache = CatalogCache()
+catalog_flights = SingleFlight()
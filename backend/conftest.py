@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read from the environment when the app modules are imported, so
+# they are set here first. Every test run gets its own database and files.
+TEST_DIR = tempfile.mkdtemp(prefix='shophub-tests-')
+os.environ.update({
+    'DATABASE_PATH': os.path.join(TEST_DIR, 'test.db'),
+    'IMAGE_STORAGE_PATH': os.path.join(TEST_DIR, 'images'),
+    'CATALOG_SNAPSHOT_PATH': os.path.join(TEST_DIR, 'catalog-snapshot.db'),
+    'RATE_LIMIT_DATABASE': os.path.join(TEST_DIR, 'ratelimit.db'),
+    # Cheap password hashes
+    'PASSWORD_HASH_N': '1024',
+    # Background jobs are run by the tests that need them
+    'JOB_WORKERS': '0',
+    'STARTUP_WARMUP': 'sync',
+    # Every request comes from the same test client address; the limits have tests of their own
+    'LOGIN_IP_BURST': '100000',
+    'LOGIN_USER_BURST': '100000',
+    'API_RATE_BURST': '100000',
+    'API_ROUTE_LIMITS': '',
+})
+
+# Scripts for a running server (python test_api.py), not pytest tests
+collect_ignore = ['test_api.py', 'test_products.py']
+
+@pytest.fixture(scope='session')
+def app():
+    import main
+    return main.create_app()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def admin_client(app):
+    """Test client logged in as the default admin"""
+    client = app.test_client()
+    response = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 200
+    return client
+
+@pytest.fixture
+def make_product(app):
+    """Insert a product directly and return its id (drops cached catalog responses, as the routes do)"""
+    from database import get_pool
+    from cache import catalog_cache
+
+    def make(name, price=1.0, description='', stock=None, category_id=None):
+        with get_pool().connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO products (name, price, description, stock, category_id) VALUES (?, ?, ?, ?, ?)",
+                (name, price, description, stock, category_id))
+            conn.commit()
+        catalog_cache.invalidate_product()
+        return cursor.lastrowid
+    return make
+
+@pytest.fixture
+def cli_database(tmp_path, monkeypatch):
+    """Path of a fresh database for a command line entry point's --database
+
+    The CLI repoints database.DATABASE_PATH; this gives it a pool of its own
+    and puts the test database back afterwards.
+    """
+    import database
+
+    monkeypatch.setattr(database, 'DATABASE_PATH', database.DATABASE_PATH)
+    monkeypatch.setattr(database, '_pool', None)
+    yield str(tmp_path / 'cli.db')
+    database.close_pool()
@@ -1,51 +1,208 @@
 import sqlite3
 import os
+import json
+import re
+import time
+import atexit
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
 
-DATABASE_PATH = 'database.db'
+from passwords import hash_password, verify_password, needs_rehash, dummy_hash
+from migrations import migrate as run_migrations, check_schema
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'database.db')
+
+# Connection pool settings
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '256'))
+
+# Retries for write transactions that hit SQLITE_BUSY
+WRITE_RETRIES = int(os.environ.get('DB_WRITE_RETRIES', '5'))
+WRITE_RETRY_BACKOFF = float(os.environ.get('DB_WRITE_RETRY_BACKOFF', '0.02'))  # seconds
+
+# Rows fetched per batch by streaming exports
+EXPORT_BATCH_SIZE = int(os.environ.get('DB_EXPORT_BATCH_SIZE', '500'))
+
+# PRAGMAs applied to every new connection
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('DB_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('DB_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('DB_BUSY_TIMEOUT', '5000')),
+    'cache_size': int(os.environ.get('DB_CACHE_SIZE', '-16000')),  # negative = KiB
+    'mmap_size': int(os.environ.get('DB_MMAP_SIZE', str(128 * 1024 * 1024))),
+}
 
 def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    """Get a new database connection with the configured PRAGMAs applied"""
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # pooled connections move between threads
+    )
     conn.row_factory = sqlite3.Row  # This enables column access by name
+    for name, value in SQLITE_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}').fetchall()
     return conn
 
-def init_database():
-    """Initialize database with required tables"""
+class ConnectionPool:
+    """Bounded pool of reusable SQLite connections"""
+
+    def __init__(self, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._closed = False
+        self.pid = os.getpid()
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+        }
+
+    def acquire(self):
+        """Check a connection out of the pool, waiting if all are in use"""
+        with self._cond:
+            if self._closed:
+                raise sqlite3.ProgrammingError('Connection pool is closed')
+            self._stats['checkouts'] += 1
+            if not self._idle and self._open >= self.max_size:
+                self._stats['waits'] += 1
+                started = time.perf_counter()
+                ready = self._cond.wait_for(
+                    lambda: self._idle or self._open < self.max_size or self._closed,
+                    timeout=self.timeout,
+                )
+                self._stats['wait_time_ms'] += (time.perf_counter() - started) * 1000
+                if not ready:
+                    self._stats['timeouts'] += 1
+                    raise sqlite3.OperationalError('Timed out waiting for a database connection')
+                if self._closed:
+                    raise sqlite3.ProgrammingError('Connection pool is closed')
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+
+        # Open the new connection outside the lock
+        try:
+            conn = get_db_connection()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if self._closed:
+                self._open -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def discard(self, conn):
+        """Close a broken connection instead of returning it to the pool"""
+        try:
+            conn.close()
+        finally:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except sqlite3.ProgrammingError:
+            # e.g. the connection was closed underneath us
+            self.discard(conn)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._open -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return a snapshot of pool counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['open_connections'] = self._open
+            stats['idle_connections'] = len(self._idle)
+            stats['in_use_connections'] = self._open - len(self._idle)
+            stats['max_size'] = self.max_size
+            return stats
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Get the process-wide connection pool, creating it on first use
+
+    SQLite connections must not be shared across fork(), so a forked worker
+    that inherited its parent's pool gets a fresh one.
+    """
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool()
+    return _pool
+
+def close_pool():
+    """Close the connection pool (called automatically at interpreter exit)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+atexit.register(close_pool)
+
+def get_pool_stats():
+    """Get connection pool statistics"""
+    return get_pool().stats()
+
+def init_database(migrate=True):
+    """Bring the schema up to date (see migrations.py) and seed required rows
+
+    With migrate=False the schema is only checked, and SchemaOutOfDate is
+    raised if migrations are pending.
+    """
     conn = get_db_connection()
+    try:
+        if migrate:
+            run_migrations(conn, log=lambda line: None)
+        check_schema(conn)
+    except Exception:
+        conn.close()
+        raise
     cursor = conn.cursor()
     
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Products table (example)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            price REAL NOT NULL,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Admin table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
     # Insert default admin if not exists
     cursor.execute('SELECT COUNT(*) FROM admins')
     admin_count = cursor.fetchone()[0]
@@ -53,15 +210,61 @@ def init_database():
         cursor.execute('''
             INSERT INTO admins (username, password, email) 
             VALUES (?, ?, ?)
-        ''', ('admin', 'admin123', 'admin@project.com'))
+        ''', ('admin', hash_password('admin123'), 'admin@project.com'))
     
     conn.commit()
     conn.close()
+    
+    # Apply stock decrements journaled before the last shutdown or crash
+    apply_inventory_journal()
+
+def verify_schema():
+    """Fail fast with SchemaOutOfDate if the database needs migrating"""
+    conn = get_db_connection()
+    try:
+        return check_schema(conn)
+    finally:
+        conn.close()
+
+# Optional callable(query, params, seconds, rows, error, conn) run after every
+# execute_query; `rows` is the number of rows returned or affected
+query_observer = None
+
+def set_query_observer(observer):
+    """Install (or with None, remove) the execute_query observer"""
+    global query_observer
+    query_observer = observer
+
+# Read-only connection that execute_query sends reads to instead of the pool
+# (see reading_from and snapshot.py)
+_read_connection = contextvars.ContextVar('read_connection', default=None)
+
+@contextmanager
+def reading_from(conn):
+    """Send the execute_query reads made in this block to conn (None keeps the pool)"""
+    token = _read_connection.set(conn)
+    try:
+        yield conn
+    finally:
+        _read_connection.reset(token)
 
 def execute_query(query, params=(), fetch=False):
     """Execute a query and return results if needed"""
-    conn = get_db_connection()
+    read_conn = _read_connection.get() if fetch else None
+    if read_conn is not None:
+        try:
+            return _execute(read_conn, query, params, fetch)
+        except sqlite3.OperationalError:
+            pass  # e.g. a table or column the snapshot doesn't have yet; ask the primary
+    with get_pool().connection() as conn:
+        return _execute(conn, query, params, fetch)
+
+def _execute(conn, query, params, fetch):
     cursor = conn.cursor()
+    observer = query_observer
+    started = time.perf_counter()
+    rows = None
+    error = False
     
     try:
         cursor.execute(query, params)
@@ -69,52 +272,231 @@ def execute_query(query, params=(), fetch=False):
         if fetch:
             if fetch == 'all':
                 result = cursor.fetchall()
+                rows = len(result)
             elif fetch == 'one':
                 result = cursor.fetchone()
+                rows = 0 if result is None else 1
             else:
                 result = cursor.fetchmany(fetch)
+                rows = len(result)
         else:
             result = cursor.rowcount
+            rows = max(result, 0)
             
         conn.commit()
         return result
     
     except Exception as e:
+        error = True
         conn.rollback()
         raise e
+    finally:
+        cursor.close()
+        if observer is not None:
+            observer(query, params, time.perf_counter() - started, rows, error, conn)
+
+def iter_query(query, params=(), batch_size=EXPORT_BATCH_SIZE):
+    """Run a read query and yield its rows in lists of up to batch_size
+
+    Only one batch is held in memory at a time. The generator uses its own
+    connection rather than a pooled one, so slow consumers of long exports
+    cannot starve the pool; it is closed when the generator finishes or is
+    closed early (e.g. the client disconnects).
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
     finally:
         conn.close()
 
+def is_busy_error(error):
+    """Whether an OperationalError means another connection holds the write lock"""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+def run_write_transaction(work, retries=WRITE_RETRIES, backoff=WRITE_RETRY_BACKOFF):
+    """Run work(conn) inside BEGIN IMMEDIATE, retrying on SQLITE_BUSY
+
+    The write lock is taken up front so the transaction can't fail half way
+    through on a lock upgrade. `work` should be short; it is re-run from the
+    start on each retry, with exponential backoff plus jitter between tries.
+    """
+    attempt = 0
+    while True:
+        with get_pool().connection() as conn:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                result = work(conn)
+                conn.commit()
+                return result
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                if not is_busy_error(e) or attempt >= retries:
+                    raise
+            except BaseException:
+                conn.rollback()
+                raise
+        delay = backoff * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay))
+        attempt += 1
+
 def create_user(name, email):
     """Create a new user"""
     query = "INSERT INTO users (name, email) VALUES (?, ?)"
     return execute_query(query, (name, email))
 
+# Columns safe to return to clients (never the password hash)
+USER_COLUMNS = "id, name, email, created_at"
+
 def get_all_users():
     """Get all users"""
-    query = "SELECT * FROM users ORDER BY created_at DESC"
+    query = f"SELECT {USER_COLUMNS} FROM users ORDER BY created_at DESC"
     return execute_query(query, fetch='all')
 
+def iter_all_users(batch_size=EXPORT_BATCH_SIZE):
+    """Stream all users in batches"""
+    query = f"SELECT {USER_COLUMNS} FROM users ORDER BY created_at DESC, id DESC"
+    return iter_query(query, batch_size=batch_size)
+
 def get_user_by_id(user_id):
     """Get user by ID"""
-    query = "SELECT * FROM users WHERE id = ?"
+    query = f"SELECT {USER_COLUMNS} FROM users WHERE id = ?"
     return execute_query(query, (user_id,), fetch='one')
 
+def get_users_by_ids(user_ids):
+    """Get several users by ID in one query (unknown IDs are left out, order is not kept)"""
+    query = f"SELECT {USER_COLUMNS} FROM users WHERE id IN (SELECT value FROM json_each(?))"
+    return execute_query(query, (json.dumps(list(user_ids)),), fetch='all')
+
+def get_user_by_email(email):
+    """Get user by email"""
+    query = f"SELECT {USER_COLUMNS} FROM users WHERE email = ?"
+    return execute_query(query, (email,), fetch='one')
+
 def update_user(user_id, name, email):
     """Update user"""
     query = "UPDATE users SET name = ?, email = ? WHERE id = ?"
     return execute_query(query, (name, email, user_id))
 
 def delete_user(user_id):
-    """Delete user"""
-    query = "DELETE FROM users WHERE id = ?"
-    return execute_query(query, (user_id,))
+    """Delete user and their sessions"""
+    def work(conn):
+        conn.execute("DELETE FROM auth_sessions WHERE user_id = ?", (user_id,))
+        return conn.execute("DELETE FROM users WHERE id = ?", (user_id,)).rowcount
+    
+    return run_write_transaction(work)
+
+def register_user(name, email, password):
+    """Create a user account that can log in; returns the new user's ID"""
+    def work(conn):
+        return conn.execute("INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)",
+                            (name, email, hash_password(password))).lastrowid
+    
+    return run_write_transaction(work)
+
+def authenticate_user(email, password):
+    """Authenticate a user by email; returns the user or None"""
+    user = execute_query("SELECT * FROM users WHERE email = ?", (email,), fetch='one')
+    if user is None or user['password_hash'] is None:
+        verify_password(dummy_hash(), password)
+        return None
+    if not verify_password(user['password_hash'], password):
+        return None
+    if needs_rehash(user['password_hash']):
+        execute_query("UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                      (hash_password(password), user['id'], user['password_hash']))
+    return get_user_by_id(user['id'])
+
+def update_user_password(user_id, new_password):
+    """Set a user's password"""
+    query = "UPDATE users SET password_hash = ? WHERE id = ?"
+    return execute_query(query, (hash_password(new_password), user_id))
+
+# Session functions
+def create_session(token_hash, user_id, expires_at):
+    """Store a new bearer-token session"""
+    query = "INSERT INTO auth_sessions (token_hash, user_id, created_at, expires_at) VALUES (?, ?, ?, ?)"
+    return execute_query(query, (token_hash, user_id, time.time(), expires_at))
+
+def get_session(token_hash):
+    """Get a session's user_id and expires_at"""
+    query = "SELECT user_id, expires_at FROM auth_sessions WHERE token_hash = ?"
+    return execute_query(query, (token_hash,), fetch='one')
+
+def delete_session(token_hash):
+    """Delete one session"""
+    query = "DELETE FROM auth_sessions WHERE token_hash = ?"
+    return execute_query(query, (token_hash,))
+
+def delete_user_sessions(user_id, keep_token_hash=None):
+    """Delete every session of a user, optionally keeping one; returns the number deleted"""
+    query = "DELETE FROM auth_sessions WHERE user_id = ? AND token_hash IS NOT ?"
+    return execute_query(query, (user_id, keep_token_hash))
+
+def delete_expired_sessions(now, batch_size):
+    """Delete up to batch_size expired sessions; returns the number deleted"""
+    query = """
+        DELETE FROM auth_sessions WHERE token_hash IN (
+            SELECT token_hash FROM auth_sessions WHERE expires_at <= ? LIMIT ?
+        )
+    """
+    return execute_query(query, (now, batch_size))
+
+# Password reset functions
+def create_password_reset(token_hash, user_id, expires_at):
+    """Store a password reset token (by hash)"""
+    query = "INSERT INTO password_resets (token_hash, user_id, expires_at) VALUES (?, ?, ?)"
+    return execute_query(query, (token_hash, user_id, expires_at))
+
+def reset_user_password(token_hash, new_password, now):
+    """Set a new password with an unexpired reset token; returns the user ID or None
+
+    The token, and any other reset tokens of the same user, are used up.
+    """
+    password_hash = hash_password(new_password)
+    
+    def work(conn):
+        row = conn.execute("SELECT user_id FROM password_resets WHERE token_hash = ? AND expires_at > ?",
+                           (token_hash, now)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, row['user_id']))
+        conn.execute("DELETE FROM password_resets WHERE user_id = ? OR expires_at <= ?", (row['user_id'], now))
+        return row['user_id']
+    
+    return run_write_transaction(work)
 
 # Admin functions
 def authenticate_admin(username, password):
-    """Authenticate admin login"""
-    query = "SELECT * FROM admins WHERE username = ? AND password = ?"
-    return execute_query(query, (username, password), fetch='one')
+    """Authenticate admin login
+
+    Plaintext passwords from before hashing was introduced (or hashes with
+    outdated cost parameters) are rehashed on the first successful login.
+    """
+    admin = execute_query("SELECT * FROM admins WHERE username = ?", (username,), fetch='one')
+    if admin is None:
+        verify_password(dummy_hash(), password)
+        return None
+    if not verify_password(admin['password'], password):
+        return None
+    if needs_rehash(admin['password']):
+        # Only replace the exact value we verified, in case it changed meanwhile
+        execute_query("UPDATE admins SET password = ? WHERE id = ? AND password = ?",
+                      (hash_password(password), admin['id'], admin['password']))
+        admin = get_admin_by_id(admin['id'])
+    return admin
+
+def get_admin_by_id(admin_id):
+    """Get admin by ID"""
+    query = "SELECT * FROM admins WHERE id = ?"
+    return execute_query(query, (admin_id,), fetch='one')
 
 def get_all_admins():
     """Get all admins"""
@@ -124,35 +506,790 @@ def get_all_admins():
 def create_admin(username, password, email):
     """Create a new admin"""
     query = "INSERT INTO admins (username, password, email) VALUES (?, ?, ?)"
-    return execute_query(query, (username, password, email))
+    return execute_query(query, (username, hash_password(password), email))
 
 def update_admin_password(admin_id, new_password):
     """Update admin password"""
     query = "UPDATE admins SET password = ? WHERE id = ?"
-    return execute_query(query, (new_password, admin_id))
+    return execute_query(query, (hash_password(new_password), admin_id))
 
 # Product functions
-def create_product(name, price, description):
+PRODUCT_COLUMNS = ('id', 'name', 'price', 'description', 'stock', 'category_id', 'image', 'created_at')
+PRODUCT_SORT_KEYS = ('created_at', 'price', 'name')
+
+def create_product(name, price, description, category_id=None, image=None):
     """Create a new product"""
-    query = "INSERT INTO products (name, price, description) VALUES (?, ?, ?)"
-    return execute_query(query, (name, price, description))
+    query = "INSERT INTO products (name, price, description, category_id, image) VALUES (?, ?, ?, ?, ?)"
+    return execute_query(query, (name, price, description, category_id, image))
+
+def _write_product_rows(conn, rows):
+    """Write (id, name, price, description) rows; rows with an id are upserted"""
+    new_rows = [row[1:] for row in rows if row[0] is None]
+    existing_rows = [row for row in rows if row[0] is not None]
+    if new_rows:
+        conn.executemany("INSERT INTO products (name, price, description) VALUES (?, ?, ?)", new_rows)
+    if existing_rows:
+        conn.executemany("""
+            INSERT INTO products (id, name, price, description) VALUES (?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                name = excluded.name,
+                price = excluded.price,
+                description = excluded.description
+        """, existing_rows)
+
+def upsert_products_batch(rows):
+    """Insert/upsert a batch of (id, name, price, description) rows in one transaction
+
+    If the batch fails as a whole, the rows are retried one by one in a single
+    transaction so only the bad rows are skipped. Returns a list of
+    (index, error message) for the rows that failed.
+    """
+    with get_pool().connection() as conn:
+        try:
+            _write_product_rows(conn, rows)
+            conn.commit()
+            return []
+        except sqlite3.DatabaseError:
+            conn.rollback()
+        
+        failures = []
+        for index, row in enumerate(rows):
+            try:
+                _write_product_rows(conn, [row])
+            except sqlite3.DatabaseError as e:
+                failures.append((index, str(e)))
+        conn.commit()
+        return failures
 
 def get_all_products():
     """Get all products"""
     query = "SELECT * FROM products ORDER BY created_at DESC"
     return execute_query(query, fetch='all')
 
+def build_products_query(sort='created_at', descending=True, after=None,
+                         min_price=None, max_price=None, columns=None, category_id=None):
+    """Build the filtered, keyset-ordered products SELECT (without LIMIT)"""
+    if sort not in PRODUCT_SORT_KEYS:
+        raise ValueError(f"Invalid sort key: {sort}")
+    
+    selected = [c for c in (columns or PRODUCT_COLUMNS) if c in PRODUCT_COLUMNS]
+    # The cursor is built from the sort column and id, so always select them
+    for required in ('id', sort):
+        if required not in selected:
+            selected.append(required)
+    
+    conditions = []
+    params = []
+    if category_id is not None:
+        conditions.append("category_id = ?")
+        params.append(category_id)
+    if min_price is not None:
+        conditions.append("price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("price <= ?")
+        params.append(max_price)
+    if after is not None:
+        conditions.append(f"({sort}, id) {'<' if descending else '>'} (?, ?)")
+        params.extend(after)
+    
+    direction = 'DESC' if descending else 'ASC'
+    query = f"SELECT {', '.join(selected)} FROM products"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {sort} {direction}, id {direction}"
+    return query, params
+
+def get_products_page(limit, sort='created_at', descending=True, after=None,
+                      min_price=None, max_price=None, columns=None, category_id=None):
+    """Get one keyset-paginated page of products
+
+    `after` is the (sort value, id) pair of the last row on the previous page.
+    Fetches limit + 1 rows so the caller can tell whether another page exists.
+    """
+    query, params = build_products_query(sort, descending, after, min_price, max_price, columns, category_id)
+    query += " LIMIT ?"
+    params.append(limit + 1)
+    return execute_query(query, tuple(params), fetch='all')
+
+def iter_products(batch_size=EXPORT_BATCH_SIZE, **filters):
+    """Stream products in batches (accepts the build_products_query filters)"""
+    query, params = build_products_query(**filters)
+    return iter_query(query, tuple(params), batch_size)
+
+def build_fts_query(text, prefix=True):
+    """Turn free-form user input into a safe FTS5 MATCH expression
+
+    Every term is quoted so FTS5 operators in the input are treated as text.
+    With prefix=True the last term also matches as a prefix (typeahead) once it
+    is at least two characters long, which is what the prefix indexes cover.
+    """
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    if prefix and len(terms[-1]) >= 2:
+        quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def search_products(text, limit, offset=0, prefix=True, min_price=None, max_price=None):
+    """Full-text search over products ranked by BM25
+
+    Returns up to limit + 1 rows so the caller can tell whether another page exists.
+    """
+    match = build_fts_query(text, prefix)
+    if match is None:
+        return []
+    
+    query = """
+        SELECT p.id, p.name, p.price, p.description, p.created_at,
+               products_fts.rank AS rank,
+               highlight(products_fts, 0, '<mark>', '</mark>') AS name_highlight,
+               snippet(products_fts, 1, '<mark>', '</mark>', '...', 16) AS snippet
+        FROM products_fts
+        JOIN products p ON p.id = products_fts.rowid
+        WHERE products_fts MATCH ?
+    """
+    params = [match]
+    if min_price is not None:
+        query += " AND p.price >= ?"
+        params.append(min_price)
+    if max_price is not None:
+        query += " AND p.price <= ?"
+        params.append(max_price)
+    query += " ORDER BY rank LIMIT ? OFFSET ?"
+    params.extend([limit + 1, offset])
+    return execute_query(query, tuple(params), fetch='all')
+
 def get_product_by_id(product_id):
     """Get product by ID"""
     query = "SELECT * FROM products WHERE id = ?"
     return execute_query(query, (product_id,), fetch='one')
 
-def update_product(product_id, name, price, description):
-    """Update product"""
-    query = "UPDATE products SET name = ?, price = ?, description = ? WHERE id = ?"
-    return execute_query(query, (name, price, description, product_id))
+def get_products_by_ids(product_ids):
+    """Get several products by ID in one query (unknown IDs are left out, order is not kept)
+
+    The IDs are bound as one JSON array, so every batch size shares a
+    single prepared statement; rows have the same columns as get_product_by_id.
+    """
+    query = "SELECT * FROM products WHERE id IN (SELECT value FROM json_each(?))"
+    return execute_query(query, (json.dumps(list(product_ids)),), fetch='all')
+
+# Default for the optional update_product columns that should be left as they are
+UNCHANGED = object()
+
+def update_product(product_id, name, price, description, category_id=UNCHANGED, image=UNCHANGED):
+    """Update product in one transaction
+
+    category_id and image are only written when passed (None clears them).
+    Returns the number of products updated.
+    """
+    columns = {'name': name, 'price': price, 'description': description}
+    if category_id is not UNCHANGED:
+        columns['category_id'] = category_id
+    if image is not UNCHANGED:
+        columns['image'] = image
+    assignments = ', '.join(f'{column} = ?' for column in columns)
+    
+    def work(conn):
+        return conn.execute(f"UPDATE products SET {assignments} WHERE id = ?",
+                            (*columns.values(), product_id)).rowcount
+    
+    return run_write_transaction(work)
 
 def delete_product(product_id):
     """Delete product"""
     query = "DELETE FROM products WHERE id = ?"
     return execute_query(query, (product_id,))
+
+# Cart functions
+def create_cart():
+    """Create an empty cart and return its id"""
+    with get_pool().connection() as conn:
+        cursor = conn.execute("INSERT INTO carts DEFAULT VALUES")
+        conn.commit()
+        return cursor.lastrowid
+
+def get_cart_quantities(cart_id):
+    """Get {product_id: quantity} for a cart"""
+    query = "SELECT product_id, quantity FROM cart_items WHERE cart_id = ?"
+    return {row['product_id']: row['quantity'] for row in execute_query(query, (cart_id,), fetch='all')}
+
+def get_cart_items(cart_id):
+    """Get cart lines joined with current product name and price"""
+    query = """
+        SELECT ci.product_id, ci.quantity, p.name, p.price, p.stock,
+               ROUND(p.price * ci.quantity, 2) AS subtotal
+        FROM cart_items ci
+        JOIN products p ON p.id = ci.product_id
+        WHERE ci.cart_id = ?
+        ORDER BY ci.added_at, ci.product_id
+    """
+    return execute_query(query, (cart_id,), fetch='all')
+
+def add_cart_item(cart_id, product_id, quantity):
+    """Add a product to a cart, increasing the quantity if it is already there"""
+    query = """
+        INSERT INTO cart_items (cart_id, product_id, quantity) VALUES (?, ?, ?)
+        ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = quantity + excluded.quantity
+    """
+    return execute_query(query, (cart_id, product_id, quantity))
+
+def set_cart_item_quantity(cart_id, product_id, quantity):
+    """Set the quantity of a product already in the cart"""
+    query = "UPDATE cart_items SET quantity = ? WHERE cart_id = ? AND product_id = ?"
+    return execute_query(query, (quantity, cart_id, product_id))
+
+def remove_cart_item(cart_id, product_id):
+    """Remove a product from a cart"""
+    query = "DELETE FROM cart_items WHERE cart_id = ? AND product_id = ?"
+    return execute_query(query, (cart_id, product_id))
+
+def clear_cart(cart_id):
+    """Remove every product from a cart"""
+    query = "DELETE FROM cart_items WHERE cart_id = ?"
+    return execute_query(query, (cart_id,))
+
+# Order functions
+def checkout_cart(cart_id, email=None, expected_items=None):
+    """Turn a cart into an order in one short write transaction
+
+    Prices are re-read from products and tracked stock is checked against
+    what is still available after unflushed inventory journal entries. The
+    stock decrements are appended to inventory_journal rather than applied
+    to the product rows (see apply_inventory_journal), and the cart is
+    emptied. Raises ValueError if the cart is empty or differs from
+    `expected_items` ({product_id: quantity}), a product is gone or stock
+    is insufficient; nothing is written in that case.
+    Returns (order id, total, list of ordered product ids).
+    """
+    def work(conn):
+        items = conn.execute("""
+            SELECT ci.product_id, ci.quantity, p.name, p.price,
+                   p.stock - COALESCE((SELECT SUM(j.quantity) FROM inventory_journal j
+                                       WHERE j.product_id = p.id), 0) AS available
+            FROM cart_items ci
+            LEFT JOIN products p ON p.id = ci.product_id
+            WHERE ci.cart_id = ?
+        """, (cart_id,)).fetchall()
+        if not items:
+            raise ValueError("Cart is empty")
+        if expected_items is not None and \
+                {item['product_id']: item['quantity'] for item in items} != expected_items:
+            raise ValueError("Cart changed during checkout, please try again")
+        
+        for item in items:
+            if item['name'] is None:
+                raise ValueError(f"Product {item['product_id']} is no longer available")
+            if item['available'] is not None and item['available'] < item['quantity']:
+                raise ValueError(f"Insufficient stock for {item['name']}")
+        
+        total = round(sum(item['price'] * item['quantity'] for item in items), 2)
+        cursor = conn.execute(
+            "INSERT INTO orders (cart_id, email, total) VALUES (?, ?, ?)",
+            (cart_id, email, total)
+        )
+        order_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO order_items (order_id, product_id, name, unit_price, quantity) VALUES (?, ?, ?, ?, ?)",
+            [(order_id, item['product_id'], item['name'], item['price'], item['quantity']) for item in items]
+        )
+        conn.executemany(
+            "INSERT INTO inventory_journal (product_id, quantity, order_id) VALUES (?, ?, ?)",
+            [(item['product_id'], item['quantity'], order_id) for item in items if item['available'] is not None]
+        )
+        conn.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
+        return order_id, total, [item['product_id'] for item in items]
+    
+    return run_write_transaction(work)
+
+def get_orders_by_cart(cart_id):
+    """Get orders placed from a cart, newest first"""
+    query = "SELECT * FROM orders WHERE cart_id = ? ORDER BY created_at DESC, id DESC"
+    return execute_query(query, (cart_id,), fetch='all')
+
+def get_order_by_id(order_id):
+    """Get order by ID"""
+    query = "SELECT * FROM orders WHERE id = ?"
+    return execute_query(query, (order_id,), fetch='one')
+
+def get_order_items(order_id):
+    """Get the lines of an order"""
+    query = "SELECT product_id, name, unit_price, quantity FROM order_items WHERE order_id = ? ORDER BY id"
+    return execute_query(query, (order_id,), fetch='all')
+
+# Inventory functions
+# products.stock holds the last flushed stock level; the stock actually
+# available is products.stock minus the product's inventory_journal rows.
+AVAILABLE_STOCK_SQL = """
+    p.stock - COALESCE((SELECT SUM(j.quantity) FROM inventory_journal j
+                        WHERE j.product_id = p.id), 0)
+"""
+
+def get_available_stock(product_ids):
+    """Get {product_id: available stock} (None for untracked products)"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    placeholders = ', '.join('?' * len(product_ids))
+    query = f"SELECT p.id, {AVAILABLE_STOCK_SQL} AS available FROM products p WHERE p.id IN ({placeholders})"
+    return {row['id']: row['available'] for row in execute_query(query, tuple(product_ids), fetch='all')}
+
+def get_inventory_page(limit, after_id=0):
+    """Get stock levels for products with id > after_id, in id order"""
+    query = f"""
+        SELECT p.id, p.name, p.stock,
+               COALESCE((SELECT SUM(j.quantity) FROM inventory_journal j
+                         WHERE j.product_id = p.id), 0) AS pending,
+               {AVAILABLE_STOCK_SQL} AS available
+        FROM products p
+        WHERE p.id > ?
+        ORDER BY p.id
+        LIMIT ?
+    """
+    return execute_query(query, (after_id, limit + 1), fetch='all')
+
+def apply_inventory_journal():
+    """Apply all journaled stock decrements to products.stock in one transaction
+
+    Returns {product_id: quantity applied}. Safe to run from several
+    processes at once: the journal is read and cleared under the write lock.
+    """
+    if not execute_query("SELECT EXISTS (SELECT 1 FROM inventory_journal)", fetch='one')[0]:
+        return {}
+    
+    def work(conn):
+        totals = conn.execute(
+            "SELECT product_id, SUM(quantity) AS quantity FROM inventory_journal GROUP BY product_id"
+        ).fetchall()
+        conn.executemany(
+            "UPDATE products SET stock = stock - ? WHERE id = ? AND stock IS NOT NULL",
+            [(row['quantity'], row['product_id']) for row in totals]
+        )
+        conn.execute("DELETE FROM inventory_journal")
+        return {row['product_id']: row['quantity'] for row in totals}
+    
+    return run_write_transaction(work)
+
+def set_product_stock(product_id, stock):
+    """Set a product's available stock (None stops tracking it)
+
+    Pending journal entries for the product are dropped because the new
+    level already accounts for them. Returns the number of products updated.
+    """
+    def work(conn):
+        conn.execute("DELETE FROM inventory_journal WHERE product_id = ?", (product_id,))
+        return conn.execute("UPDATE products SET stock = ? WHERE id = ?", (stock, product_id)).rowcount
+    
+    return run_write_transaction(work)
+
+# Category functions
+CATEGORY_QUERY = """
+    SELECT c.id, c.name, c.description, c.created_at,
+           (SELECT COUNT(*) FROM products p WHERE p.category_id = c.id) AS product_count
+    FROM categories c
+"""
+
+def get_all_categories():
+    """Get all categories with their product counts"""
+    return execute_query(CATEGORY_QUERY + " ORDER BY c.name", fetch='all')
+
+def get_category_by_id(category_id):
+    """Get category by ID"""
+    return execute_query(CATEGORY_QUERY + " WHERE c.id = ?", (category_id,), fetch='one')
+
+def create_category(name, description):
+    """Create a category; returns its ID"""
+    def work(conn):
+        return conn.execute("INSERT INTO categories (name, description) VALUES (?, ?)",
+                            (name, description)).lastrowid
+    
+    return run_write_transaction(work)
+
+def update_category(category_id, name, description):
+    """Update category"""
+    query = "UPDATE categories SET name = ?, description = ? WHERE id = ?"
+    return execute_query(query, (name, description, category_id))
+
+def delete_category(category_id):
+    """Delete a category, leaving its products uncategorized"""
+    def work(conn):
+        conn.execute("UPDATE products SET category_id = NULL WHERE category_id = ?", (category_id,))
+        return conn.execute("DELETE FROM categories WHERE id = ?", (category_id,)).rowcount
+    
+    return run_write_transaction(work)
+
+# Featured and recommendation functions
+# Listing columns returned with precomputed lists
+LIST_PRODUCT_COLUMNS = "p.id, p.name, p.price, p.description, p.stock, p.category_id, p.image, p.created_at"
+IN_STOCK_SQL = "(p.stock IS NULL OR p.stock > 0)"
+
+def get_featured_products(limit):
+    """Read the precomputed featured list"""
+    query = f"""
+        SELECT {LIST_PRODUCT_COLUMNS}
+        FROM featured_products f JOIN products p ON p.id = f.product_id
+        ORDER BY f.rank LIMIT ?
+    """
+    return execute_query(query, (limit,), fetch='all')
+
+def get_product_recommendations(product_id, limit):
+    """Read the precomputed recommendations for a product"""
+    query = f"""
+        SELECT {LIST_PRODUCT_COLUMNS}
+        FROM product_recommendations r JOIN products p ON p.id = r.recommended_id
+        WHERE r.product_id = ?
+        ORDER BY r.rank LIMIT ?
+    """
+    return execute_query(query, (product_id, limit), fetch='all')
+
+def claim_recommendation_queue(batch_size):
+    """Take up to batch_size queued product IDs (atomically, so workers don't share them)"""
+    query = """
+        DELETE FROM recommendation_queue WHERE product_id IN (
+            SELECT product_id FROM recommendation_queue LIMIT ?
+        ) RETURNING product_id
+    """
+    return [row[0] for row in execute_query(query, (batch_size,), fetch='all')]
+
+def requeue_recommendations(product_ids):
+    """Put product IDs back on the recommendation queue"""
+    with get_pool().connection() as conn:
+        conn.executemany("INSERT OR IGNORE INTO recommendation_queue (product_id) VALUES (?)",
+                         [(pid,) for pid in product_ids])
+        conn.commit()
+
+def get_recommending_products(product_ids):
+    """IDs of products whose current recommendations include any of product_ids"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    placeholders = ', '.join('?' * len(product_ids))
+    query = f"SELECT DISTINCT product_id FROM product_recommendations WHERE recommended_id IN ({placeholders})"
+    return [row[0] for row in execute_query(query, tuple(product_ids), fetch='all')]
+
+def compute_recommendations(conn, product_id, limit, price_band, co_purchase_orders):
+    """Rank recommendations for one product: co-purchases first, then same-category price neighbours
+
+    Returns [(recommended_id, score)], or None if the product no longer exists.
+    """
+    product = conn.execute("SELECT id, price, category_id FROM products WHERE id = ?", (product_id,)).fetchone()
+    if product is None:
+        return None
+    
+    scores = {}
+    # Products bought in the same orders, over the product's most recent orders
+    co_purchased = conn.execute(f"""
+        SELECT other.product_id, COUNT(DISTINCT other.order_id) AS together
+        FROM (SELECT order_id FROM order_items WHERE product_id = ?
+              ORDER BY order_id DESC LIMIT ?) recent
+        JOIN order_items other ON other.order_id = recent.order_id
+        JOIN products p ON p.id = other.product_id
+        WHERE other.product_id != ? AND {IN_STOCK_SQL}
+        GROUP BY other.product_id
+        ORDER BY together DESC
+        LIMIT ?
+    """, (product_id, co_purchase_orders, product_id, limit)).fetchall()
+    for row in co_purchased:
+        scores[row['product_id']] = 1000.0 + row['together']
+    
+    # Nearest prices in the same category, within +/- price_band of this price
+    price = product['price']
+    low, high = price * (1 - price_band), price * (1 + price_band)
+    neighbours = []
+    for condition, bounds, direction in (("p.price >= ? AND p.price <= ?", (price, high), 'ASC'),
+                                         ("p.price < ? AND p.price >= ?", (price, low), 'DESC')):
+        neighbours += conn.execute(f"""
+            SELECT p.id, p.price FROM products p
+            WHERE p.category_id IS ? AND {condition} AND p.id != ? AND {IN_STOCK_SQL}
+            ORDER BY p.price {direction} LIMIT ?
+        """, (product['category_id'], *bounds, product_id, limit)).fetchall()
+    for row in neighbours:
+        if row['id'] not in scores:
+            scores[row['id']] = 1.0 / (1.0 + abs(row['price'] - price) / max(price, 1.0))
+    
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+def refresh_recommendations(product_ids, limit, price_band, co_purchase_orders):
+    """Recompute and store recommendations for product_ids in one write transaction
+
+    Returns {product_id: [recommended ids]} (empty list for deleted products).
+    """
+    product_ids = list(product_ids)
+    with get_pool().connection() as conn:
+        computed = {pid: compute_recommendations(conn, pid, limit, price_band, co_purchase_orders)
+                    for pid in product_ids}
+    
+    def work(conn):
+        conn.executemany("DELETE FROM product_recommendations WHERE product_id = ?",
+                         [(pid,) for pid in product_ids])
+        conn.executemany("DELETE FROM product_recommendations WHERE recommended_id = ?",
+                         [(pid,) for pid, ranked in computed.items() if ranked is None])
+        conn.executemany(
+            "INSERT INTO product_recommendations (product_id, rank, recommended_id, score) VALUES (?, ?, ?, ?)",
+            [(pid, rank, rec_id, score)
+             for pid, ranked in computed.items() if ranked
+             for rank, (rec_id, score) in enumerate(ranked, start=1)]
+        )
+    
+    run_write_transaction(work)
+    return {pid: [rec_id for rec_id, _ in ranked or []] for pid, ranked in computed.items()}
+
+def refresh_featured_products(limit, window_days):
+    """Rebuild the featured list: best sellers over the window, then the newest products"""
+    def work(conn):
+        best_sellers = conn.execute(f"""
+            SELECT oi.product_id, SUM(oi.quantity) AS sold
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            JOIN products p ON p.id = oi.product_id
+            WHERE o.created_at >= datetime('now', ?) AND {IN_STOCK_SQL}
+            GROUP BY oi.product_id
+            ORDER BY sold DESC, oi.product_id DESC
+            LIMIT ?
+        """, (f'-{int(window_days)} days', limit)).fetchall()
+        featured = [(row['product_id'], float(row['sold'])) for row in best_sellers]
+        if len(featured) < limit:
+            chosen = {pid for pid, _ in featured}
+            newest = conn.execute(f"""
+                SELECT p.id FROM products p WHERE {IN_STOCK_SQL}
+                ORDER BY p.created_at DESC, p.id DESC LIMIT ?
+            """, (limit,)).fetchall()
+            featured += [(row['id'], 0.0) for row in newest if row['id'] not in chosen][:limit - len(featured)]
+        
+        conn.execute("DELETE FROM featured_products")
+        conn.executemany("INSERT INTO featured_products (rank, product_id, score) VALUES (?, ?, ?)",
+                         [(rank, pid, score) for rank, (pid, score) in enumerate(featured, start=1)])
+        return [pid for pid, _ in featured]
+    
+    return run_write_transaction(work)
+
+# Analytics rollup functions
+# Rollup tables and the bucket (UTC) each one groups a timestamp into; the
+# triggers from migration 8 use the same expressions
+ANALYTICS_TABLES = {
+    'hour': ('analytics_hourly', "strftime('%Y-%m-%d %H:00:00', {})"),
+    'day': ('analytics_daily', "date({})"),
+}
+# Source table -> [(metric, aggregate)] it contributes to the rollups
+ANALYTICS_SOURCES = {
+    'users': [('new_users', 'COUNT(*)')],
+    'orders': [('orders', 'COUNT(*)'), ('revenue', 'SUM(total)')],
+}
+
+def get_analytics_rollups(granularity, metrics, start, end):
+    """Rollup rows (metric, bucket, value) with start <= bucket <= end"""
+    table = ANALYTICS_TABLES[granularity][0]
+    placeholders = ', '.join('?' * len(metrics))
+    query = f"""
+        SELECT metric, bucket, value FROM {table}
+        WHERE metric IN ({placeholders}) AND bucket >= ? AND bucket <= ?
+    """
+    return execute_query(query, (*metrics, start, end), fetch='all')
+
+def get_analytics_backfill():
+    """Backfill progress per source table: {source: (last_id, max_id)}"""
+    rows = execute_query("SELECT source, last_id, max_id FROM analytics_backfill", fetch='all')
+    return {row['source']: (row['last_id'], row['max_id']) for row in rows}
+
+def backfill_analytics_batch(source, batch_size):
+    """Roll up the next batch_size ids of rows that predate the triggers
+
+    The batch and the progress marker are written in one transaction, so an
+    interrupted backfill resumes where it stopped and never counts a row
+    twice. Returns the number of ids covered (0 once the source is done).
+    """
+    def work(conn):
+        state = conn.execute("SELECT last_id, max_id FROM analytics_backfill WHERE source = ?",
+                             (source,)).fetchone()
+        if state is None or state['last_id'] >= state['max_id']:
+            return 0
+        low, high = state['last_id'], min(state['last_id'] + batch_size, state['max_id'])
+        for table, bucket in ANALYTICS_TABLES.values():
+            bucket = bucket.format('created_at')
+            for metric, aggregate in ANALYTICS_SOURCES[source]:
+                conn.execute(f"""
+                    INSERT INTO {table} (metric, bucket, value)
+                    SELECT ?, {bucket}, {aggregate} FROM {source}
+                    WHERE id > ? AND id <= ? AND {bucket} IS NOT NULL
+                    GROUP BY {bucket}
+                    ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value
+                """, (metric, low, high))
+        conn.execute("UPDATE analytics_backfill SET last_id = ? WHERE source = ?", (high, source))
+        return high - low
+    
+    return run_write_transaction(work)
+
+def reset_analytics():
+    """Empty the rollups and schedule every existing row for backfill"""
+    def work(conn):
+        for table, _ in ANALYTICS_TABLES.values():
+            conn.execute(f"DELETE FROM {table}")
+        for source in ANALYTICS_SOURCES:
+            conn.execute(f"""
+                INSERT OR REPLACE INTO analytics_backfill (source, last_id, max_id)
+                SELECT ?, 0, COALESCE(MAX(id), 0) FROM {source}
+            """, (source,))
+    
+    run_write_transaction(work)
+
+def prune_analytics(granularity, before):
+    """Delete rollup rows with bucket < before; returns the number deleted"""
+    table = ANALYTICS_TABLES[granularity][0]
+    return execute_query(f"DELETE FROM {table} WHERE bucket < ?", (before,))
+
+# Image functions
+def record_image(image_hash, mimetype, size, width=None, height=None):
+    """Insert an image row; returns False if the image was already stored"""
+    query = """
+        INSERT OR IGNORE INTO images (hash, mimetype, size, width, height)
+        VALUES (?, ?, ?, ?, ?)
+    """
+    return execute_query(query, (image_hash, mimetype, size, width, height)) > 0
+
+def get_image(image_hash):
+    """Get image by hash"""
+    return execute_query("SELECT * FROM images WHERE hash = ?", (image_hash,), fetch='one')
+
+def get_pending_images(limit):
+    """Hashes of images whose variants have not been generated yet"""
+    query = "SELECT hash FROM images WHERE status = 'pending' ORDER BY created_at LIMIT ?"
+    return [row[0] for row in execute_query(query, (limit,), fetch='all')]
+
+def set_image_variants(image_hash, status, variants):
+    """Record the outcome of variant generation"""
+    query = "UPDATE images SET status = ?, variants = ? WHERE hash = ?"
+    return execute_query(query, (status, variants, image_hash))
+
+def delete_image(image_hash):
+    """Delete an image row unless a product uses it
+
+    Returns 1 if deleted, 0 if there was no such image, and raises
+    ValueError if the image is in use.
+    """
+    def work(conn):
+        if conn.execute("SELECT 1 FROM products WHERE image = ? LIMIT 1", (image_hash,)).fetchone():
+            raise ValueError("Image is used by a product")
+        return conn.execute("DELETE FROM images WHERE hash = ?", (image_hash,)).rowcount
+    
+    return run_write_transaction(work)
+
+def optimize_search_index():
+    """Merge the product search index's segments into one"""
+    return execute_query("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+
+# Job queue functions
+JOB_COLUMNS = "id, kind, payload, priority, status, attempts, max_attempts, run_at, created_at, started_at, finished_at, last_error"
+
+def enqueue_job(kind, payload, priority, run_at, max_attempts, dedupe_key=None):
+    """Add a job; returns its ID, or None if a queued job with the same dedupe_key exists"""
+    def work(conn):
+        cursor = conn.execute("""
+            INSERT OR IGNORE INTO jobs (kind, payload, priority, max_attempts, dedupe_key, run_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (kind, payload, priority, max_attempts, dedupe_key, run_at, time.time()))
+        return cursor.lastrowid if cursor.rowcount else None
+    
+    return run_write_transaction(work)
+
+def claim_jobs(now, lock_until, limit):
+    """Atomically mark up to limit ready jobs as running and return them, most urgent first"""
+    query = f"""
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, locked_until = ?
+        WHERE id IN (
+            SELECT id FROM jobs WHERE status = 'queued' AND run_at <= ?
+            ORDER BY priority, run_at LIMIT ?
+        )
+        RETURNING {JOB_COLUMNS}
+    """
+    rows = execute_query(query, (now, lock_until, now, limit), fetch='all')
+    return sorted(rows, key=lambda row: (row['priority'], row['run_at']))
+
+def complete_job(job_id, attempts, now):
+    """Mark a running job as done
+
+    Only the worker that made claim number `attempts` still owns the job; if
+    it was requeued (and perhaps claimed again) meanwhile, nothing is updated.
+    Returns the number of jobs updated, 0 when ownership was lost.
+    """
+    query = """
+        UPDATE jobs SET status = 'done', finished_at = ?, locked_until = NULL
+        WHERE id = ? AND status = 'running' AND attempts = ?
+    """
+    return execute_query(query, (now, job_id, attempts))
+
+def fail_job(job_id, attempts, now, error, retry_at=None):
+    """Put a failed job back in the queue to run at retry_at, or with None move it to the dead letters
+
+    Like complete_job this only touches a job still owned by claim number
+    `attempts`; returns the number of jobs updated, 0 when ownership was lost.
+    """
+    owned = "WHERE id = ? AND status = 'running' AND attempts = ?"
+    
+    def work(conn):
+        if retry_at is None:
+            return conn.execute(f"""
+                UPDATE jobs SET status = 'dead', finished_at = ?, locked_until = NULL, last_error = ?
+                {owned}
+            """, (now, error, job_id, attempts)).rowcount
+        try:
+            return conn.execute(f"""
+                UPDATE jobs SET status = 'queued', run_at = ?, locked_until = NULL, last_error = ?
+                {owned}
+            """, (retry_at, error, job_id, attempts)).rowcount
+        except sqlite3.IntegrityError:
+            # A newer job with the same dedupe key is already queued and will do the work
+            return conn.execute(f"""
+                UPDATE jobs SET status = 'done', finished_at = ?, locked_until = NULL, last_error = ?
+                {owned}
+            """, (now, f'{error} (superseded)', job_id, attempts)).rowcount
+    
+    return run_write_transaction(work)
+
+def requeue_stale_jobs(now):
+    """Recover jobs whose worker died mid-run; returns the number recovered"""
+    def work(conn):
+        conn.execute("""
+            UPDATE jobs SET status = 'done', finished_at = ?, locked_until = NULL,
+                            last_error = 'lock expired (superseded)'
+            WHERE status = 'running' AND locked_until < ? AND dedupe_key IS NOT NULL
+              AND dedupe_key IN (SELECT dedupe_key FROM jobs WHERE status = 'queued')
+        """, (now, now))
+        return conn.execute("""
+            UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+                            run_at = ?, locked_until = NULL, last_error = 'lock expired'
+            WHERE status = 'running' AND locked_until < ?
+        """, (now, now)).rowcount
+    
+    return run_write_transaction(work)
+
+def delete_finished_jobs(before, batch_size):
+    """Delete up to batch_size jobs that finished before `before`; returns the number deleted"""
+    query = """
+        DELETE FROM jobs WHERE id IN (
+            SELECT id FROM jobs WHERE status = 'done' AND finished_at < ? LIMIT ?
+        )
+    """
+    return execute_query(query, (before, batch_size))
+
+def get_job_counts(now):
+    """Jobs per status, plus when the oldest ready job became runnable"""
+    counts = {row['status']: row['count'] for row in
+              execute_query("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status", fetch='all')}
+    oldest = execute_query("SELECT MIN(run_at) FROM jobs WHERE status = 'queued' AND run_at <= ?",
+                           (now,), fetch='one')[0]
+    return counts, oldest
+
+def get_jobs(status, limit):
+    """Most recent jobs with a status"""
+    query = f"SELECT {JOB_COLUMNS} FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?"
+    return execute_query(query, (status, limit), fetch='all')
+
+def retry_dead_job(job_id, now):
+    """Move a dead job back to the queue with a fresh set of attempts"""
+    query = """
+        UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, finished_at = NULL
+        WHERE id = ? AND status = 'dead'
+    """
+    return execute_query(query, (now, job_id))
@@ -0,0 +1,343 @@
+import os
+import re
+import atexit
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from database import record_image, get_image, get_pending_images, set_image_variants, delete_image
+
+try:
+    # Optional: without Pillow only the originals are served. PIL.Image itself
+    # is imported on first use (see load_pillow), not when the app starts.
+    import PIL
+except ImportError:
+    PIL = None
+
+logger = logging.getLogger('shophub.images')
+
+# Where originals and variants are written (sharded by the first two hash characters)
+IMAGE_STORAGE_PATH = os.environ.get('IMAGE_STORAGE_PATH', os.path.join('uploads', 'images'))
+IMAGE_MAX_SIZE = int(os.environ.get('IMAGE_MAX_SIZE', str(10 * 1024 * 1024)))
+IMAGE_MAX_FILES = int(os.environ.get('IMAGE_MAX_FILES', '10'))
+# Larger images are rejected before they are decoded
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', str(40 * 1000 * 1000)))
+# Widths of the WebP variants generated for every upload
+IMAGE_VARIANT_WIDTHS = tuple(sorted(int(w) for w in os.environ.get('IMAGE_VARIANT_WIDTHS', '160,480,1024').split(',')))
+IMAGE_WEBP_QUALITY = int(os.environ.get('IMAGE_WEBP_QUALITY', '80'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+
+# Multipart file parts posted under this prefix are streamed to ImageStore.spool
+UPLOAD_PATH_PREFIX = '/api/upload/'
+
+# Leading bytes -> mimetype; only formats every browser displays
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+SNIFF_SIZE = 12
+
+# <hash> for an original, <hash>-<width>.webp for a variant
+IMAGE_NAME = re.compile(r'^([0-9a-f]{64})(?:-(\d+)\.webp)?$')
+IMAGE_URL_HASH = re.compile(r'([0-9a-f]{64})(?:-\d+\.webp)?/*$')
+
+def load_pillow():
+    """PIL.Image, imported on first use; None without Pillow"""
+    if PIL is None:
+        return None
+    from PIL import Image
+    return Image
+
+def sniff_mimetype(head):
+    """Image mimetype from a file's first bytes, or None if it isn't a supported image"""
+    for signature, mimetype in SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def parse_image_hash(value):
+    """Hash from a bare hash or an image URL, or None"""
+    match = IMAGE_URL_HASH.search(str(value or '').split('?')[0])
+    return match.group(1) if match else None
+
+class ImageTooLarge(RequestEntityTooLarge):
+    description = f"Images must be at most {IMAGE_MAX_SIZE // (1024 * 1024)} MB"
+
+class TooManyImages(RequestEntityTooLarge):
+    description = f"At most {IMAGE_MAX_FILES} images per request"
+
+class HashingFile:
+    """Temporary file that hashes what is written to it
+
+    Werkzeug's multipart parser writes each uploaded file here chunk by
+    chunk, so an upload is never held in memory and its SHA-256 is known
+    as soon as parsing ends. The file lives next to the store so it can be
+    hard linked into place; it is deleted on close.
+    """
+
+    def __init__(self, directory, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.head = b''
+        self._hash = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise ImageTooLarge()
+        if len(self.head) < SNIFF_SIZE:
+            self.head += bytes(data[:SNIFF_SIZE - len(self.head)])
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+class UploadRequest(Request):
+    """Request class that streams image uploads straight into the image store
+
+    Parsing stops with TooManyImages at the file part past IMAGE_MAX_FILES,
+    before it is spooled.
+    """
+
+    image_parts = 0
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.path.startswith(UPLOAD_PATH_PREFIX):
+            self.image_parts += 1
+            if self.image_parts > IMAGE_MAX_FILES:
+                raise TooManyImages()
+            return image_store.spool()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+class ImageStore:
+    """Content-addressed image files with WebP variants built off the request path
+
+    An upload is stored once under its SHA-256, however many times it is
+    posted, and the hash is what products reference. Variants are written by
+    a small thread pool after the upload has been answered; until one is
+    ready its URL serves the original.
+    """
+
+    def __init__(self, root=IMAGE_STORAGE_PATH, variant_widths=IMAGE_VARIANT_WIDTHS, workers=IMAGE_WORKERS,
+                 max_size=IMAGE_MAX_SIZE):
+        self.root = root
+        self.variant_widths = variant_widths
+        self.workers = workers
+        self.max_size = max_size
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'uploads': 0,
+            'duplicates': 0,
+            'variants_built': 0,
+            'variant_errors': 0,
+            'pending': 0,
+        }
+
+    def _get_executor(self):
+        # Thread pools don't survive fork(), so each worker process makes its own
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='images')
+            self._pid = os.getpid()
+        return self._executor
+
+    def path(self, image_hash, width=None):
+        name = image_hash if width is None else f'{image_hash}-{width}.webp'
+        return os.path.join(self.root, image_hash[:2], name)
+
+    def url(self, image_hash, width=None):
+        return f"/static/images/{image_hash if width is None else f'{image_hash}-{width}.webp'}"
+
+    def describe(self, image):
+        """JSON-friendly view of an images row with its URLs"""
+        return {
+            'hash': image['hash'],
+            'url': self.url(image['hash']),
+            'variants': {str(width): self.url(image['hash'], width) for width in self.variant_widths},
+            'mimetype': image['mimetype'],
+            'size': image['size'],
+            'width': image['width'],
+            'height': image['height'],
+            'status': image['status'],
+        }
+
+    def spool(self):
+        """File object a multipart upload is streamed into"""
+        directory = os.path.join(self.root, 'tmp')
+        os.makedirs(directory, exist_ok=True)
+        return HashingFile(directory, self.max_size)
+
+    def save(self, upload):
+        """Store an uploaded FileStorage; returns (images row, True if it was new)
+
+        Raises ValueError for anything that isn't a supported image.
+        """
+        stream = upload.stream
+        if not isinstance(stream, HashingFile):
+            # Parsed without UploadRequest (the app's request_class wasn't set); spool it now
+            spooled = self.spool()
+            while True:
+                chunk = stream.read(64 * 1024)
+                if not chunk:
+                    break
+                spooled.write(chunk)
+            stream = spooled
+        try:
+            mimetype = sniff_mimetype(stream.head)
+            if mimetype is None:
+                raise ValueError("File must be a JPEG, PNG, GIF or WebP image")
+            stream.flush()
+            width = height = None
+            Image = load_pillow()
+            if Image is not None:
+                try:
+                    # Opened through the spooled file itself (reopening a NamedTemporaryFile
+                    # by name fails on Windows); Pillow leaves a passed-in file open
+                    stream.seek(0)
+                    with Image.open(stream) as img:  # reads the header only
+                        width, height = img.size
+                except Exception:
+                    raise ValueError("Image could not be read")
+                if width * height > IMAGE_MAX_PIXELS:
+                    raise ValueError("Image dimensions are too large")
+
+            image_hash = stream.hexdigest()
+            final = self.path(image_hash)
+            if not os.path.exists(final):
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                try:
+                    os.link(stream.name, final)
+                except FileExistsError:
+                    pass  # the same image uploaded concurrently
+            created = record_image(image_hash, mimetype, stream.size, width, height)
+        finally:
+            stream.close()
+
+        with self._lock:
+            self._stats['uploads'] += 1
+            self._stats['duplicates'] += not created
+        if created:
+            self.submit(image_hash)
+        return get_image(image_hash), created
+
+    def submit(self, image_hash):
+        """Queue variant generation for an image"""
+        with self._lock:
+            self._stats['pending'] += 1
+            executor = self._get_executor()
+        executor.submit(self._build_variants, image_hash)
+
+    def _build_variants(self, image_hash):
+        try:
+            built = self.build_variants(image_hash)
+        except Exception:
+            set_image_variants(image_hash, 'failed', None)
+            with self._lock:
+                self._stats['variant_errors'] += 1
+        else:
+            set_image_variants(image_hash, 'ready', ','.join(str(width) for width in built))
+            with self._lock:
+                self._stats['variants_built'] += len(built)
+        finally:
+            with self._lock:
+                self._stats['pending'] -= 1
+
+    def build_variants(self, image_hash):
+        """Write a WebP copy of the image at each variant width; returns the widths written
+
+        Variants are never wider than the original. Each one is resized from
+        the next larger one rather than from the full image, and JPEGs are
+        decoded at a reduced scale when the largest variant allows it.
+        """
+        Image = load_pillow()
+        if Image is None:
+            logger.warning('Pillow is not installed; image %s is served without variants', image_hash)
+            return []
+        from PIL import ImageOps
+        with Image.open(self.path(image_hash)) as img:
+            largest = max(self.variant_widths)
+            img.draft('RGB', (largest, round(img.height * largest / img.width)))
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            built = []
+            for width in sorted(self.variant_widths, reverse=True):
+                if img.width > width:
+                    img = img.resize((width, max(1, round(img.height * width / img.width))),
+                                     Image.Resampling.LANCZOS)
+                target = self.path(image_hash, width)
+                partial = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+                img.save(partial, 'WEBP', quality=IMAGE_WEBP_QUALITY, method=4)
+                os.replace(partial, target)
+                built.append(width)
+        return sorted(built)
+
+    def resolve(self, name):
+        """(path, mimetype, immutable) for a /static/images/ name, or None
+
+        A variant that isn't built yet resolves to the original, which must
+        not be cached forever under the variant's URL.
+        """
+        match = IMAGE_NAME.match(name)
+        if match is None:
+            return None
+        image_hash, width = match.group(1), match.group(2)
+        if width is not None:
+            variant = self.path(image_hash, int(width))
+            if os.path.isfile(variant):
+                return variant, 'image/webp', True
+        original = self.path(image_hash)
+        try:
+            with open(original, 'rb') as f:
+                mimetype = sniff_mimetype(f.read(SNIFF_SIZE))
+        except FileNotFoundError:
+            return None
+        return original, mimetype or 'application/octet-stream', width is None
+
+    def delete(self, image_hash):
+        """Delete an unused image and its variants; returns False if there was none"""
+        if not delete_image(image_hash):
+            return False
+        for path in [self.path(image_hash)] + [self.path(image_hash, width) for width in self.variant_widths]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def start(self):
+        """Queue variants for images left pending by a restart"""
+        for image_hash in get_pending_images(1000):
+            self.submit(image_hash)
+
+    def stop(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = self.workers
+        stats['variants_enabled'] = PIL is not None
+        return stats
+
+image_store = ImageStore()
+atexit.register(image_store.stop)
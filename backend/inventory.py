@@ -0,0 +1,204 @@
+import os
+import time
+import atexit
+import threading
+from collections import deque
+
+from database import (get_available_stock, get_cart_quantities, checkout_cart,
+                      apply_inventory_journal, set_product_stock)
+
+# How often journaled stock decrements are written back to products.stock
+INVENTORY_FLUSH_INTERVAL = float(os.environ.get('INVENTORY_FLUSH_INTERVAL', '2'))
+# How long an in-memory stock counter is trusted before it is re-read, so
+# sales and restocks made by other worker processes are picked up
+INVENTORY_COUNTER_TTL = float(os.environ.get('INVENTORY_COUNTER_TTL', '5'))
+
+# Recent reservation latencies kept for percentiles
+LATENCY_SAMPLES = 1024
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class InventoryManager:
+    """In-memory per-product stock counters in front of the database
+
+    Checkouts reserve stock against the counters first, so sold-out products
+    are rejected without taking the SQLite write lock. The checkout
+    transaction then re-checks stock in the database and journals the
+    decrement (so worker processes can never oversell between them), and a
+    background thread applies the journal to products.stock in batches.
+    """
+
+    def __init__(self, flush_interval=INVENTORY_FLUSH_INTERVAL, counter_ttl=INVENTORY_COUNTER_TTL,
+                 on_flush=None):
+        self.flush_interval = flush_interval
+        self.counter_ttl = counter_ttl
+        self.on_flush = on_flush
+        self._lock = threading.Lock()
+        self._counters = {}  # product_id -> (available or None if untracked, loaded_at)
+        self._inflight = {}  # product_id -> quantity reserved but not yet committed
+        self._stop = threading.Event()
+        self._thread = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._stats = {
+            'reservations': 0,
+            'rejections': 0,
+            'releases': 0,
+            'flushes': 0,
+            'flushed_rows': 0,
+            'last_flush_batch': 0,
+            'max_flush_batch': 0,
+            'flush_errors': 0,
+        }
+
+    def _refresh(self, product_ids):
+        """Load counters that are missing or older than the TTL"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [pid for pid in product_ids
+                     if pid not in self._counters or now - self._counters[pid][1] > self.counter_ttl]
+        if not stale:
+            return
+        levels = get_available_stock(stale)
+        with self._lock:
+            for pid in stale:
+                available = levels.get(pid)
+                if available is not None:
+                    # Reservations still in flight are not in the database yet
+                    available -= self._inflight.get(pid, 0)
+                self._counters[pid] = (available, now)
+
+    def reserve(self, items):
+        """Reserve {product_id: quantity} all-or-nothing; raises ValueError if out of stock"""
+        started = time.perf_counter()
+        while True:
+            self._refresh(items)
+            with self._lock:
+                # A concurrent release(reload=True) or set_stock can drop a counter
+                # between loading and locking; load it again rather than guess
+                if any(pid not in self._counters for pid in items):
+                    continue
+                for pid, quantity in items.items():
+                    available = self._counters[pid][0]
+                    if available is not None and available < quantity:
+                        self._stats['rejections'] += 1
+                        raise ValueError(f"Insufficient stock for product {pid}")
+                for pid, quantity in items.items():
+                    available, loaded_at = self._counters[pid]
+                    if available is not None:
+                        self._counters[pid] = (available - quantity, loaded_at)
+                    self._inflight[pid] = self._inflight.get(pid, 0) + quantity
+                self._stats['reservations'] += 1
+                self._latencies.append((time.perf_counter() - started) * 1000)
+                return
+
+    def release(self, items, reload=False):
+        """Give back a reservation whose checkout failed
+
+        With reload=True the counters are dropped so the next reservation
+        re-reads them (the database disagreed with what we had in memory).
+        """
+        with self._lock:
+            for pid, quantity in items.items():
+                self._inflight[pid] -= quantity
+                if not self._inflight[pid]:
+                    del self._inflight[pid]
+                if reload:
+                    self._counters.pop(pid, None)
+                elif pid in self._counters and self._counters[pid][0] is not None:
+                    available, loaded_at = self._counters[pid]
+                    self._counters[pid] = (available + quantity, loaded_at)
+            self._stats['releases'] += 1
+
+    def confirm(self, items):
+        """Mark a reservation as committed to the database"""
+        with self._lock:
+            for pid, quantity in items.items():
+                self._inflight[pid] -= quantity
+                if not self._inflight[pid]:
+                    del self._inflight[pid]
+
+    def checkout(self, cart_id, email=None):
+        """Reserve the cart's stock in memory, then write the order
+
+        Returns the same (order id, total, product ids) as checkout_cart.
+        """
+        items = get_cart_quantities(cart_id)
+        if not items:
+            raise ValueError("Cart is empty")
+        self.reserve(items)
+        try:
+            result = checkout_cart(cart_id, email, expected_items=items)
+        except Exception:
+            self.release(items, reload=True)
+            raise
+        self.confirm(items)
+        return result
+
+    def set_stock(self, product_id, stock):
+        """Set a product's available stock; returns the number of products updated"""
+        rows_affected = set_product_stock(product_id, stock)
+        with self._lock:
+            self._counters.pop(product_id, None)
+        if self.on_flush:
+            self.on_flush([product_id])
+        return rows_affected
+
+    def flush(self):
+        """Apply journaled decrements to products.stock; returns the number of products updated"""
+        applied = apply_inventory_journal()
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['flushed_rows'] += len(applied)
+            self._stats['last_flush_batch'] = len(applied)
+            self._stats['max_flush_batch'] = max(self._stats['max_flush_batch'], len(applied))
+        if applied and self.on_flush:
+            self.on_flush(list(applied))
+        return len(applied)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # Journal rows stay put and are retried on the next interval
+                with self._lock:
+                    self._stats['flush_errors'] += 1
+
+    def start(self):
+        """Start the background flush thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='inventory-flush', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and apply whatever is still journaled"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def stats(self):
+        """Return reservation and flush counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = list(self._latencies)
+            stats['tracked_products'] = len(self._counters)
+            stats['inflight_products'] = len(self._inflight)
+        stats['reservation_latency_ms'] = {
+            'p50': _percentile(latencies, 0.5),
+            'p99': _percentile(latencies, 0.99),
+            'max': max(latencies) if latencies else None,
+        }
+        return stats
+
+inventory = InventoryManager()
+atexit.register(inventory.stop)
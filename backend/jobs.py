@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import logging
+import argparse
+import threading
+from collections import deque
+
+import database
+from database import (enqueue_job, claim_jobs, complete_job, fail_job, requeue_stale_jobs,
+                      delete_finished_jobs, get_job_counts)
+
+logger = logging.getLogger('shophub.jobs')
+
+# Worker threads per process
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# How long an idle worker sleeps before checking for jobs enqueued by other processes
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '1'))
+# A running job whose worker hasn't finished it by then is assumed dead and requeued
+JOB_LOCK_TIMEOUT = float(os.environ.get('JOB_LOCK_TIMEOUT', '300'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+# Delay before the first retry; doubles with every further attempt
+JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', '5'))
+JOB_RETRY_MAX_DELAY = float(os.environ.get('JOB_RETRY_MAX_DELAY', '3600'))
+# Finished jobs are kept this long; dead jobs are kept until retried or deleted
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', str(24 * 3600)))
+JOB_MAINTENANCE_INTERVAL = float(os.environ.get('JOB_MAINTENANCE_INTERVAL', '60'))
+JOB_CLEANUP_BATCH_SIZE = 500
+
+# Lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+# Recent job timings kept for percentiles
+LATENCY_SAMPLES = 1024
+
+# kind -> function(**payload)
+HANDLERS = {}
+
+def job_handler(kind):
+    """Register the function that runs jobs of a kind"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+def retry_delay(attempts, backoff=JOB_RETRY_BACKOFF, max_delay=JOB_RETRY_MAX_DELAY):
+    """Exponential backoff with jitter for a job that has failed `attempts` times"""
+    delay = min(backoff * (2 ** (attempts - 1)), max_delay)
+    return delay + random.uniform(0, delay / 2)
+
+class JobQueue:
+    """Durable job queue in the jobs table, worked by threads in every process
+
+    Routes enqueue a job (one INSERT) and return; workers claim ready jobs
+    with a single UPDATE ... RETURNING, so a job is only ever handed to one
+    worker, in any process. A failed job is retried with exponential backoff
+    until it runs out of attempts, then it is kept as 'dead' for an admin to
+    inspect and retry.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL, lock_timeout=JOB_LOCK_TIMEOUT):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._maintained_at = float('-inf')
+        self._wait_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._run_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._stats = {
+            'enqueued': 0,
+            'deduplicated': 0,
+            'completed': 0,
+            'retried': 0,
+            'dead': 0,
+            'recovered': 0,
+            'lost': 0,
+            'errors': 0,
+        }
+
+    def enqueue(self, kind, payload=None, priority=PRIORITY_NORMAL, delay=0, max_attempts=JOB_MAX_ATTEMPTS,
+                dedupe_key=None):
+        """Queue a job; returns its ID, or None if dedupe_key matched a job still waiting to run"""
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = enqueue_job(kind, json.dumps(payload or {}), priority, time.time() + delay, max_attempts,
+                             dedupe_key)
+        with self._lock:
+            self._stats['enqueued' if job_id else 'deduplicated'] += 1
+        if not delay:
+            self._wake.set()
+        return job_id
+
+    def run_once(self, limit=1):
+        """Claim and run up to limit ready jobs; returns the number claimed"""
+        now = time.time()
+        jobs = claim_jobs(now, now + self.lock_timeout, limit)
+        for job in jobs:
+            self._execute(job)
+        return len(jobs)
+
+    def run_until_empty(self):
+        """Run jobs until none is ready (for the CLI and tests)"""
+        total = 0
+        while True:
+            claimed = self.run_once()
+            if not claimed:
+                return total
+            total += claimed
+
+    def _execute(self, job):
+        started = time.time()
+        with self._lock:
+            self._wait_ms.append(max(0.0, started - job['run_at']) * 1000)
+        try:
+            handler = HANDLERS.get(job['kind'])
+            if handler is None:
+                raise LookupError(f"No handler for job kind {job['kind']}")
+            handler(**json.loads(job['payload']))
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            logger.warning('Job %s (%s) failed on attempt %s: %s', job['id'], job['kind'], job['attempts'], error,
+                           exc_info=True)
+            finished = time.time()
+            if job['attempts'] >= job['max_attempts']:
+                owned = fail_job(job['id'], job['attempts'], finished, error)
+                outcome = 'dead'
+            else:
+                owned = fail_job(job['id'], job['attempts'], finished, error,
+                                 finished + retry_delay(job['attempts']))
+                outcome = 'retried'
+        else:
+            finished = time.time()
+            owned = complete_job(job['id'], job['attempts'], finished)
+            outcome = 'completed'
+        if not owned:
+            # The lock expired mid-run and the job was requeued; its new owner records the result
+            logger.warning('Job %s (%s) lost its lock during attempt %s; result discarded', job['id'], job['kind'],
+                           job['attempts'])
+            outcome = 'lost'
+        with self._lock:
+            self._stats[outcome] += 1
+            self._run_ms.append((finished - started) * 1000)
+
+    def maintain(self):
+        """Requeue jobs abandoned by dead workers and delete old finished jobs"""
+        now = time.time()
+        recovered = requeue_stale_jobs(now)
+        while delete_finished_jobs(now - JOB_RETENTION, JOB_CLEANUP_BATCH_SIZE) == JOB_CLEANUP_BATCH_SIZE:
+            pass
+        with self._lock:
+            self._stats['recovered'] += recovered
+        return recovered
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Cleared before claiming, so a job enqueued from here on cuts the wait short
+            self._wake.clear()
+            try:
+                if time.monotonic() - self._maintained_at >= JOB_MAINTENANCE_INTERVAL:
+                    with self._lock:
+                        due = time.monotonic() - self._maintained_at >= JOB_MAINTENANCE_INTERVAL
+                        if due:
+                            self._maintained_at = time.monotonic()
+                    if due:
+                        self.maintain()
+                if self.run_once():
+                    continue
+            except Exception:
+                with self._lock:
+                    self._stats['errors'] += 1
+            self._wake.wait(self.poll_interval)
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        if self._threads:
+            return
+        self._stop.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'jobs-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop the workers once their current job is finished"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self):
+        """Throughput counters, queue depth and wait/run latency percentiles"""
+        now = time.time()
+        counts, oldest = get_job_counts(now)
+        with self._lock:
+            stats = dict(self._stats)
+            wait_ms, run_ms = list(self._wait_ms), list(self._run_ms)
+        stats.update({
+            'workers': len(self._threads),
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'dead_letters': counts.get('dead', 0),
+            'oldest_ready_seconds': round(now - oldest, 3) if oldest else 0,
+            'wait_ms_p50': _percentile(wait_ms, 0.5),
+            'wait_ms_p99': _percentile(wait_ms, 0.99),
+            'run_ms_p50': _percentile(run_ms, 0.5),
+            'run_ms_p99': _percentile(run_ms, 0.99),
+        })
+        return stats
+
+jobs = JobQueue()
+atexit.register(jobs.stop)
+
+def main(argv=None):
+    """Command line entry point: python jobs.py [--drain | --work]"""
+    import tasks  # registers the job handlers
+
+    parser = argparse.ArgumentParser(description='Run background jobs outside the web server')
+    parser.add_argument('--drain', action='store_true', help='run every ready job, then exit')
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS, help='worker threads for a long-running worker')
+    parser.add_argument('--database', help='SQLite database file (defaults to DATABASE_PATH)')
+    args = parser.parse_args(argv)
+
+    if args.database:
+        database.DATABASE_PATH = args.database
+    database.init_database()
+    logging.basicConfig(level=logging.INFO)
+
+    queue = JobQueue(workers=args.workers)
+    if args.drain:
+        queue.maintain()
+        print(f"Ran {queue.run_until_empty()} jobs")
+        print(json.dumps(queue.stats(), indent=2))
+        return 0
+
+    queue.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        queue.stop()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
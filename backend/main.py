@@ -1,52 +1,324 @@
 import os
-from flask import Flask, jsonify, request, session, send_from_directory, render_template
+import json
+import sqlite3
+import time
+import hmac
+import base64
+import threading
+from startup import startup_profile  # first, so the import phase covers everything below
+from flask import Flask, jsonify, request, session, send_from_directory, send_file, render_template, g, abort
 from flask_cors import CORS
-from database import (init_database, create_user, get_all_users, get_user_by_id, 
-                     update_user, delete_user, authenticate_admin, get_all_admins, 
-                     create_admin, update_admin_password, create_product, get_all_products,
-                     get_product_by_id, update_product, delete_product)
+from werkzeug.middleware.proxy_fix import ProxyFix
+from cache import catalog_cache, catalog_flights, CacheEntry, IN_FLIGHT, CATALOG_MAX_AGE
+from validation import validate_product
+from bulk_import import import_products, parse_records, IMPORT_FORMATS, BULK_IMPORT_BATCH_SIZE
+from serialization import rows_to_json, rows_to_ndjson, encode_object, compress, preferred_encoding, RawJSON
+from database import (init_database, verify_schema, create_user, get_all_users, iter_all_users, get_user_by_id, 
+                     update_user, delete_user, register_user, authenticate_user, update_user_password, authenticate_admin, get_all_admins, 
+                     create_admin, update_admin_password, create_product,
+                     get_products_page, iter_products, search_products, get_product_by_id, update_product, delete_product,
+                     get_pool_stats, PRODUCT_COLUMNS, PRODUCT_SORT_KEYS, create_cart,
+                     get_cart_items, add_cart_item, set_cart_item_quantity, remove_cart_item,
+                     clear_cart, get_orders_by_cart, get_order_by_id, get_order_items,
+                     get_inventory_page, set_query_observer, get_image, get_user_by_email, reset_user_password,
+                     get_jobs, retry_dead_job, get_products_by_ids, get_users_by_ids, get_all_categories,
+                     get_category_by_id, create_category, update_category, delete_category, get_featured_products,
+                     get_product_recommendations)
+from inventory import inventory
+from metrics import metrics
+from static_assets import static_manifest, ENCODINGS, IMMUTABLE_CACHE_CONTROL
+from auth import login_throttle, password_checker, admin_sessions, is_admin_session, AuthBusy
+from passwords import session_stamp, dummy_hash
+from sessions import session_store, hash_token
+from validation import (validate_registration, validate_email, validate_password, validate_category_id,
+                        validate_image_hash, validate_ids,
+                        validate_category)
+from recommendations import recommendations, FEATURED_LIMIT, RECOMMENDATION_LIMIT
+from images import image_store, UploadRequest, ImageTooLarge, TooManyImages, parse_image_hash, load_pillow
+from jobs import jobs, PRIORITY_HIGH, PRIORITY_LOW
+import tasks  # registers the job handlers
+from analytics import analytics, PERIODS as ANALYTICS_PERIODS
+from snapshot import catalog_snapshot
+from ratelimit import rate_limiter, load_shedder, is_guarded
 
-app = Flask(__name__, static_folder='static', template_folder='templates')
-app.secret_key = 'your_secret_key_here_change_in_production'  # For session management
+# Static files are served by the routes below from an in-memory manifest, so
+# Flask's own /static route is disabled
+app = Flask(__name__, static_folder=None, template_folder='templates')
+app.request_class = UploadRequest  # streams image uploads to disk while hashing them
+STATIC_FOLDER = os.path.join(app.root_path, 'static')
+app.secret_key = os.environ.get('SECRET_KEY', 'your_secret_key_here_change_in_production')  # For session management
 CORS(app, supports_credentials=True)  # Enable CORS with credentials support
 
-# Initialize database on startup
-init_database()
+# Proxies in front of the app (e.g. 1 on Render) whose X-Forwarded-For is trusted, so
+# remote_addr and the per-client rate limits see the real client address
+WEB_TRUSTED_PROXIES = int(os.environ.get('WEB_TRUSTED_PROXIES', '0'))
+if WEB_TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=WEB_TRUSTED_PROXIES, x_proto=WEB_TRUSTED_PROXIES)
+
+def json_response(body, status=200):
+    """Wrap pre-encoded JSON bytes in a response"""
+    return app.response_class(body, status=status, mimetype='application/json')
+
+# ?format= values that stream the whole result instead of building one body
+STREAM_FORMATS = ('ndjson', 'json-stream')
+
+def stream_rows(batches, key, fmt, columns=None):
+    """Stream row batches as NDJSON or as a chunked {"success": true, key: [...]} document
+
+    Only one batch is encoded and held in memory at a time.
+    """
+    if fmt == 'ndjson':
+        body = (rows_to_ndjson(rows, columns) for rows in batches)
+        return app.response_class(body, mimetype='application/x-ndjson')
+    
+    def generate():
+        yield b'{"success":true,"' + key.encode() + b'":['
+        separator = b''
+        for rows in batches:
+            yield separator + rows_to_json(rows, columns)[1:-1]
+            separator = b','
+        yield b']}'
+    return app.response_class(generate(), mimetype='application/json')
+
+def invalid_format_response():
+    return jsonify({"success": False, "error": f"format must be one of: json, {', '.join(STREAM_FORMATS)}"}), 400
+
+def invalidate_products(product_ids):
+    """Drop cached catalog responses for products whose stock was flushed"""
+    for product_id in product_ids:
+        catalog_cache.invalidate_product(product_id)
+
+# 'background' runs warm_up() in a thread once create_app returns; 'sync' runs it inside create_app
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'background')
+
+def create_app(initialize_database=True):
+    """Finish setting up the app for this process and return it
+
+    Creating/upgrading the schema only has to happen once per deployment, so
+    pre-fork servers (see serve.py) run init_database() in the master process
+    and load workers with initialize_database=False, which only checks that
+    the schema is current and refuses to start otherwise. Everything else here is
+    per process: query instrumentation, the static file manifest and the
+    background threads. Work that requests can do without is left to
+    warm_up(). Each phase is timed in startup_profile.
+    """
+    startup_profile.mark('import')
+    with startup_profile.phase('schema'):
+        if initialize_database:
+            init_database()
+        else:
+            verify_schema()
+    with startup_profile.phase('static_manifest'):
+        with app.app_context():
+            static_manifest.build(STATIC_FOLDER, render_template('index.html'), precompress=False)
+    with startup_profile.phase('subsystems'):
+        set_query_observer(metrics.observe_query)
+        inventory.on_flush = invalidate_products
+        inventory.start()
+        session_store.start()
+        recommendations.on_refresh = catalog_cache.invalidate_recommendations
+        recommendations.start()
+        analytics.start()
+        image_store.start()
+        jobs.start()
+        # Catalog writes are recorded for every worker's snapshot reads, not just this one's
+        catalog_cache.on_change = catalog_snapshot.mark_changed
+        catalog_snapshot.start()
+    if STARTUP_WARMUP == 'sync':
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    startup_profile.mark('ready')
+    return app
+
+def warm_up():
+    """Startup work taken off the path to the first request
+
+    Until it has run, static files are sent uncompressed, and the first
+    login for an unknown user or the first image upload does this work itself.
+    """
+    with startup_profile.phase('warm_up'):
+        static_manifest.compress_variants()
+        dummy_hash()
+        load_pillow()
+
+# /metrics is served to admin sessions and to scrapers sending "Authorization: Bearer <METRICS_TOKEN>";
+# METRICS_PUBLIC=1 serves it to anyone (only for a port the public can't reach)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', '0') == '1'
+
+@app.before_request
+def start_request_timer():
+    startup_profile.first_request()
+    g.request_started = time.perf_counter()
+    metrics.request_started()
+
+@app.before_request
+def guard_request():
+    """Apply the per-client rate limits, then shed load if this process is over budget"""
+    if not is_guarded(request.path, request.method):
+        return None
+    rule = request.url_rule.rule if request.url_rule else None
+    retry_after = rate_limiter.check(request.remote_addr or 'unknown', request.method, rule)
+    if retry_after:
+        response = jsonify({"success": False, "error": "Too many requests, try again later"})
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response, 429
+    if not load_shedder.admit():
+        response = jsonify({"success": False, "error": "Server is busy, try again shortly"})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    g.admitted = True
+    return None
+
+@app.teardown_request
+def release_request(error=None):
+    if g.pop('admitted', False):
+        load_shedder.release()
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(error=None):
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    endpoint = request.url_rule.rule if request.url_rule else '<unmatched>'
+    status = g.pop('response_status', 500)
+    metrics.request_finished(request.method, endpoint, status, time.perf_counter() - started)
+
+def collect_gauges():
+    """Numeric gauges from the pool, cache and inventory for /metrics"""
+    gauges = {}
+    for prefix, stats in (('db_pool', get_pool_stats()), ('catalog_cache', catalog_cache.stats()),
+                          ('catalog_coalescing', catalog_flights.stats()),
+                          ('inventory', inventory.stats()), ('login', login_throttle.stats()),
+                          ('password_checker', password_checker.stats()), ('sessions', session_store.stats()),
+                          ('recommendations', recommendations.stats()), ('analytics', analytics.stats()),
+                          ('images', image_store.stats()), ('jobs', jobs.stats()),
+                          ('catalog_snapshot', catalog_snapshot.stats()), ('startup', startup_profile.stats()),
+                          ('rate_limit', rate_limiter.stats()), ('load_shedding', load_shedder.stats())):
+        for name, value in stats.items():
+            gauges[f'{prefix}_{name}'] = value
+    return gauges
+
+def static_response(asset):
+    """Serve a StaticAsset from memory, picking a precompressed variant and answering 304s"""
+    etag = asset.etag
+    encoding = next((e for e in ENCODINGS if e in asset.variants and request.accept_encodings[e]), None)
+    if encoding:
+        etag = f'{asset.etag}-{encoding}'
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif asset.body is None:
+        response = send_from_directory(STATIC_FOLDER, os.path.relpath(asset.path, STATIC_FOLDER),
+                                       etag=False, conditional=True)
+    else:
+        body = asset.variants[encoding] if encoding else asset.body
+        response = app.response_class(body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = asset.cache_control
+    if asset.variants:
+        response.vary.add('Accept-Encoding')
+    return response
 
 # User routes
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return static_response(static_manifest.index)
 
 # Serve static JS, CSS, media files
 @app.route('/static/<path:filename>')
 def serve_static(filename):
-    return send_from_directory(app.static_folder, filename)
+    asset = static_manifest.get(filename)
+    if asset is None:
+        abort(404)
+    return static_response(asset)
+
+# Uploaded images: originals by hash, WebP variants as <hash>-<width>.webp
+@app.route('/static/images/<name>')
+def serve_image(name):
+    resolved = image_store.resolve(name)
+    if resolved is None:
+        abort(404)
+    path, mimetype, immutable = resolved
+    response = send_file(path, mimetype=mimetype, etag=os.path.basename(path), conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else f'public, max-age={CATALOG_MAX_AGE}'
+    return response
 
 # Catch-all route to support React Router
 @app.route('/<path:path>')
 def fallback(path):
-    static_path = os.path.join(app.static_folder, path)
-    if os.path.exists(static_path):
-        return send_from_directory(app.static_folder, path)
-    return render_template("index.html")
+    asset = static_manifest.get(path)
+    if asset is None and path.startswith('assets/'):
+        # The Vite build links its bundle under /assets/, which start.bat copies into static/
+        asset = static_manifest.get(path[len('assets/'):])
+    return static_response(asset or static_manifest.index)
 
 
 
 
 
+# Most IDs one batch read (?ids= or POST .../batch) may ask for
+BATCH_MAX_IDS = int(os.environ.get('BATCH_MAX_IDS', '100'))
+
+def batch_ids_from_body():
+    """IDs posted as {"ids": [...]} to a batch route; raises ValueError"""
+    data = request.get_json(silent=True)
+    return validate_ids(data.get('ids') if isinstance(data, dict) else None, BATCH_MAX_IDS)
+
 # User routes
 @app.route('/api/users', methods=['GET'])
 def get_users():
-    """Get all users"""
+    """Get all users (?format=ndjson or json-stream streams the result)
+
+    ?ids=1,2,3 returns just those users, as POST /api/users/batch does.
+    """
     try:
+        if 'ids' in request.args:
+            try:
+                user_ids = validate_ids(request.args['ids'], BATCH_MAX_IDS)
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+            return build_users_batch(user_ids)
+
+        fmt = request.args.get('format', 'json')
+        if fmt in STREAM_FORMATS:
+            return stream_rows(iter_all_users(), 'users', fmt)
+        if fmt != 'json':
+            return invalid_format_response()
+        
         users = get_all_users()
-        # Convert sqlite3.Row objects to dictionaries
-        users_list = [dict(user) for user in users]
-        return jsonify({"success": True, "users": users_list})
+        # Encode sqlite3.Row objects straight to JSON
+        return json_response(encode_object(success=True, users=rows_to_json(users)))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/users/batch', methods=['POST'])
+def get_users_batch():
+    """Get several users in one request: {"ids": [1, 2, 3]}"""
+    try:
+        try:
+            user_ids = batch_ids_from_body()
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        return build_users_batch(user_ids)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def build_users_batch(user_ids):
+    """Users in the order asked for, plus the IDs that don't exist"""
+    users = {user['id']: user for user in get_users_by_ids(user_ids)}
+    found = [users[user_id] for user_id in user_ids if user_id in users]
+    missing = [user_id for user_id in user_ids if user_id not in users]
+    return json_response(encode_object(success=True, users=rows_to_json(found), missing=missing))
+
 @app.route('/api/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Get a specific user by ID"""
@@ -114,6 +386,7 @@ def delete_user_route(user_id):
         rows_affected = delete_user(user_id)
         
         if rows_affected > 0:
+            session_store.forget_user(user_id)
             return jsonify({"success": True, "message": "User deleted successfully"})
         else:
             return jsonify({"success": False, "error": "User not found"}), 404
@@ -121,6 +394,232 @@ def delete_user_route(user_id):
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+# User auth routes (bearer tokens)
+def bearer_token():
+    """Token from an "Authorization: Bearer <token>" header, or None"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    token = token.strip()
+    return token if scheme.lower() == 'bearer' and token else None
+
+def current_user_id():
+    """ID of the user whose bearer token came with the request, or None"""
+    if 'user_id' not in g:
+        token = bearer_token()
+        g.user_id = session_store.validate(token) if token else None
+    return g.user_id
+
+# The search index is merged this long after the last product write
+SEARCH_OPTIMIZE_DELAY = float(os.environ.get('SEARCH_OPTIMIZE_DELAY', '300'))
+
+def schedule_search_optimize():
+    """Queue one search index merge for after a burst of product writes"""
+    jobs.enqueue('search_optimize', priority=PRIORITY_LOW, delay=SEARCH_OPTIMIZE_DELAY,
+                 dedupe_key='search_optimize')
+
+def throttled_response(retry_after):
+    response = jsonify({"success": False, "error": "Too many login attempts, try again later"})
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response, 429
+
+def busy_response():
+    response = jsonify({"success": False, "error": "Login is busy, try again shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def token_response(user, status=200):
+    token, expires_at = session_store.create(user['id'])
+    return jsonify({"success": True, "token": token, "expires_at": int(expires_at), "user": dict(user)}), status
+
+@app.route('/api/auth/register', methods=['POST'])
+def register():
+    """Create an account and log it in"""
+    try:
+        try:
+            name, email, password = validate_registration(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        try:
+            user_id = password_checker.run(register_user, name, email, password)
+        except sqlite3.IntegrityError:
+            return jsonify({"success": False, "error": "Email is already registered"}), 409
+        except AuthBusy:
+            return busy_response()
+        return token_response(get_user_by_id(user_id), 201)
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/auth/login', methods=['POST'])
+def login():
+    """Log in with {email, password}; returns a bearer token"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or 'email' not in data or 'password' not in data:
+            return jsonify({"success": False, "error": "Email and password are required"}), 400
+        
+        email = str(data['email']).strip()
+        ip = request.remote_addr or 'unknown'
+        retry_after = login_throttle.check(ip, email)
+        if retry_after:
+            return throttled_response(retry_after)
+        
+        try:
+            user = password_checker.run(authenticate_user, email, str(data['password']))
+        except AuthBusy:
+            return busy_response()
+        login_throttle.record(ip, email, user is not None)
+        
+        if user is None:
+            return jsonify({"success": False, "error": "Invalid credentials"}), 401
+        return token_response(user)
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    """End the current session"""
+    if current_user_id() is None:
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    session_store.revoke(bearer_token())
+    return jsonify({"success": True, "message": "Logged out successfully"})
+
+@app.route('/api/auth/logout-all', methods=['POST'])
+def logout_all():
+    """End every session of the current user, including this one"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    revoked = session_store.revoke_all(user_id)
+    return jsonify({"success": True, "revoked": revoked})
+
+@app.route('/api/auth/profile', methods=['GET'])
+def get_profile():
+    """Get the current user"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    user = get_user_by_id(user_id)
+    if user is None:
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    return jsonify({"success": True, "user": dict(user)})
+
+@app.route('/api/auth/profile', methods=['PUT'])
+def update_profile():
+    """Update the current user's {name, email}"""
+    try:
+        user_id = current_user_id()
+        if user_id is None:
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        
+        data = request.get_json(silent=True)
+        if not data or 'name' not in data or 'email' not in data:
+            return jsonify({"success": False, "error": "Name and email are required"}), 400
+        try:
+            email = validate_email(data['email'])
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        try:
+            update_user(user_id, str(data['name']).strip(), email)
+        except sqlite3.IntegrityError:
+            return jsonify({"success": False, "error": "Email is already registered"}), 409
+        return jsonify({"success": True, "user": dict(get_user_by_id(user_id))})
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/auth/change-password', methods=['PUT'])
+def change_password():
+    """Change the password with {currentPassword, newPassword}; ends the user's other sessions"""
+    try:
+        user_id = current_user_id()
+        if user_id is None:
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        
+        data = request.get_json(silent=True)
+        if not data or 'currentPassword' not in data or 'newPassword' not in data:
+            return jsonify({"success": False, "error": "Current and new password are required"}), 400
+        try:
+            new_password = validate_password(data['newPassword'])
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        user = get_user_by_id(user_id)
+        ip = request.remote_addr or 'unknown'
+        retry_after = login_throttle.check(ip, user['email'])
+        if retry_after:
+            return throttled_response(retry_after)
+        try:
+            verified = password_checker.run(authenticate_user, user['email'], str(data['currentPassword']))
+            login_throttle.record(ip, user['email'], verified is not None)
+            if verified is None:
+                return jsonify({"success": False, "error": "Current password is incorrect"}), 401
+            password_checker.run(update_user_password, user_id, new_password)
+        except AuthBusy:
+            return busy_response()
+        
+        revoked = session_store.revoke_all(user_id, keep_token=bearer_token())
+        return jsonify({"success": True, "message": "Password changed", "revoked": revoked})
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/auth/forgot-password', methods=['POST'])
+def forgot_password():
+    """Queue a password reset mail for {email}
+
+    The answer is the same whether or not the email is registered, and the
+    mail itself is sent by a background job.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            email = validate_email(data.get('email') or '')
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        retry_after = login_throttle.check(request.remote_addr or 'unknown', email)
+        if retry_after:
+            return throttled_response(retry_after)
+        user = get_user_by_email(email)
+        if user is not None:
+            jobs.enqueue('password_reset', {'user_id': user['id']}, priority=PRIORITY_HIGH)
+        return jsonify({"success": True, "message": "If the email is registered, a reset link has been sent"})
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/auth/reset-password', methods=['POST'])
+def reset_password():
+    """Set a new password with {token, password} from a reset mail; ends every session"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or not data.get('token') or 'password' not in data:
+            return jsonify({"success": False, "error": "Token and password are required"}), 400
+        try:
+            new_password = validate_password(data['password'])
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        retry_after = login_throttle.by_ip.take(request.remote_addr or 'unknown')
+        if retry_after:
+            return throttled_response(retry_after)
+        try:
+            user_id = password_checker.run(reset_user_password, hash_token(str(data['token'])), new_password,
+                                           time.time())
+        except AuthBusy:
+            return busy_response()
+        if user_id is None:
+            return jsonify({"success": False, "error": "Reset link is invalid or has expired"}), 400
+        
+        session_store.revoke_all(user_id)
+        return jsonify({"success": True, "message": "Password has been reset"})
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 # Admin routes
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
@@ -134,18 +633,30 @@ def admin_login():
         username = data['username'].strip()
         password = data['password']
         
-        admin = authenticate_admin(username, password)
+        ip = request.remote_addr or 'unknown'
+        retry_after = login_throttle.check(ip, username)
+        if retry_after:
+            return throttled_response(retry_after)
+        
+        try:
+            admin = password_checker.run(authenticate_admin, username, password)
+        except AuthBusy:
+            return busy_response()
+        login_throttle.record(ip, username, admin is not None)
         
         if admin:
             session['admin_id'] = admin['id']
             session['admin_username'] = admin['username']
+            session['admin_stamp'] = session_stamp(admin['password'])
+            # The password may have just been rehashed; don't keep checking against the old stamp
+            admin_sessions.forget(admin['id'])
             return jsonify({
                 "success": True, 
                 "message": "Login successful",
                 "admin": {
                     "id": admin['id'],
                     "username": admin['username'],
-                    "email": admin.get('email', '')
+                    "email": admin['email']
                 }
             })
         else:
@@ -159,12 +670,13 @@ def admin_logout():
     """Admin logout endpoint"""
     session.pop('admin_id', None)
     session.pop('admin_username', None)
+    session.pop('admin_stamp', None)
     return jsonify({"success": True, "message": "Logged out successfully"})
 
 @app.route('/api/admin/check', methods=['GET'])
 def check_admin_session():
     """Check if admin is logged in"""
-    if 'admin_id' in session:
+    if is_admin_session(session):
         return jsonify({
             "success": True, 
             "logged_in": True,
@@ -180,63 +692,480 @@ def check_admin_session():
 def get_admins():
     """Get all admins (admin only)"""
     try:
-        if 'admin_id' not in session:
+        if not is_admin_session(session):
             return jsonify({"success": False, "error": "Unauthorized"}), 401
         
         admins = get_all_admins()
-        admins_list = [dict(admin) for admin in admins]
-        return jsonify({"success": True, "admins": admins_list})
+        return json_response(encode_object(success=True, admins=rows_to_json(admins)))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/admin/db/pool', methods=['GET'])
+def get_db_pool_stats():
+    """Get database connection pool statistics (admin only)"""
+    if not is_admin_session(session):
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    return jsonify({"success": True, "pool": get_pool_stats()})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint (METRICS_TOKEN bearer token or admin session)"""
+    authorized = (METRICS_PUBLIC or is_admin_session(session) or
+                  (METRICS_TOKEN and hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                         f'Bearer {METRICS_TOKEN}')))
+    if not authorized:
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    body = metrics.prometheus(collect_gauges())
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/metrics', methods=['GET'])
+def get_metrics():
+    """Get request, query and slow-query metrics as JSON (admin only)"""
+    if not is_admin_session(session):
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    snapshot = metrics.snapshot()
+    snapshot['pool'] = get_pool_stats()
+    snapshot['cache'] = catalog_cache.stats()
+    snapshot['inventory'] = inventory.stats()
+    return jsonify({"success": True, "metrics": snapshot})
+
+@app.route('/api/admin/cache', methods=['GET'])
+def get_cache_stats():
+    """Get catalog cache statistics (admin only)"""
+    if not is_admin_session(session):
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    return jsonify({"success": True, "cache": catalog_cache.stats(), "coalescing": catalog_flights.stats(),
+                    "static": static_manifest.stats(), "snapshot": catalog_snapshot.stats()})
+
 # Product routes
+def cached_response(cache_key, build):
+    """Serve a read-only JSON response through the catalog cache
+
+    `build` produces the response on a cache miss; only 200 responses are
+    cached. Responses carry a strong ETag, and a matching If-None-Match on a
+    cached entry is answered with 304 without touching the database. The
+    gzip/brotli variant of a cached body is compressed once and reused.
+    On a miss, `build` reads from the catalog snapshot when one is usable.
+
+    Concurrent misses on the same key share a single build. An entry that
+    has just expired is served as-is while one request rebuilds it.
+    """
+    entry, fresh = catalog_cache.lookup(cache_key)
+    if not fresh:
+        version = catalog_cache.version
+        
+        def render():
+            with catalog_snapshot.reads(not_before=catalog_cache.changed_at):
+                response = app.make_response(build())
+            if response.status_code != 200:
+                return response.get_data(), response.status_code, response.mimetype
+            return catalog_cache.set(cache_key, response.get_data(), response.mimetype, version=version)
+        
+        # A build started before a catalog write must not be shared with requests made after it
+        result = catalog_flights.do((cache_key, version), render, wait=entry is None)
+        if isinstance(result, CacheEntry):
+            entry = result
+        elif result is not IN_FLIGHT:  # not cacheable (an error); every waiter gets its own copy
+            body, status, mimetype = result
+            return app.response_class(body, status=status, mimetype=mimetype)
+    
+    body = entry.body
+    etag = entry.etag
+    encoding = preferred_encoding(request.accept_encodings, len(body))
+    if encoding:
+        compressed = entry.variants.get(encoding)
+        if compressed is None:
+            compressed = entry.variants[encoding] = compress(body, encoding)
+        body = compressed
+        etag = f'{entry.etag}-{encoding}'
+    
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(entry.etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype=entry.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={CATALOG_MAX_AGE}'
+    response.vary.add('Accept-Encoding')
+    return response
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(row, sort):
+    """Encode the keyset position of a row as an opaque cursor string"""
+    raw = json.dumps([row[sort], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor string back into a (sort value, id) pair"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    return value, int(row_id)
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all products (public endpoint)"""
+    """Get a page of products (public endpoint)
+
+    Query parameters: limit, cursor, sort (created_at|price|name),
+    order (asc|desc), min_price, max_price, fields (comma separated), and
+    format (json|ndjson|json-stream). The streaming formats export every
+    matching product after `cursor` and bypass the cache.
+
+    ?ids=1,2,3 returns just those products instead of a page (the other
+    parameters are ignored), as POST /api/products/batch does.
+    """
+    if 'ids' in request.args:
+        try:
+            product_ids = validate_ids(request.args['ids'], BATCH_MAX_IDS)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        key = catalog_cache.list_key('products:ids', [('ids', tuple(product_ids))])
+        return cached_response(key, lambda: build_products_batch(product_ids))
+    if request.args.get('format', 'json') != 'json':
+        return build_products_page()
+    key = catalog_cache.list_key('products', request.args.items(multi=True))
+    return cached_response(key, build_products_page)
+
+@app.route('/api/products/category/<int:category_id>', methods=['GET'])
+def get_products_by_category(category_id):
+    """Get a page of products in a category (same parameters as /api/products)"""
+    def build():
+        if get_category_by_id(category_id) is None:
+            return jsonify({"success": False, "error": "Category not found"}), 404
+        return build_products_page(category_id)
+    
+    if request.args.get('format', 'json') != 'json':
+        return build()
+    key = catalog_cache.list_key(f'category:{category_id}', request.args.items(multi=True))
+    return cached_response(key, build)
+
+@app.route('/api/products/featured', methods=['GET'])
+def get_featured():
+    """Get the precomputed featured products"""
+    def build():
+        try:
+            rows = get_featured_products(FEATURED_LIMIT)
+            return json_response(encode_object(success=True, products=rows_to_json(rows)))
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+    
+    return cached_response(catalog_cache.featured_key(), build)
+
+@app.route('/api/products/<int:product_id>/recommended', methods=['GET'])
+def get_recommended(product_id):
+    """Get the precomputed recommendations for a product"""
+    def build():
+        try:
+            rows = get_product_recommendations(product_id, RECOMMENDATION_LIMIT)
+            if not rows and get_product_by_id(product_id) is None:
+                return jsonify({"success": False, "error": "Product not found"}), 404
+            return json_response(encode_object(success=True, products=rows_to_json(rows)))
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+    
+    return cached_response(catalog_cache.recommended_key(product_id), build)
+
+# Category routes
+@app.route('/api/categories', methods=['GET'])
+def get_categories():
+    """Get all categories with product counts"""
+    def build():
+        try:
+            rows = get_all_categories()
+            return json_response(encode_object(success=True, categories=rows_to_json(rows)))
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+    
+    return cached_response(catalog_cache.list_key('categories', ()), build)
+
+@app.route('/api/categories/<int:category_id>', methods=['GET'])
+def get_category(category_id):
+    """Get category by ID"""
+    try:
+        category = get_category_by_id(category_id)
+        if category:
+            return jsonify({"success": True, "category": dict(category)})
+        else:
+            return jsonify({"success": False, "error": "Category not found"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/categories', methods=['POST'])
+def add_category():
+    """Create a category (admin only)"""
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        try:
+            name, description = validate_category(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        try:
+            category_id = create_category(name, description)
+        except sqlite3.IntegrityError:
+            return jsonify({"success": False, "error": "Category already exists"}), 409
+        catalog_cache.invalidate_product()
+        return jsonify({"success": True, "category": dict(get_category_by_id(category_id))}), 201
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/categories/<int:category_id>', methods=['PUT'])
+def update_category_route(category_id):
+    """Update a category (admin only)"""
     try:
-        products = get_all_products()
-        products_list = [dict(product) for product in products]
-        return jsonify({"success": True, "products": products_list})
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        try:
+            name, description = validate_category(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        try:
+            rows_affected = update_category(category_id, name, description)
+        except sqlite3.IntegrityError:
+            return jsonify({"success": False, "error": "Category already exists"}), 409
+        if rows_affected > 0:
+            catalog_cache.invalidate_product()
+            return jsonify({"success": True, "category": dict(get_category_by_id(category_id))})
+        else:
+            return jsonify({"success": False, "error": "Category not found"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/categories/<int:category_id>', methods=['DELETE'])
+def delete_category_route(category_id):
+    """Delete a category; its products become uncategorized (admin only)"""
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        rows_affected = delete_category(category_id)
+        if rows_affected > 0:
+            catalog_cache.invalidate_product()
+            return jsonify({"success": True, "message": "Category deleted successfully"})
+        else:
+            return jsonify({"success": False, "error": "Category not found"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def build_products_page(category_id=None):
+    """Build the /api/products response for the current request arguments"""
+    try:
+        args = request.args
+        
+        sort = args.get('sort', 'created_at')
+        if sort not in PRODUCT_SORT_KEYS:
+            return jsonify({"success": False, "error": f"sort must be one of: {', '.join(PRODUCT_SORT_KEYS)}"}), 400
+        
+        order = args.get('order', 'desc' if sort == 'created_at' else 'asc').lower()
+        if order not in ('asc', 'desc'):
+            return jsonify({"success": False, "error": "order must be 'asc' or 'desc'"}), 400
+        
+        try:
+            limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+            min_price = float(args['min_price']) if 'min_price' in args else None
+            max_price = float(args['max_price']) if 'max_price' in args else None
+        except ValueError:
+            return jsonify({"success": False, "error": "limit, min_price and max_price must be numbers"}), 400
+        if limit < 1:
+            return jsonify({"success": False, "error": "limit must be positive"}), 400
+        limit = min(limit, MAX_PAGE_SIZE)
+        
+        after = None
+        if args.get('cursor'):
+            try:
+                after = decode_cursor(args['cursor'])
+            except (ValueError, TypeError):
+                return jsonify({"success": False, "error": "Invalid cursor"}), 400
+        
+        fields = None
+        if args.get('fields'):
+            fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+            unknown = [f for f in fields if f not in PRODUCT_COLUMNS]
+            if unknown:
+                return jsonify({"success": False, "error": f"Unknown fields: {', '.join(unknown)}"}), 400
+        
+        fmt = args.get('format', 'json')
+        if fmt in STREAM_FORMATS:
+            batches = iter_products(sort=sort, descending=(order == 'desc'), after=after,
+                                    min_price=min_price, max_price=max_price, columns=fields,
+                                    category_id=category_id)
+            return stream_rows(batches, 'products', fmt, fields)
+        if fmt != 'json':
+            return invalid_format_response()
+        
+        rows = get_products_page(limit, sort=sort, descending=(order == 'desc'), after=after,
+                                 min_price=min_price, max_price=max_price, columns=fields,
+                                 category_id=category_id)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        next_cursor = encode_cursor(rows[-1], sort) if has_more else None
+        return json_response(encode_object(
+            success=True,
+            products=rows_to_json(rows, fields),
+            next_cursor=next_cursor,
+            has_more=has_more
+        ))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/products/search', methods=['GET'])
+def search_products_route():
+    """Full-text product search with ranked, highlighted results (public endpoint)
+
+    Query parameters: q, limit, offset, prefix (1|0), min_price, max_price.
+    """
+    try:
+        args = request.args
+        text = args.get('q', '').strip()
+        if not text:
+            return jsonify({"success": False, "error": "Search query 'q' is required"}), 400
+        
+        try:
+            limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+            offset = int(args.get('offset', 0))
+            min_price = float(args['min_price']) if 'min_price' in args else None
+            max_price = float(args['max_price']) if 'max_price' in args else None
+        except ValueError:
+            return jsonify({"success": False, "error": "limit, offset, min_price and max_price must be numbers"}), 400
+        if limit < 1 or offset < 0:
+            return jsonify({"success": False, "error": "limit must be positive and offset non-negative"}), 400
+        limit = min(limit, MAX_PAGE_SIZE)
+        prefix = args.get('prefix', '1') not in ('0', 'false')
+        
+        rows = search_products(text, limit, offset=offset, prefix=prefix,
+                               min_price=min_price, max_price=max_price)
+        has_more = len(rows) > limit
+        results = [dict(row) for row in rows[:limit]]
+        return jsonify({
+            "success": True,
+            "query": text,
+            "products": results,
+            "has_more": has_more,
+            "next_offset": offset + limit if has_more else None
+        })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """Get a specific product by ID (public endpoint)"""
+    return cached_response(catalog_cache.product_key(product_id),
+                           lambda: build_product_response(product_id))
+
+def product_body(product):
+    """Body of the /api/products/<id> response for a products row"""
+    return encode_object(success=True, product=dict(product))
+
+# A product_body() is this prefix, the product object and a closing brace
+PRODUCT_BODY_PREFIX = encode_object(success=True, product=RawJSON(b''))[:-1]
+
+def build_product_response(product_id):
+    """Build the /api/products/<id> response"""
     try:
         product = get_product_by_id(product_id)
         if product:
-            return jsonify({"success": True, "product": dict(product)})
+            return json_response(product_body(product))
         else:
             return jsonify({"success": False, "error": "Product not found"}), 404
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/products/batch', methods=['POST'])
+def get_products_batch():
+    """Get several products in one request: {"ids": [1, 2, 3]} (public endpoint)"""
+    try:
+        product_ids = batch_ids_from_body()
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    with catalog_snapshot.reads(not_before=catalog_cache.changed_at):
+        return build_products_batch(product_ids)
+
+def build_products_batch(product_ids):
+    """Build a multi-get response: the products in the order asked for, plus the IDs that don't exist
+
+    Products are taken from their /api/products/<id> cache entries where
+    possible, so cached items cost no query; the rest are read in a single
+    query and cached for later single and batch reads.
+    """
+    try:
+        found = {}  # id -> encoded product object
+        misses = []
+        for product_id in product_ids:
+            entry = catalog_cache.get(catalog_cache.product_key(product_id))
+            if entry is not None and entry.body.startswith(PRODUCT_BODY_PREFIX):
+                found[product_id] = entry.body[len(PRODUCT_BODY_PREFIX):-1]
+            else:
+                misses.append(product_id)
+        if misses:
+            version = catalog_cache.version
+            for product in get_products_by_ids(misses):
+                body = product_body(product)
+                catalog_cache.set(catalog_cache.product_key(product['id']), body, 'application/json',
+                                  version=version)
+                found[product['id']] = body[len(PRODUCT_BODY_PREFIX):-1]
+        products = RawJSON(b'[' + b','.join(found[i] for i in product_ids if i in found) + b']')
+        missing = [product_id for product_id in product_ids if product_id not in found]
+        return json_response(encode_object(success=True, products=products, missing=missing))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/admin/products', methods=['POST'])
 def add_product():
     """Create a new product (admin only)"""
     try:
-        if 'admin_id' not in session:
+        if not is_admin_session(session):
             return jsonify({"success": False, "error": "Unauthorized"}), 401
             
         data = request.get_json()
         
-        if not data or 'name' not in data or 'price' not in data:
-            return jsonify({"success": False, "error": "Name and price are required"}), 400
+        try:
+            name, price, description = validate_product(data)
+            category_id = validate_category_id(data.get('category_id'))
+            image = validate_image_hash(data.get('image'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        if category_id is not None and get_category_by_id(category_id) is None:
+            return jsonify({"success": False, "error": "Category not found"}), 400
+        if image is not None and get_image(image) is None:
+            return jsonify({"success": False, "error": "Image not found"}), 400
         
-        name = data['name'].strip()
+        create_product(name, price, description, category_id, image)
+        catalog_cache.invalidate_product()
+        return jsonify({"success": True, "message": "Product created successfully"}), 201
+    
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/products/bulk', methods=['POST'])
+def bulk_import_products_route():
+    """Bulk insert/upsert products from a CSV, JSON or NDJSON body (admin only)
+
+    The format comes from ?format= or the Content-Type. Rows with an `id`
+    are upserted; rows without one are inserted. ?batch_size= sets how many
+    rows are written per transaction.
+    """
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
         
-        try:
-            price = float(data['price'])
-            if price < 0:
-                return jsonify({"success": False, "error": "Price cannot be negative"}), 400
-        except (ValueError, TypeError):
-            return jsonify({"success": False, "error": "Invalid price format"}), 400
+        fmt = request.args.get('format') or IMPORT_FORMATS.get(request.mimetype)
+        if fmt not in IMPORT_FORMATS.values():
+            return jsonify({"success": False, "error": "Body must be CSV, JSON or NDJSON (set Content-Type or ?format=csv|json|ndjson)"}), 400
         
-        description = data.get('description', '').strip()
+        try:
+            batch_size = int(request.args.get('batch_size', BULK_IMPORT_BATCH_SIZE))
+        except ValueError:
+            return jsonify({"success": False, "error": "batch_size must be a number"}), 400
+        if batch_size < 1:
+            return jsonify({"success": False, "error": "batch_size must be positive"}), 400
         
-        create_product(name, price, description)
-        return jsonify({"success": True, "message": "Product created successfully"}), 201
+        report = import_products(parse_records(request.stream, fmt), batch_size)
+        if report['imported']:
+            catalog_cache.invalidate_product()
+            schedule_search_optimize()
+        return jsonify({"success": report['failed'] == 0, **report})
     
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -245,28 +1174,33 @@ def add_product():
 def update_product_route(product_id):
     """Update an existing product (admin only)"""
     try:
-        if 'admin_id' not in session:
+        if not is_admin_session(session):
             return jsonify({"success": False, "error": "Unauthorized"}), 401
             
         data = request.get_json()
         
-        if not data or 'name' not in data or 'price' not in data:
-            return jsonify({"success": False, "error": "Name and price are required"}), 400
-        
-        name = data['name'].strip()
-        
         try:
-            price = float(data['price'])
-            if price < 0:
-                return jsonify({"success": False, "error": "Price cannot be negative"}), 400
-        except (ValueError, TypeError):
-            return jsonify({"success": False, "error": "Invalid price format"}), 400
+            name, price, description = validate_product(data)
+            category_id = validate_category_id(data.get('category_id'))
+            image = validate_image_hash(data.get('image'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        if category_id is not None and get_category_by_id(category_id) is None:
+            return jsonify({"success": False, "error": "Category not found"}), 400
+        if image is not None and get_image(image) is None:
+            return jsonify({"success": False, "error": "Image not found"}), 400
         
-        description = data.get('description', '').strip()
-        
-        rows_affected = update_product(product_id, name, price, description)
+        # Category and image are only changed when the request names them
+        columns = {}
+        if 'category_id' in data:
+            columns['category_id'] = category_id
+        if 'image' in data:
+            columns['image'] = image
+        rows_affected = update_product(product_id, name, price, description, **columns)
         
         if rows_affected > 0:
+            catalog_cache.invalidate_product(product_id)
+            schedule_search_optimize()
             return jsonify({"success": True, "message": "Product updated successfully"})
         else:
             return jsonify({"success": False, "error": "Product not found"}), 404
@@ -278,10 +1212,11 @@ def update_product_route(product_id):
 def delete_product_route(product_id):
     """Delete a product (admin only)"""
     try:
-        if 'admin_id' not in session:
+        if not is_admin_session(session):
             return jsonify({"success": False, "error": "Unauthorized"}), 401
             
         rows_affected = delete_product(product_id)
+        catalog_cache.invalidate_product(product_id)
         
         if rows_affected > 0:
             return jsonify({"success": True, "message": "Product deleted successfully"})
@@ -291,6 +1226,358 @@ def delete_product_route(product_id):
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Cart routes (the cart is tied to the browser session)
+def current_cart_id(create=False):
+    """Get the session's cart id, creating a cart if asked and none exists"""
+    cart_id = session.get('cart_id')
+    if cart_id is None and create:
+        cart_id = create_cart()
+        session['cart_id'] = cart_id
+    return cart_id
+
+def cart_response(cart_id):
+    """Build the cart payload with current prices"""
+    items = [dict(item) for item in get_cart_items(cart_id)] if cart_id else []
+    total = round(sum(item['subtotal'] for item in items), 2)
+    return jsonify({"success": True, "cart": {"items": items, "total": total}})
+
+def parse_cart_item(data, allow_zero=False):
+    """Validate a {productId, quantity} body; returns (product_id, quantity)"""
+    if not data or 'productId' not in data:
+        raise ValueError("productId is required")
+    try:
+        product_id = int(data['productId'])
+        quantity = int(data.get('quantity', 1))
+    except (ValueError, TypeError):
+        raise ValueError("productId and quantity must be integers")
+    if quantity < (0 if allow_zero else 1):
+        raise ValueError("Quantity must be positive")
+    return product_id, quantity
+
+@app.route('/api/cart', methods=['GET'])
+def get_cart():
+    """Get the current cart"""
+    try:
+        return cart_response(current_cart_id())
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/cart/add', methods=['POST'])
+def add_to_cart():
+    """Add a product to the cart"""
+    try:
+        try:
+            product_id, quantity = parse_cart_item(request.get_json())
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        if not get_product_by_id(product_id):
+            return jsonify({"success": False, "error": "Product not found"}), 404
+        
+        cart_id = current_cart_id(create=True)
+        add_cart_item(cart_id, product_id, quantity)
+        return cart_response(cart_id)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/cart/update', methods=['PUT'])
+def update_cart():
+    """Change the quantity of a product in the cart (0 removes it)"""
+    try:
+        try:
+            product_id, quantity = parse_cart_item(request.get_json(), allow_zero=True)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        cart_id = current_cart_id()
+        if quantity == 0:
+            rows_affected = remove_cart_item(cart_id, product_id) if cart_id else 0
+        else:
+            rows_affected = set_cart_item_quantity(cart_id, product_id, quantity) if cart_id else 0
+        
+        if rows_affected > 0:
+            return cart_response(cart_id)
+        else:
+            return jsonify({"success": False, "error": "Product not in cart"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/cart/remove/<int:product_id>', methods=['DELETE'])
+def remove_from_cart(product_id):
+    """Remove a product from the cart"""
+    try:
+        cart_id = current_cart_id()
+        rows_affected = remove_cart_item(cart_id, product_id) if cart_id else 0
+        
+        if rows_affected > 0:
+            return cart_response(cart_id)
+        else:
+            return jsonify({"success": False, "error": "Product not in cart"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/cart/clear', methods=['DELETE'])
+def clear_cart_route():
+    """Empty the cart"""
+    try:
+        cart_id = current_cart_id()
+        if cart_id:
+            clear_cart(cart_id)
+        return cart_response(cart_id)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Order routes
+def order_response(order, status=200):
+    """Build the payload for a single order with its items"""
+    order_data = dict(order)
+    order_data['items'] = [dict(item) for item in get_order_items(order['id'])]
+    return jsonify({"success": True, "order": order_data}), status
+
+@app.route('/api/orders', methods=['POST'])
+def create_order():
+    """Check out the current cart"""
+    try:
+        cart_id = current_cart_id()
+        if not cart_id:
+            return jsonify({"success": False, "error": "Cart is empty"}), 409
+        
+        data = request.get_json(silent=True) or {}
+        email = (data.get('email') or '').strip() or None
+        if email and ('@' not in email or '.' not in email):
+            return jsonify({"success": False, "error": "Invalid email format"}), 400
+        
+        try:
+            order_id, total, product_ids = inventory.checkout(cart_id, email)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 409
+        if email:
+            jobs.enqueue('order_confirmation', {'order_id': order_id}, priority=PRIORITY_HIGH)
+        
+        return order_response(get_order_by_id(order_id), 201)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/orders', methods=['GET'])
+def get_orders():
+    """Get orders placed from the current session's cart"""
+    try:
+        cart_id = current_cart_id()
+        orders = get_orders_by_cart(cart_id) if cart_id else []
+        return jsonify({"success": True, "orders": [dict(order) for order in orders]})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/orders/<int:order_id>', methods=['GET'])
+def get_order(order_id):
+    """Get an order placed from this session (admins can see any order)"""
+    try:
+        order = get_order_by_id(order_id)
+        if not order or (order['cart_id'] != current_cart_id() and not is_admin_session(session)):
+            return jsonify({"success": False, "error": "Order not found"}), 404
+        return order_response(order)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Inventory routes
+@app.route('/api/admin/inventory', methods=['GET'])
+def get_inventory():
+    """Get stock levels by product id (admin only)
+
+    Query parameters: limit, after_id. `stock` is the flushed level, `pending`
+    the journaled decrements not yet applied, `available` what can be sold.
+    """
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        
+        try:
+            limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            after_id = int(request.args.get('after_id', 0))
+        except ValueError:
+            return jsonify({"success": False, "error": "limit and after_id must be integers"}), 400
+        if limit < 1:
+            return jsonify({"success": False, "error": "limit must be positive"}), 400
+        
+        rows = get_inventory_page(limit, after_id)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return json_response(encode_object(
+            success=True,
+            inventory=rows_to_json(rows),
+            next_after_id=rows[-1]['id'] if has_more else None,
+            has_more=has_more
+        ))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/inventory/<int:product_id>', methods=['PUT'])
+def update_inventory(product_id):
+    """Set a product's available stock; {"quantity": null} stops tracking it (admin only)"""
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        
+        data = request.get_json()
+        if not data or 'quantity' not in data:
+            return jsonify({"success": False, "error": "Quantity is required"}), 400
+        
+        quantity = data['quantity']
+        if quantity is not None:
+            if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 0:
+                return jsonify({"success": False, "error": "Quantity must be a non-negative integer or null"}), 400
+        
+        rows_affected = inventory.set_stock(product_id, quantity)
+        
+        if rows_affected > 0:
+            return jsonify({"success": True, "message": "Inventory updated successfully"})
+        else:
+            return jsonify({"success": False, "error": "Product not found"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/inventory/stats', methods=['GET'])
+def get_inventory_stats():
+    """Get reservation latency and flush batch statistics (admin only)"""
+    if not is_admin_session(session):
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    return jsonify({"success": True, "inventory": inventory.stats()})
+
+# Image upload routes
+@app.route('/api/upload/image', methods=['POST'])
+def upload_image():
+    """Upload one image as multipart field `image` (admin only)
+
+    The file is stored under its SHA-256; uploading the same bytes again
+    returns the existing image. Use the returned `hash` as a product's image.
+    """
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        try:
+            upload = request.files.get('image')
+        except (ImageTooLarge, TooManyImages) as e:
+            return jsonify({"success": False, "error": e.description}), 413
+        if upload is None or not upload.filename:
+            return jsonify({"success": False, "error": "An image file is required"}), 400
+        try:
+            image, created = image_store.save(upload)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        return jsonify({"success": True, "image": image_store.describe(image)}), 201 if created else 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/upload/images', methods=['POST'])
+def upload_images():
+    """Upload several images as multipart field `images` (admin only)
+
+    Each file is stored independently; files that aren't valid images are
+    reported in `errors` without failing the others.
+    """
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        try:
+            uploads = [upload for upload in request.files.getlist('images') if upload.filename]
+        except (ImageTooLarge, TooManyImages) as e:
+            return jsonify({"success": False, "error": e.description}), 413
+        if not uploads:
+            return jsonify({"success": False, "error": "At least one image file is required"}), 400
+        
+        images, errors = [], []
+        for upload in uploads:
+            try:
+                image, _ = image_store.save(upload)
+            except ValueError as e:
+                errors.append({"file": upload.filename, "error": str(e)})
+                continue
+            images.append(image_store.describe(image))
+        status = 201 if images else 400
+        return jsonify({"success": bool(images), "images": images, "errors": errors}), status
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/upload/image', methods=['DELETE'])
+def delete_image_route():
+    """Delete an image given `{imageUrl}` or `{hash}`, unless a product uses it (admin only)"""
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        data = request.get_json(silent=True) or {}
+        image_hash = parse_image_hash(data.get('hash') or data.get('imageUrl'))
+        if image_hash is None:
+            return jsonify({"success": False, "error": "imageUrl or hash is required"}), 400
+        try:
+            deleted = image_store.delete(image_hash)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 409
+        if deleted:
+            return jsonify({"success": True, "message": "Image deleted successfully"})
+        else:
+            return jsonify({"success": False, "error": "Image not found"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Job queue routes
+@app.route('/api/admin/jobs', methods=['GET'])
+def get_jobs_route():
+    """Queue depth and latency, plus the latest jobs with ?status= (default dead) (admin only)"""
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        status = request.args.get('status', 'dead')
+        if status not in ('queued', 'running', 'done', 'dead'):
+            return jsonify({"success": False, "error": "status must be queued, running, done or dead"}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({"success": False, "error": "limit must be a number"}), 400
+        return jsonify({"success": True, "stats": jobs.stats(), "jobs": [dict(job) for job in get_jobs(status, limit)]})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/jobs/<int:job_id>/retry', methods=['POST'])
+def retry_job_route(job_id):
+    """Send a dead job back to the queue (admin only)"""
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        try:
+            rows_affected = retry_dead_job(job_id, time.time())
+        except sqlite3.IntegrityError:
+            return jsonify({"success": False, "error": "An identical job is already queued"}), 409
+        if rows_affected > 0:
+            return jsonify({"success": True, "message": "Job queued"})
+        else:
+            return jsonify({"success": False, "error": "Dead job not found"}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Analytics routes
+@app.route('/api/admin/dashboard', methods=['GET'])
+def get_dashboard():
+    """Today, last 24 hours and 7/30 day totals from the analytics rollups (admin only)"""
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        return jsonify({"success": True, "dashboard": analytics.dashboard()})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/analytics', methods=['GET'])
+def get_analytics():
+    """Totals, change and series for ?period=24h|7d|30d|90d (admin only)"""
+    try:
+        if not is_admin_session(session):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        period = request.args.get('period', '30d')
+        if period not in ANALYTICS_PERIODS:
+            return jsonify({"success": False, "error": f"period must be one of {', '.join(ANALYTICS_PERIODS)}"}), 400
+        return jsonify({"success": True, "analytics": analytics.report(period)})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -303,4 +1590,6 @@ def internal_error(error):
     return jsonify({"success": False, "error": "Internal server error"}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server; use serve.py in production
+    create_app().run(debug=os.environ.get('FLASK_DEBUG', '1') == '1', host='0.0.0.0',
+                     port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
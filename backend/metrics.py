@@ -0,0 +1,211 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger('shophub.slow_queries')
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements slower than this many milliseconds are logged with their query
+# plan. Empty (the default) disables the slow-query log.
+SLOW_QUERY_MS = os.environ.get('SLOW_QUERY_MS', '')
+SLOW_QUERY_LOG_SIZE = 100
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """Yield (upper bound, cumulative count) pairs"""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        for bound, total in self.cumulative():
+            if total >= target:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.sum, 6),
+            'max_seconds': round(self.max, 6),
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'p99_seconds': self.quantile(0.99),
+        }
+
+def normalize_sql(query):
+    """Collapse whitespace and variable-length placeholder lists into one key"""
+    query = ' '.join(query.split())
+    return re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', query)
+
+class MetricsRegistry:
+    """Request and query metrics for one process"""
+
+    def __init__(self, slow_query_ms=None):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._requests = {}  # (method, endpoint, status) -> Histogram
+        self._queries = {}   # normalized SQL -> {'histogram', 'rows', 'errors'}
+        self._slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._in_flight = 0
+        self.started_at = time.time()
+
+    # Requests
+    def request_started(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def request_finished(self, method, endpoint, status, seconds):
+        key = (method, endpoint, str(status))
+        with self._lock:
+            self._in_flight -= 1
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    # Queries
+    def observe_query(self, query, params, seconds, rows, error, conn):
+        """execute_query observer: record timings and log slow statements"""
+        try:
+            key = normalize_sql(query)
+            with self._lock:
+                stats = self._queries.get(key)
+                if stats is None:
+                    stats = self._queries[key] = {'histogram': Histogram(), 'rows': 0, 'errors': 0}
+                stats['histogram'].observe(seconds)
+                stats['rows'] += rows or 0
+                if error:
+                    stats['errors'] += 1
+            if self.slow_query_ms is not None and seconds * 1000 >= self.slow_query_ms and not error:
+                self._log_slow_query(key, query, params, seconds, conn)
+        except Exception:
+            # Metrics must never break a query
+            logger.exception('Failed to record query metrics')
+
+    def _log_slow_query(self, key, query, params, seconds, conn):
+        try:
+            plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+        except Exception as e:
+            plan = [f'unavailable: {e}']
+        entry = {
+            'statement': key,
+            'duration_ms': round(seconds * 1000, 3),
+            'plan': plan,
+            'at': time.time(),
+        }
+        with self._lock:
+            self._slow_queries.append(entry)
+        logger.warning('Slow query (%.1f ms): %s | plan: %s', entry['duration_ms'], key, '; '.join(plan))
+
+    # Views
+    def snapshot(self):
+        """JSON-friendly view of every metric"""
+        with self._lock:
+            requests = [
+                {'method': method, 'endpoint': endpoint, 'status': status, **histogram.to_dict()}
+                for (method, endpoint, status), histogram in self._requests.items()
+            ]
+            queries = [
+                {'statement': statement, 'rows': stats['rows'], 'errors': stats['errors'],
+                 **stats['histogram'].to_dict()}
+                for statement, stats in self._queries.items()
+            ]
+            slow_queries = list(self._slow_queries)
+            in_flight = self._in_flight
+        requests.sort(key=lambda item: item['sum_seconds'], reverse=True)
+        queries.sort(key=lambda item: item['sum_seconds'], reverse=True)
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'requests_in_flight': in_flight,
+            'requests': requests,
+            'queries': queries,
+            'slow_queries': slow_queries,
+            'slow_query_ms': self.slow_query_ms,
+        }
+
+    def prometheus(self, gauges=None):
+        """Render every metric in the Prometheus text exposition format
+
+        `gauges` maps extra metric names to numeric values (e.g. pool stats).
+        """
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP http_request_duration_seconds HTTP request latency.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (method, endpoint, status), histogram in sorted(self._requests.items()):
+                labels = f'method="{_escape(method)}",endpoint="{_escape(endpoint)}",status="{status}"'
+                lines += _histogram_lines('http_request_duration_seconds', labels, histogram)
+
+            lines += [
+                '# HELP db_query_duration_seconds execute_query latency per SQL statement.',
+                '# TYPE db_query_duration_seconds histogram',
+            ]
+            for statement, stats in sorted(self._queries.items()):
+                labels = f'statement="{_escape(statement)}"'
+                lines += _histogram_lines('db_query_duration_seconds', labels, stats['histogram'])
+
+            lines += [
+                '# HELP db_query_rows_total Rows returned or affected per SQL statement.',
+                '# TYPE db_query_rows_total counter',
+            ]
+            lines += [f'db_query_rows_total{{statement="{_escape(statement)}"}} {stats["rows"]}'
+                      for statement, stats in sorted(self._queries.items())]
+            lines += [
+                '# HELP db_query_errors_total Failed executions per SQL statement.',
+                '# TYPE db_query_errors_total counter',
+            ]
+            lines += [f'db_query_errors_total{{statement="{_escape(statement)}"}} {stats["errors"]}'
+                      for statement, stats in sorted(self._queries.items())]
+
+            lines += [
+                '# TYPE http_requests_in_flight gauge',
+                f'http_requests_in_flight {self._in_flight}',
+            ]
+
+        for name, value in sorted((gauges or {}).items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines += [f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _histogram_lines(name, labels, histogram):
+    lines = [f'{name}_bucket{{{labels},le="{bound}"}} {total}' for bound, total in histogram.cumulative()]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+metrics = MetricsRegistry(slow_query_ms=float(SLOW_QUERY_MS) if SLOW_QUERY_MS else None)
@@ -0,0 +1,567 @@
+import os
+import sys
+import time
+import argparse
+
+# Rows read per batch while warming a table before an index build
+INDEX_BUILD_BATCH_SIZE = int(os.environ.get('DB_INDEX_BUILD_BATCH_SIZE', '20000'))
+
+# (version, name, function(migrator)), filled in by @migration in version order
+MIGRATIONS = []
+
+def migration(version, name):
+    """Register a migration; versions must be added in increasing order"""
+    def register(func):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+class SchemaOutOfDate(RuntimeError):
+    """The database is behind (or ahead of) the schema this code expects"""
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
+                       (name,)).fetchone()
+    return row is not None
+
+def current_version(conn):
+    """Highest applied migration, or 0 for a database that predates versioning"""
+    if not table_exists(conn, 'schema_version'):
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+class Migrator:
+    """What a migration function gets to change the schema with
+
+    A migration's statements run in one write transaction, opened on the
+    first statement (index builds commit separately, see create_index).
+    In dry-run mode statements are recorded instead of run.
+    """
+
+    def __init__(self, conn, dry_run=False, batch_size=INDEX_BUILD_BATCH_SIZE, log=print):
+        self.conn = conn
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.log = log
+        self.statements = []
+        self._warmed = set()
+
+    def _begin(self):
+        if not self.conn.in_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+
+    def execute(self, sql, params=()):
+        self.statements.append(' '.join(sql.split()))
+        if not self.dry_run:
+            self._begin()
+            self.conn.execute(sql, params)
+
+    def table_exists(self, name):
+        return table_exists(self.conn, name)
+
+    def index_exists(self, name):
+        row = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                                (name,)).fetchone()
+        return row is not None
+
+    def add_column(self, table, column, definition):
+        columns = [row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            self.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def create_index(self, name, table, columns, unique=False):
+        """CREATE INDEX while keeping writers blocked for as short a time as possible
+
+        SQLite builds an index in one statement under the write lock, so the
+        build itself can't be split up. What can be split up is the I/O: the
+        table is first read in rowid batches outside any transaction
+        (writers carry on between batches), which pulls it into the page
+        cache, so the locked build is mostly an in-memory sort. Each index is built and committed in its own
+        transaction rather than holding the lock for the whole migration;
+        that is safe because index builds are idempotent. Readers are never
+        blocked in WAL mode.
+        """
+        if self.index_exists(name):
+            return
+        sql = f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+        rows = self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] if self.table_exists(table) else 0
+        if self.dry_run:
+            self.statements.append(f'{sql}  -- {rows} rows')
+            return
+        if self.conn.in_transaction:
+            self.conn.commit()
+
+        warm_started = time.perf_counter()
+        if rows > self.batch_size and table not in self._warmed:
+            self._warmed.add(table)
+            last = 0
+            while True:
+                batch = self.conn.execute(
+                    f'SELECT * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last, self.batch_size)).fetchall()
+                if not batch:
+                    break
+                last = batch[-1][0]
+        warm_seconds = time.perf_counter() - warm_started
+
+        locked_started = time.perf_counter()
+        self.execute(sql)
+        self.conn.commit()
+        self.log(f"    index {name}: {rows} rows, warmed in {warm_seconds * 1000:.0f} ms, "
+                 f"locked for {(time.perf_counter() - locked_started) * 1000:.0f} ms")
+
+def ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms REAL
+        )
+    ''')
+    conn.commit()
+
+def migrate(conn, target=None, dry_run=False, log=print):
+    """Apply pending migrations up to target (default: all)
+
+    Returns [(version, name, milliseconds, statements)] for each migration
+    applied (or, with dry_run, that would be applied).
+    """
+    target = latest_version() if target is None else target
+    if not dry_run:
+        ensure_version_table(conn)
+    applied = []
+    for version, name, func in MIGRATIONS:
+        if version > target or version <= current_version(conn):
+            continue
+        migrator = Migrator(conn, dry_run=dry_run, log=log)
+        started = time.perf_counter()
+        try:
+            func(migrator)
+            if not dry_run:
+                migrator._begin()
+                # Another process may have applied it while we waited for the lock
+                if current_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                conn.execute('INSERT INTO schema_version (version, name, duration_ms) VALUES (?, ?, ?)',
+                             (version, name, round(elapsed_ms, 3)))
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        log(f"{'Would apply' if dry_run else 'Applied'} {version:04d} {name}"
+            f"{'' if dry_run else f' in {elapsed_ms:.1f} ms'}")
+        if dry_run:
+            for statement in migrator.statements:
+                log(f"    {statement}")
+        applied.append((version, name, round(elapsed_ms, 3), migrator.statements))
+    return applied
+
+def check_schema(conn):
+    """Raise SchemaOutOfDate unless the database is at exactly the latest version"""
+    version = current_version(conn)
+    if version != latest_version():
+        raise SchemaOutOfDate(
+            f"Database schema is at version {version} but this code expects {latest_version()}; "
+            f"run `python migrations.py` (or start with AUTO_MIGRATE=1)")
+    return version
+
+# Migrations. Each must be safe to run against a database created by an
+# init_database from before versioning existed, hence IF NOT EXISTS and
+# add_column everywhere.
+
+@migration(1, 'core tables')
+def core_tables(m):
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migration(2, 'product listing indexes')
+def product_listing_indexes(m):
+    # Composite indexes backing keyset pagination on /api/products
+    m.create_index('idx_products_created_at', 'products', 'created_at, id')
+    m.create_index('idx_products_price', 'products', 'price, id')
+    m.create_index('idx_products_name', 'products', 'name, id')
+
+@migration(3, 'product search')
+def product_search(m):
+    # Full-text search index over product name/description, kept in sync by triggers
+    fts_exists = m.table_exists('products_fts')
+    m.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name,
+            description,
+            content='products',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+    m.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    ''')
+    m.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    ''')
+    m.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO products_fts (rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    ''')
+    if not fts_exists:
+        # The rebuild holds the write lock while it tokenizes every product
+        # (about 6 s per million rows); it only runs when upgrading a database
+        # from before search existed.
+        # Rank with BM25, weighting name matches over description matches
+        m.execute("INSERT INTO products_fts (products_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+        # Index products that existed before the search table was added
+        m.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+@migration(4, 'carts and orders')
+def carts_and_orders(m):
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS carts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS cart_items (
+            cart_id INTEGER NOT NULL REFERENCES carts (id),
+            product_id INTEGER NOT NULL REFERENCES products (id),
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (cart_id, product_id)
+        ) WITHOUT ROWID
+    ''')
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cart_id INTEGER REFERENCES carts (id),
+            email TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL REFERENCES orders (id),
+            product_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            unit_price REAL NOT NULL,
+            quantity INTEGER NOT NULL
+        )
+    ''')
+    m.create_index('idx_orders_cart', 'orders', 'cart_id, created_at')
+    m.create_index('idx_order_items_order', 'order_items', 'order_id')
+
+@migration(5, 'inventory')
+def inventory(m):
+    m.add_column('products', 'stock', 'INTEGER')  # NULL means stock is not tracked
+    # Stock decrements committed by checkout but not yet applied to products.stock
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            order_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    m.create_index('idx_inventory_journal_product', 'inventory_journal', 'product_id, quantity')
+
+@migration(6, 'user accounts and sessions')
+def user_accounts(m):
+    # Bearer-token sessions; only a hash of each token is stored
+    m.add_column('users', 'password_hash', 'TEXT')
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS auth_sessions (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    m.create_index('idx_auth_sessions_user', 'auth_sessions', 'user_id')
+    m.create_index('idx_auth_sessions_expires', 'auth_sessions', 'expires_at')
+
+# Triggers that queue products for recommendations.py. A trigger's INSERT OR IGNORE
+# is overridden by the conflict policy of the statement that fired it, so an upsert
+# of an already queued product (bulk import) would fail; ON CONFLICT DO NOTHING holds.
+RECOMMENDATION_TRIGGERS = (
+    ('products_recommend_insert', '''
+        CREATE TRIGGER IF NOT EXISTS products_recommend_insert AFTER INSERT ON products BEGIN
+            INSERT INTO recommendation_queue (product_id) VALUES (new.id)
+            ON CONFLICT (product_id) DO NOTHING;
+        END
+    '''),
+    ('products_recommend_update', '''
+        CREATE TRIGGER IF NOT EXISTS products_recommend_update
+        AFTER UPDATE OF price, category_id, stock ON products BEGIN
+            INSERT INTO recommendation_queue (product_id) VALUES (new.id)
+            ON CONFLICT (product_id) DO NOTHING;
+        END
+    '''),
+    ('products_recommend_delete', '''
+        CREATE TRIGGER IF NOT EXISTS products_recommend_delete AFTER DELETE ON products BEGIN
+            INSERT INTO recommendation_queue (product_id) VALUES (old.id)
+            ON CONFLICT (product_id) DO NOTHING;
+        END
+    '''),
+    ('order_items_recommend_insert', '''
+        CREATE TRIGGER IF NOT EXISTS order_items_recommend_insert AFTER INSERT ON order_items BEGIN
+            INSERT INTO recommendation_queue (product_id) VALUES (new.product_id)
+            ON CONFLICT (product_id) DO NOTHING;
+        END
+    '''),
+)
+
+@migration(7, 'categories and recommendations')
+def categories_and_recommendations(m):
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    m.add_column('products', 'category_id', 'INTEGER REFERENCES categories (id)')
+    # Category browsing (newest first) and same-category price neighbours
+    m.create_index('idx_products_category', 'products', 'category_id, created_at, id')
+    m.create_index('idx_products_category_price', 'products', 'category_id, price, id')
+    # Co-purchase lookups and the featured sales window
+    m.create_index('idx_order_items_product', 'order_items', 'product_id, order_id')
+    m.create_index('idx_orders_created_at', 'orders', 'created_at')
+    
+    # Precomputed lists, rebuilt by recommendations.py
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS featured_products (
+            rank INTEGER PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            score REAL NOT NULL
+        )
+    ''')
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS product_recommendations (
+            product_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            recommended_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (product_id, rank)
+        ) WITHOUT ROWID
+    ''')
+    m.create_index('idx_product_recommendations_recommended', 'product_recommendations', 'recommended_id')
+    
+    # Products whose recommendations need recomputing, filled by triggers
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS recommendation_queue (
+            product_id INTEGER PRIMARY KEY
+        )
+    ''')
+    for name, sql in RECOMMENDATION_TRIGGERS:
+        m.execute(sql)
+    # Compute lists for the products that already exist
+    m.execute("INSERT OR IGNORE INTO recommendation_queue (product_id) SELECT id FROM products")
+
+@migration(8, 'analytics rollups')
+def analytics_rollups(m):
+    # Hourly and daily totals per metric (UTC buckets, as CURRENT_TIMESTAMP),
+    # kept current by triggers so the admin analytics never scan raw tables
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_hourly (
+            metric TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            value REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, bucket)
+        ) WITHOUT ROWID
+    ''')
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_daily (
+            metric TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            value REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, bucket)
+        ) WITHOUT ROWID
+    ''')
+    m.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_analytics_insert AFTER INSERT ON users BEGIN
+            INSERT INTO analytics_hourly (metric, bucket, value)
+            VALUES ('new_users', strftime('%Y-%m-%d %H:00:00', COALESCE(new.created_at, 'now')), 1)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value;
+            INSERT INTO analytics_daily (metric, bucket, value)
+            VALUES ('new_users', date(COALESCE(new.created_at, 'now')), 1)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value;
+        END
+    ''')
+    m.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_analytics_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO analytics_hourly (metric, bucket, value)
+            VALUES ('orders', strftime('%Y-%m-%d %H:00:00', COALESCE(new.created_at, 'now')), 1),
+                   ('revenue', strftime('%Y-%m-%d %H:00:00', COALESCE(new.created_at, 'now')), new.total)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value;
+            INSERT INTO analytics_daily (metric, bucket, value)
+            VALUES ('orders', date(COALESCE(new.created_at, 'now')), 1),
+                   ('revenue', date(COALESCE(new.created_at, 'now')), new.total)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value;
+        END
+    ''')
+    # Rows up to max_id predate the triggers; analytics.py rolls them up in
+    # batches. Recording max_id in the same transaction as the triggers means
+    # every row is counted exactly once.
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_backfill (
+            source TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            max_id INTEGER NOT NULL
+        )
+    ''')
+    m.execute("INSERT OR IGNORE INTO analytics_backfill (source, max_id) SELECT 'users', COALESCE(MAX(id), 0) FROM users")
+    m.execute("INSERT OR IGNORE INTO analytics_backfill (source, max_id) SELECT 'orders', COALESCE(MAX(id), 0) FROM orders")
+
+@migration(9, 'product images')
+def product_images(m):
+    # Uploaded images, stored on disk under their SHA-256 (see images.py)
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            hash TEXT PRIMARY KEY,
+            mimetype TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            variants TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    m.create_index('idx_images_status', 'images', 'status')
+    # A product's main image, by hash
+    m.add_column('products', 'image', 'TEXT REFERENCES images (hash)')
+    m.create_index('idx_products_image', 'products', 'image')
+
+@migration(10, 'job queue')
+def job_queue(m):
+    # Durable background jobs, claimed by jobs.py workers (lower priority runs first)
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            priority INTEGER NOT NULL DEFAULT 10,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            dedupe_key TEXT,
+            run_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            locked_until REAL,
+            last_error TEXT
+        )
+    ''')
+    # Claim order for ready jobs, and lookups by status for cleanup and metrics
+    m.create_index('idx_jobs_claim', 'jobs', 'status, priority, run_at')
+    # At most one queued job per dedupe key (e.g. one pending search optimize)
+    m.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key)
+        WHERE status = 'queued' AND dedupe_key IS NOT NULL
+    ''')
+    # Password reset tokens (hashed, like auth_sessions)
+    m.execute('''
+        CREATE TABLE IF NOT EXISTS password_resets (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    m.create_index('idx_password_resets_user', 'password_resets', 'user_id')
+
+@migration(11, 'recommendation queue triggers')
+def recommendation_queue_triggers(m):
+    # Replace the triggers created by version 7 with ON CONFLICT DO NOTHING (see RECOMMENDATION_TRIGGERS)
+    for name, sql in RECOMMENDATION_TRIGGERS:
+        m.execute(f'DROP TRIGGER IF EXISTS {name}')
+        m.execute(sql)
+
+def main(argv=None):
+    """Command line entry point: python migrations.py [--dry-run | --status]"""
+    import database
+
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--dry-run', action='store_true', help='print pending migrations without applying them')
+    parser.add_argument('--status', action='store_true', help='print the current and latest schema version')
+    parser.add_argument('--target', type=int, help='migrate up to this version (default: latest)')
+    parser.add_argument('--database', help='SQLite database file (defaults to DATABASE_PATH)')
+    args = parser.parse_args(argv)
+
+    if args.database:
+        database.DATABASE_PATH = args.database
+    conn = database.get_db_connection()
+    try:
+        version = current_version(conn)
+        if args.status:
+            print(f"Schema version {version} (latest {latest_version()})")
+            for number, name, _ in MIGRATIONS:
+                print(f"  {number:04d} {name}: {'applied' if number <= version else 'pending'}")
+            return 0 if version == latest_version() else 1
+
+        started = time.perf_counter()
+        applied = migrate(conn, target=args.target, dry_run=args.dry_run)
+        if not applied:
+            print(f"Schema is up to date (version {version})")
+        elif not args.dry_run:
+            print(f"Migrated {version} -> {current_version(conn)} in {(time.perf_counter() - started):.2f}s")
+        version = current_version(conn)
+    finally:
+        conn.close()
+    if not args.dry_run and version == latest_version():
+        # Seed the default admin and replay the inventory journal (this would
+        # also apply the migrations past --target, so only once at the latest)
+        database.init_database()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import os
+import hmac
+import base64
+import hashlib
+
+# scrypt cost parameters. Raising PASSWORD_HASH_N makes every hash slower to
+# compute (and to brute force); stored hashes with older parameters are
+# upgraded on the next successful login.
+PASSWORD_HASH_N = int(os.environ.get('PASSWORD_HASH_N', str(2 ** 14)))
+PASSWORD_HASH_R = int(os.environ.get('PASSWORD_HASH_R', '8'))
+PASSWORD_HASH_P = int(os.environ.get('PASSWORD_HASH_P', '1'))
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+HASH_SCHEME = 'scrypt'
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=HASH_BYTES)
+
+def hash_password(password):
+    """Hash a password with a random salt: 'scrypt$n$r$p$salt$hash'"""
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, PASSWORD_HASH_N, PASSWORD_HASH_R, PASSWORD_HASH_P)
+    return '$'.join([HASH_SCHEME, str(PASSWORD_HASH_N), str(PASSWORD_HASH_R), str(PASSWORD_HASH_P),
+                     _b64encode(salt), _b64encode(digest)])
+
+def is_password_hash(stored):
+    return stored.startswith(HASH_SCHEME + '$')
+
+def needs_rehash(stored):
+    """True if a stored password is plaintext or hashed with other cost parameters"""
+    if not is_password_hash(stored):
+        return True
+    _, n, r, p, _, _ = stored.split('$')
+    return (int(n), int(r), int(p)) != (PASSWORD_HASH_N, PASSWORD_HASH_R, PASSWORD_HASH_P)
+
+def verify_password(stored, password):
+    """Check a password against a stored hash (or a legacy plaintext password)
+
+    Comparisons are constant time. This is deliberately slow; see
+    auth.PasswordChecker for running it off the request thread.
+    """
+    if not is_password_hash(stored):
+        return hmac.compare_digest(stored.encode(), password.encode())
+    try:
+        _, n, r, p, salt, expected = stored.split('$')
+        digest = _scrypt(password, _b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest, _b64decode(expected))
+
+_dummy_hash = None
+
+def dummy_hash():
+    """Hash verified against when the username doesn't exist
+
+    A miss then costs as much as a wrong password and doesn't reveal which
+    usernames are valid. It is computed on first use (or by the startup
+    warm-up) rather than at import, where it would slow every worker's start.
+    """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(os.urandom(16).hex())
+    return _dummy_hash
+
+def session_stamp(stored):
+    """Short fingerprint of a stored password; sessions issued before a password change stop matching"""
+    return hashlib.sha256(stored.encode()).hexdigest()[:16]
@@ -0,0 +1,237 @@
+import os
+import time
+import sqlite3
+import threading
+
+from auth import TokenBuckets
+from database import get_pool_stats
+
+# 0 turns the per-IP and per-route limits off, e.g. for load tests sent from a few addresses
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+# Requests per client IP across the public API: a burst, refilled at a steady rate per minute
+API_RATE_BURST = float(os.environ.get('API_RATE_BURST', '120'))
+API_RATE_PER_MINUTE = float(os.environ.get('API_RATE_PER_MINUTE', '600'))
+# Tighter per-IP limits for single routes, as "METHOD rule=burst/per_minute" separated by commas;
+# rules are the Flask route patterns, e.g. GET /api/products/<int:product_id>
+API_ROUTE_LIMITS = os.environ.get('API_ROUTE_LIMITS', ','.join([
+    'POST /api/users=5/10',
+    'POST /api/auth/register=5/10',
+    'POST /api/auth/forgot-password=5/10',
+    'GET /api/products/search=60/300',
+    'POST /api/orders=10/30',
+]))
+# Clients tracked per bucket set in memory; the least recently seen are dropped beyond this
+API_RATE_TRACKER_SIZE = int(os.environ.get('API_RATE_TRACKER_SIZE', '10000'))
+# 'memory' limits each worker process on its own; 'sqlite' shares counters between the
+# processes on a host through RATE_LIMIT_DATABASE (a separate file from the main database)
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+RATE_LIMIT_DATABASE = os.environ.get('RATE_LIMIT_DATABASE', 'ratelimit.db')
+
+# Load shedding: public API requests are turned away with 503 while this process already
+# has this many in flight, or while database connections wait longer than this on average
+SHED_MAX_IN_FLIGHT = int(os.environ.get('SHED_MAX_IN_FLIGHT', '64'))
+SHED_DB_WAIT_MS = float(os.environ.get('SHED_DB_WAIT_MS', '250'))
+
+# Only these paths are limited; admin routes are authenticated and have their own login throttle
+GUARDED_PREFIX = '/api/'
+EXEMPT_PREFIXES = ('/api/admin/',)
+
+# Sliding window of the SQLite store, and how often old windows are deleted
+STORE_WINDOW = 60
+STORE_CLEANUP_INTERVAL = 60
+# Database wait times are averaged over this many seconds
+DB_WAIT_SAMPLE_INTERVAL = 1.0
+
+def is_guarded(path, method):
+    """Whether a request goes through the rate limits and load shedding"""
+    return (method != 'OPTIONS' and path.startswith(GUARDED_PREFIX)
+            and not path.startswith(EXEMPT_PREFIXES))
+
+def parse_route_limits(text):
+    """Parse API_ROUTE_LIMITS into {(method, rule): (burst, per_minute)}"""
+    limits = {}
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        route, _, limit = item.rpartition('=')
+        method, _, rule = route.strip().partition(' ')
+        burst, _, per_minute = limit.partition('/')
+        if not rule or not per_minute:
+            raise ValueError(f"Invalid API_ROUTE_LIMITS entry: {item!r}")
+        limits[(method.upper(), rule.strip())] = (float(burst), float(per_minute))
+    return limits
+
+class SQLiteCounterStore:
+    """Sliding-window request counters in a small SQLite file shared by every worker
+
+    Each key has one row per minute; a request increments the current row
+    and is allowed if it plus the overlapping part of the previous minute
+    stays within the limit. The file is separate from the main database so
+    counting requests never waits on its write lock, and it skips fsync
+    (losing counts in a crash is harmless). If the store can't be written
+    in time the request is allowed.
+    """
+
+    def __init__(self, path=RATE_LIMIT_DATABASE, window=STORE_WINDOW):
+        self.path = path
+        self.window = window
+        self._local = threading.local()
+        self._cleaned_at = 0.0
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=0.05, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL').fetchall()
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_counters (
+                    key TEXT NOT NULL,
+                    window INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (key, window)
+                ) WITHOUT ROWID
+            ''')
+            local.conn, local.pid = conn, os.getpid()
+        return local.conn
+
+    def hit(self, key, per_minute):
+        """Count a request; returns 0 if it is within the limit, else seconds to wait"""
+        now = time.time()
+        window = int(now // self.window)
+        elapsed = now - window * self.window
+        conn = self._connection()
+        count, previous = conn.execute('''
+            INSERT INTO rate_counters (key, window, count) VALUES (?1, ?2, 1)
+            ON CONFLICT (key, window) DO UPDATE SET count = count + 1
+            RETURNING count, (SELECT count FROM rate_counters WHERE key = ?1 AND window = ?2 - 1)
+        ''', (key, window)).fetchone()
+        if now - self._cleaned_at >= STORE_CLEANUP_INTERVAL:
+            self._cleaned_at = now
+            conn.execute('DELETE FROM rate_counters WHERE window < ?', (window - 1,))
+        limit = per_minute * self.window / 60
+        estimate = (previous or 0) * (1 - elapsed / self.window) + count
+        return 0 if estimate <= limit else self.window - elapsed
+
+class RateLimiter:
+    """Per-IP limits for the public API, plus tighter per-route limits
+
+    In memory each limit is a token bucket (a burst, then a steady rate);
+    with the SQLite store the per-minute rates are enforced across
+    processes as sliding windows and the bursts don't apply. A disabled
+    limiter lets every request through (load shedding still applies).
+    """
+
+    def __init__(self, burst=API_RATE_BURST, per_minute=API_RATE_PER_MINUTE, route_limits=API_ROUTE_LIMITS,
+                 store=RATE_LIMIT_STORE, enabled=RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.per_minute = per_minute
+        self.route_limits = parse_route_limits(route_limits)
+        self.store = SQLiteCounterStore() if store == 'sqlite' else None
+        self.by_ip = TokenBuckets(burst, per_minute, API_RATE_TRACKER_SIZE)
+        self.by_route = {route: TokenBuckets(route_burst, route_per_minute, API_RATE_TRACKER_SIZE)
+                         for route, (route_burst, route_per_minute) in self.route_limits.items()}
+        self._lock = threading.Lock()
+        self._stats = {'checked': 0, 'throttled_ip': 0, 'throttled_route': 0, 'store_errors': 0}
+
+    def _take(self, buckets, key, per_minute):
+        if self.store is None:
+            return buckets.take(key)
+        try:
+            return self.store.hit(key, per_minute)
+        except sqlite3.Error:
+            with self._lock:
+                self._stats['store_errors'] += 1
+            return 0
+
+    def check(self, ip, method, rule):
+        """Spend one request; returns seconds to wait (0 if the request may proceed)
+
+        `rule` is the matched Flask route pattern (None if no route matched).
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            self._stats['checked'] += 1
+        route = (method, rule)
+        buckets = self.by_route.get(route)
+        if buckets is not None:
+            wait = self._take(buckets, f'{method} {rule} {ip}', self.route_limits[route][1])
+            if wait:
+                with self._lock:
+                    self._stats['throttled_route'] += 1
+                return wait
+        wait = self._take(self.by_ip, f'ip {ip}', self.per_minute)
+        if wait:
+            with self._lock:
+                self._stats['throttled_ip'] += 1
+        return wait
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['throttled'] = stats['throttled_ip'] + stats['throttled_route']
+        stats['tracked_ips'] = len(self.by_ip)
+        stats['shared'] = self.store is not None
+        stats['enabled'] = self.enabled
+        return stats
+
+class LoadShedder:
+    """Turns requests away while this process is already over its budget
+
+    The budget is the number of guarded requests in flight and the average
+    time database connections waited for the pool over the last second. A
+    shed request costs a 503 instead of queueing behind the others, so the
+    requests already admitted keep their latency.
+    """
+
+    def __init__(self, max_in_flight=SHED_MAX_IN_FLIGHT, max_db_wait_ms=SHED_DB_WAIT_MS):
+        self.max_in_flight = max_in_flight
+        self.max_db_wait_ms = max_db_wait_ms
+        self._in_flight = 0
+        self._db_wait_ms = 0.0
+        self._sample = None  # (monotonic time, checkouts, wait_time_ms) from the pool
+        self._lock = threading.Lock()
+        self._stats = {'admitted': 0, 'shed_in_flight': 0, 'shed_db_wait': 0, 'peak_in_flight': 0}
+
+    def _recent_db_wait_ms(self, now):
+        """Average pool wait per checkout since the last sample (resampled once a second)"""
+        if self._sample is not None and now - self._sample[0] < DB_WAIT_SAMPLE_INTERVAL:
+            return self._db_wait_ms
+        pool = get_pool_stats()
+        if self._sample is not None:
+            checkouts = pool['checkouts'] - self._sample[1]
+            waited = pool['wait_time_ms'] - self._sample[2]
+            self._db_wait_ms = waited / checkouts if checkouts > 0 else 0.0
+        self._sample = (now, pool['checkouts'], pool['wait_time_ms'])
+        return self._db_wait_ms
+
+    def admit(self):
+        """Take an in-flight slot; returns False (and takes nothing) if the request should be shed"""
+        now = time.monotonic()
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self._stats['shed_in_flight'] += 1
+                return False
+            if self._recent_db_wait_ms(now) > self.max_db_wait_ms:
+                self._stats['shed_db_wait'] += 1
+                return False
+            self._in_flight += 1
+            self._stats['admitted'] += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._in_flight)
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['shed'] = stats['shed_in_flight'] + stats['shed_db_wait']
+            stats['in_flight'] = self._in_flight
+            stats['db_wait_ms'] = round(self._db_wait_ms, 3)
+        return stats
+
+rate_limiter = RateLimiter()
+load_shedder = LoadShedder()
@@ -0,0 +1,125 @@
+import os
+import time
+import atexit
+import threading
+
+from database import (claim_recommendation_queue, requeue_recommendations, get_recommending_products,
+                      refresh_recommendations, refresh_featured_products)
+
+# How often the queue of changed products is drained
+RECOMMENDATION_REFRESH_INTERVAL = float(os.environ.get('RECOMMENDATION_REFRESH_INTERVAL', '5'))
+RECOMMENDATION_BATCH_SIZE = int(os.environ.get('RECOMMENDATION_BATCH_SIZE', '200'))
+RECOMMENDATION_LIMIT = int(os.environ.get('RECOMMENDATION_LIMIT', '8'))
+# Same-category neighbours must be within this fraction of the product's price
+RECOMMENDATION_PRICE_BAND = float(os.environ.get('RECOMMENDATION_PRICE_BAND', '0.5'))
+# Co-purchases are counted over the product's most recent orders only
+RECOMMENDATION_CO_PURCHASE_ORDERS = int(os.environ.get('RECOMMENDATION_CO_PURCHASE_ORDERS', '500'))
+
+FEATURED_LIMIT = int(os.environ.get('FEATURED_LIMIT', '12'))
+FEATURED_WINDOW_DAYS = int(os.environ.get('FEATURED_WINDOW_DAYS', '30'))
+# The featured list is rebuilt after any product change, and at least this often
+FEATURED_MAX_AGE = float(os.environ.get('FEATURED_MAX_AGE', '300'))
+
+class RecommendationRefresher:
+    """Keeps featured_products and product_recommendations up to date in the background
+
+    Triggers queue every product that is added, repriced, recategorized,
+    restocked, deleted or sold. Each pass claims a batch from the queue and
+    recomputes those products' lists, plus the lists that may have to change
+    because of them (products that recommended them, and their new
+    neighbours), without queueing further work.
+    """
+
+    def __init__(self, interval=RECOMMENDATION_REFRESH_INTERVAL, batch_size=RECOMMENDATION_BATCH_SIZE,
+                 featured_max_age=FEATURED_MAX_AGE, on_refresh=None):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.featured_max_age = featured_max_age
+        self.on_refresh = on_refresh
+        self._lock = threading.Lock()
+        self._featured_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'runs': 0,
+            'products_refreshed': 0,
+            'dependents_refreshed': 0,
+            'featured_refreshes': 0,
+            'last_run_ms': None,
+            'errors': 0,
+        }
+
+    def refresh(self):
+        """Drain one batch of the queue; returns the number of product lists rebuilt"""
+        started = time.perf_counter()
+        product_ids = claim_recommendation_queue(self.batch_size)
+        dependents = set()
+        try:
+            if product_ids:
+                dependents.update(get_recommending_products(product_ids))
+                lists = refresh_recommendations(product_ids, RECOMMENDATION_LIMIT, RECOMMENDATION_PRICE_BAND,
+                                                RECOMMENDATION_CO_PURCHASE_ORDERS)
+                for recommended in lists.values():
+                    dependents.update(recommended)
+                dependents.difference_update(product_ids)
+                if dependents:
+                    refresh_recommendations(dependents, RECOMMENDATION_LIMIT, RECOMMENDATION_PRICE_BAND,
+                                            RECOMMENDATION_CO_PURCHASE_ORDERS)
+        except Exception:
+            requeue_recommendations(product_ids)
+            raise
+        
+        featured = None
+        now = time.monotonic()
+        if product_ids or self._featured_at is None or now - self._featured_at >= self.featured_max_age:
+            featured = refresh_featured_products(FEATURED_LIMIT, FEATURED_WINDOW_DAYS)
+            self._featured_at = now
+        
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['products_refreshed'] += len(product_ids)
+            self._stats['dependents_refreshed'] += len(dependents)
+            self._stats['featured_refreshes'] += featured is not None
+            self._stats['last_run_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        if self.on_refresh and (product_ids or featured is not None):
+            self.on_refresh(set(product_ids) | dependents)
+        return len(product_ids) + len(dependents)
+
+    def refresh_all(self):
+        """Drain the whole queue (e.g. after a bulk import)"""
+        total = 0
+        while True:
+            refreshed = self.refresh()
+            total += refreshed
+            if not refreshed:
+                return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                # Keep going while there is a backlog, one batch per lock acquisition
+                while self.refresh() and not self._stop.is_set():
+                    pass
+            except Exception:
+                with self._lock:
+                    self._stats['errors'] += 1
+
+    def start(self):
+        """Start the background refresh thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='recommendations', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+recommendations = RecommendationRefresher()
+atexit.register(recommendations.stop)
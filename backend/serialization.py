@@ -0,0 +1,111 @@
+import gzip
+import json
+from json.encoder import encode_basestring_ascii
+
+# Optional fast backends
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'stdlib'
+
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+class RawJSON(bytes):
+    """Already-encoded JSON that encode_object inserts verbatim"""
+
+def dumps(value):
+    """Encode a value as compact JSON bytes"""
+    if isinstance(value, RawJSON):
+        return value
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode()
+
+def _orjson_default(value):
+    # orjson has no encoding for bytes; BLOBs are sent as text, as by the row templates below
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def _encode_float(value):
+    if value != value or value in (float('inf'), float('-inf')):
+        return 'null'
+    return float.__repr__(value)
+
+# SQLite only ever returns these types
+_VALUE_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _encode_float,
+    type(None): lambda value: 'null',
+    bytes: lambda value: encode_basestring_ascii(value.decode('utf-8', 'replace')),
+}
+
+def _encode_rows(rows, columns):
+    """Encode each row as a JSON object string using a precompiled template"""
+    keys = rows[0].keys()
+    indexes = [keys.index(c) for c in columns]
+    template = '{' + ','.join(encode_basestring_ascii(c) + ':%s' for c in columns) + '}'
+    encoders = _VALUE_ENCODERS
+    return [
+        template % tuple([encoders[type(row[i])](row[i]) for i in indexes])
+        for row in rows
+    ]
+
+def rows_to_json(rows, columns=None):
+    """Encode sqlite3.Row objects as a JSON array of objects
+
+    `columns` selects and orders the keys (defaults to every column).
+    With orjson installed the rows are handed to it directly; otherwise each
+    row is formatted into a precompiled object template, so no intermediate
+    dicts are built.
+    """
+    if not rows:
+        return RawJSON(b'[]')
+    columns = list(columns or rows[0].keys())
+    if orjson is not None:
+        return RawJSON(orjson.dumps([{c: row[c] for c in columns} for row in rows], default=_orjson_default))
+    return RawJSON(('[' + ','.join(_encode_rows(rows, columns)) + ']').encode())
+
+def rows_to_ndjson(rows, columns=None):
+    """Encode sqlite3.Row objects as newline-delimited JSON (one object per line)"""
+    if not rows:
+        return b''
+    columns = list(columns or rows[0].keys())
+    if orjson is not None:
+        return b''.join([orjson.dumps({c: row[c] for c in columns}, default=_orjson_default) + b'\n' for row in rows])
+    return ('\n'.join(_encode_rows(rows, columns)) + '\n').encode()
+
+def encode_object(**fields):
+    """Encode keyword arguments as a JSON object, splicing in RawJSON values"""
+    parts = [b'"' + key.encode() + b'":' + dumps(value) for key, value in fields.items()]
+    return RawJSON(b'{' + b','.join(parts) + b'}')
+
+def compress(body, encoding, best=False):
+    """Compress a body with 'gzip' or 'br'; returns None if unavailable
+
+    best=True trades CPU for size, for bodies compressed once and served many times.
+    """
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9 if best else 6)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(body, quality=11 if best else 5)
+    return None
+
+def preferred_encoding(accept_encodings, body_size):
+    """Pick the best content encoding the client accepts, or None"""
+    if body_size < COMPRESS_MIN_SIZE:
+        return None
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
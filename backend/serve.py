@@ -0,0 +1,240 @@
+"""Production server entry point
+
+    python serve.py                   # gunicorn: pre-forked workers, each with a thread pool
+    python serve.py --server uvicorn  # uvicorn (ASGI) running the app through a2wsgi
+    python serve.py --profile-startup # report import and startup costs, then exit
+
+init_database() runs once here, before any worker starts. Settings come
+from the environment (see the README) and can be overridden on the command
+line.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import multiprocessing
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def default_options():
+    """Server settings from the environment"""
+    return {
+        'bind': os.environ.get('WEB_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}"),
+        # SQLite takes one writer at a time, so a few processes with threads
+        # beats many single-threaded processes
+        'workers': env_int('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)),
+        'threads': env_int('WEB_THREADS', 4),
+        'max_requests': env_int('WEB_MAX_REQUESTS', 10000),
+        'max_requests_jitter': env_int('WEB_MAX_REQUESTS_JITTER', 1000),
+        'graceful_timeout': env_int('WEB_GRACEFUL_TIMEOUT', 30),
+        'keepalive': env_int('WEB_KEEPALIVE', 5),
+        'timeout': env_int('WEB_TIMEOUT', 60),
+        # Import the app once in the master so forked workers start with it loaded
+        'preload': os.environ.get('WEB_PRELOAD', '1') == '1',
+    }
+
+def initialize():
+    """Migrate (or, with AUTO_MIGRATE=0, only check) the schema once, then drop the connections before forking"""
+    from database import init_database, close_pool
+    init_database(migrate=os.environ.get('AUTO_MIGRATE', '1') == '1')
+    close_pool()
+
+def shutdown_worker():
+    """Flush pending inventory and analytics, stop background threads and close connections
+
+    Run by gunicorn's worker_exit hook and by the ASGI lifespan shutdown in
+    asgi.py, once the worker's in-flight requests have finished.
+    """
+    from inventory import inventory
+    from sessions import session_store
+    from recommendations import recommendations
+    from analytics import analytics
+    from images import image_store
+    from jobs import jobs
+    from snapshot import catalog_snapshot
+    from database import close_pool
+    inventory.stop()
+    session_store.stop()
+    recommendations.stop()
+    analytics.stop()
+    image_store.stop()
+    jobs.stop()
+    catalog_snapshot.stop()
+    close_pool()
+
+def worker_exit(server, worker):
+    """gunicorn hook: see shutdown_worker"""
+    shutdown_worker()
+
+def post_fork(server, worker):
+    """gunicorn hook (preload): the app was imported in the master; set it up in the worker"""
+    from main import create_app
+    create_app(initialize_database=False)
+
+def run_gunicorn(options):
+    from gunicorn.app.base import BaseApplication
+
+    class ShopHubApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', options['bind'])
+            self.cfg.set('workers', options['workers'])
+            self.cfg.set('threads', options['threads'])
+            self.cfg.set('worker_class', 'gthread' if options['threads'] > 1 else 'sync')
+            self.cfg.set('max_requests', options['max_requests'])
+            self.cfg.set('max_requests_jitter', options['max_requests_jitter'])
+            self.cfg.set('graceful_timeout', options['graceful_timeout'])
+            self.cfg.set('keepalive', options['keepalive'])
+            self.cfg.set('timeout', options['timeout'])
+            self.cfg.set('chdir', os.getcwd())
+            self.cfg.set('worker_exit', worker_exit)
+            self.cfg.set('accesslog', os.environ.get('WEB_ACCESS_LOG'))
+            self.cfg.set('preload_app', options['preload'])
+            if options['preload']:
+                self.cfg.set('post_fork', post_fork)
+
+        def load(self):
+            if options['preload']:
+                # Runs in the master: import only, threads and connections are per worker
+                from main import app
+                return app
+            from main import create_app
+            return create_app(initialize_database=False)
+
+    initialize()
+    ShopHubApplication().run()
+
+def run_uvicorn(options):
+    import uvicorn
+
+    host, _, port = options['bind'].rpartition(':')
+    initialize()
+    uvicorn.run(
+        'asgi:application',
+        app_dir=BACKEND_DIR,
+        host=host or '0.0.0.0',
+        port=int(port),
+        workers=options['workers'],
+        limit_max_requests=options['max_requests'] or None,
+        timeout_keep_alive=options['keepalive'],
+        timeout_graceful_shutdown=options['graceful_timeout'],
+        lifespan='on',  # asgi.py flushes the worker's state on lifespan shutdown
+        access_log=bool(os.environ.get('WEB_ACCESS_LOG')),
+    )
+
+def import_times(module='main'):
+    """Per-module import times from a fresh interpreter (python -X importtime)
+
+    Returns (name, depth, self_ms, cumulative_ms) tuples in import order;
+    depth 0 is `module` itself.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return rows
+
+def profile_startup(top=15, as_json=False):
+    """Measure a worker's startup the way the server runs it, print the report and exit
+
+    Times the master's schema migration, importing the app, create_app()
+    phase by phase, the first requests and the background warm-up. Import
+    costs are broken down per module from a separate, fresh interpreter.
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    started = time.perf_counter()
+    initialize()
+    initialize_ms = (time.perf_counter() - started) * 1000
+
+    from main import app, create_app
+    from startup import startup_profile
+    create_app(initialize_database=False)
+
+    client = app.test_client()
+    requests_ms = {}
+    for path in ('/', '/api/products'):
+        started = time.perf_counter()
+        client.get(path)
+        requests_ms[f'GET {path}'] = round((time.perf_counter() - started) * 1000, 3)
+    startup_profile.wait_for('warm_up', timeout=60)
+    shutdown_worker()
+
+    modules = import_times('main')
+    direct = sorted((m for m in modules if m[1] == 1), key=lambda m: m[3], reverse=True)[:top]
+    slowest = sorted(modules, key=lambda m: m[2], reverse=True)[:top]
+    report = {
+        'initialize_ms': round(initialize_ms, 3),
+        'phases_ms': startup_profile.phases(),
+        'first_requests_ms': requests_ms,
+        'imports_by_cumulative_ms': {name: cumulative for name, _, _, cumulative in direct},
+        'imports_by_self_ms': {name: own for name, _, own, _ in slowest},
+    }
+    if as_json:
+        print(json.dumps(report, indent=2))
+        return report
+
+    phases = report['phases_ms']
+    print("Startup profile (ms; 'import', 'ready' and 'first_request' are since the app started loading)")
+    print(f"  {'initialize (master: migrations)':<36}{initialize_ms:>10.1f}")
+    for name, ms in phases.items():
+        print(f"  {name:<36}{ms:>10.1f}")
+    for name, ms in requests_ms.items():
+        print(f"  {name:<36}{ms:>10.1f}")
+    print("\nModules imported by main, by cumulative import time (ms):")
+    for name, ms in report['imports_by_cumulative_ms'].items():
+        print(f"  {name:<36}{ms:>10.1f}")
+    print("\nSlowest modules to import on their own (ms):")
+    for name, ms in report['imports_by_self_ms'].items():
+        print(f"  {name:<36}{ms:>10.1f}")
+    return report
+
+def main(argv=None):
+    options = default_options()
+    parser = argparse.ArgumentParser(description='Run the backend with a production server')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'),
+                        default=os.environ.get('WEB_SERVER', 'gunicorn'))
+    parser.add_argument('--bind', default=options['bind'], help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=options['workers'])
+    parser.add_argument('--threads', type=int, default=options['threads'],
+                        help='threads per gunicorn worker')
+    parser.add_argument('--max-requests', type=int, default=options['max_requests'],
+                        help='recycle a worker after this many requests (0 disables)')
+    parser.add_argument('--max-requests-jitter', type=int, default=options['max_requests_jitter'])
+    parser.add_argument('--graceful-timeout', type=int, default=options['graceful_timeout'])
+    parser.add_argument('--keepalive', type=int, default=options['keepalive'],
+                        help='seconds to keep idle connections open')
+    parser.add_argument('--timeout', type=int, default=options['timeout'])
+    parser.add_argument('--preload', action=argparse.BooleanOptionalAction, default=options['preload'],
+                        help='import the app in the gunicorn master before forking workers')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='report import and startup costs instead of starting a server')
+    parser.add_argument('--json', action='store_true', help='with --profile-startup, print the report as JSON')
+    args = vars(parser.parse_args(argv))
+
+    if args.pop('profile_startup'):
+        profile_startup(as_json=args['json'])
+        return
+    args.pop('json')
+    server = args.pop('server')
+    options.update(args)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    if server == 'uvicorn':
+        run_uvicorn(options)
+    else:
+        run_gunicorn(options)
+
+if __name__ == '__main__':
+    main()
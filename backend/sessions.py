@@ -0,0 +1,177 @@
+import os
+import time
+import atexit
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+
+from database import (create_session, get_session, delete_session, delete_user_sessions,
+                      delete_expired_sessions)
+
+# How long a bearer token stays valid after login
+SESSION_TTL = float(os.environ.get('SESSION_TTL', str(7 * 24 * 3600)))
+# Validated tokens kept in memory per process
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+# Unknown, revoked and expired tokens kept in memory per process, in an LRU of
+# their own so they can't push valid sessions out of the one above
+SESSION_REJECTED_CACHE_SIZE = int(os.environ.get('SESSION_REJECTED_CACHE_SIZE', '1000'))
+# How long a cached token is trusted before the database is asked again, so
+# revocations made by other worker processes take effect
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '30'))
+# Expired sessions are deleted in batches this often
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', '300'))
+SESSION_SWEEP_BATCH_SIZE = int(os.environ.get('SESSION_SWEEP_BATCH_SIZE', '500'))
+
+def hash_token(token):
+    """Tokens are stored and cached by hash, so a database leak doesn't leak live tokens"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class SessionStore:
+    """Bearer-token sessions in SQLite behind an in-process LRU
+
+    A cache hit is a dict lookup plus a hash. Rejected tokens go in a smaller
+    LRU of their own, so a client retrying a bad token doesn't hit the
+    database each time, while a stream of distinct random tokens only churns
+    that LRU and never evicts valid sessions.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, cache_size=SESSION_CACHE_SIZE, cache_ttl=SESSION_CACHE_TTL,
+                 sweep_interval=SESSION_SWEEP_INTERVAL, sweep_batch_size=SESSION_SWEEP_BATCH_SIZE,
+                 rejected_cache_size=SESSION_REJECTED_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.rejected_cache_size = rejected_cache_size
+        self.cache_ttl = cache_ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_batch_size = sweep_batch_size
+        self._cache = OrderedDict()     # token hash -> (user_id, expires_at, checked_at)
+        self._rejected = OrderedDict()  # token hash -> checked_at
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'hits': 0, 'misses': 0, 'created': 0, 'revoked': 0, 'swept': 0, 'sweeps': 0}
+
+    def _remember(self, token_hash, user_id, expires_at):
+        """Cache a token's session, or with user_id None, that the token is not valid"""
+        now = time.monotonic()
+        with self._lock:
+            if user_id is None:
+                self._cache.pop(token_hash, None)
+                cache, size, entry = self._rejected, self.rejected_cache_size, now
+            else:
+                self._rejected.pop(token_hash, None)
+                cache, size, entry = self._cache, self.cache_size, (user_id, expires_at, now)
+            cache[token_hash] = entry
+            cache.move_to_end(token_hash)
+            while len(cache) > size:
+                cache.popitem(last=False)
+
+    def create(self, user_id):
+        """Start a session; returns (token, expires_at as a Unix timestamp)"""
+        token = secrets.token_urlsafe(32)
+        token_hash = hash_token(token)
+        expires_at = time.time() + self.ttl
+        create_session(token_hash, user_id, expires_at)
+        self._remember(token_hash, user_id, expires_at)
+        with self._lock:
+            self._stats['created'] += 1
+        return token, expires_at
+
+    def validate(self, token):
+        """Return the user_id a token belongs to, or None if it is unknown, revoked or expired"""
+        token_hash = hash_token(token)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(token_hash)
+            if cached is not None and now - cached[2] < self.cache_ttl:
+                self._cache.move_to_end(token_hash)
+                self._stats['hits'] += 1
+                user_id, expires_at, _ = cached
+                return user_id if expires_at > time.time() else None
+            rejected_at = self._rejected.get(token_hash)
+            if rejected_at is not None and now - rejected_at < self.cache_ttl:
+                self._rejected.move_to_end(token_hash)
+                self._stats['hits'] += 1
+                return None
+            self._stats['misses'] += 1
+
+        row = get_session(token_hash)
+        if row is None or row['expires_at'] <= time.time():
+            self._remember(token_hash, None, 0)
+            return None
+        self._remember(token_hash, row['user_id'], row['expires_at'])
+        return row['user_id']
+
+    def revoke(self, token):
+        """End one session"""
+        token_hash = hash_token(token)
+        delete_session(token_hash)
+        self._remember(token_hash, None, 0)
+        with self._lock:
+            self._stats['revoked'] += 1
+
+    def revoke_all(self, user_id, keep_token=None):
+        """End every session of a user (except keep_token); returns the number ended"""
+        keep_hash = hash_token(keep_token) if keep_token else None
+        deleted = delete_user_sessions(user_id, keep_hash)
+        self.forget_user(user_id, keep_hash)
+        with self._lock:
+            self._stats['revoked'] += deleted
+        return deleted
+
+    def forget_user(self, user_id, keep_token_hash=None):
+        """Drop a user's cached tokens so the next check goes to the database"""
+        with self._lock:
+            for token_hash in [h for h, entry in self._cache.items()
+                               if entry[0] == user_id and h != keep_token_hash]:
+                del self._cache[token_hash]
+
+    def sweep(self):
+        """Delete expired sessions in batches; returns the number deleted"""
+        now = time.time()
+        total = 0
+        while True:
+            deleted = delete_expired_sessions(now, self.sweep_batch_size)
+            total += deleted
+            if deleted < self.sweep_batch_size:
+                break
+        with self._lock:
+            for token_hash in [h for h, entry in self._cache.items() if entry[1] <= now]:
+                del self._cache[token_hash]
+            checked_before = time.monotonic() - self.cache_ttl
+            for token_hash in [h for h, checked_at in self._rejected.items() if checked_at <= checked_before]:
+                del self._rejected[token_hash]
+            self._stats['swept'] += total
+            self._stats['sweeps'] += 1
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                pass  # Expired rows are already rejected by validate; try again next interval
+
+    def start(self):
+        """Start the background sweep thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='session-sweep', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached'] = len(self._cache)
+            stats['cached_rejected'] = len(self._rejected)
+        return stats
+
+session_store = SessionStore()
+atexit.register(session_store.stop)
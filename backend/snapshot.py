@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import time
+import atexit
+import sqlite3
+import argparse
+import threading
+from urllib.parse import quote
+
+import database
+from database import reading_from, STATEMENT_CACHE_SIZE
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process publishes on its own schedule
+    fcntl = None
+
+# Serve catalog reads from a published snapshot instead of the live database
+CATALOG_SNAPSHOT = os.environ.get('CATALOG_SNAPSHOT', '0') == '1'
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', 'catalog-snapshot.db')
+# How often a new snapshot is published
+CATALOG_SNAPSHOT_INTERVAL = float(os.environ.get('CATALOG_SNAPSHOT_INTERVAL', '10'))
+# Older snapshots are not read from; reads go to the live database until the next one
+CATALOG_SNAPSHOT_MAX_STALENESS = float(os.environ.get('CATALOG_SNAPSHOT_MAX_STALENESS', '60'))
+CATALOG_SNAPSHOT_MMAP_SIZE = int(os.environ.get('CATALOG_SNAPSHOT_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+# Tables copied into the snapshot: everything the cached catalog routes read
+SNAPSHOT_TABLES = ('products', 'categories', 'featured_products', 'product_recommendations')
+
+# How often a process looks for a newly published snapshot file
+SNAPSHOT_CHECK_INTERVAL = 1.0
+
+class CatalogSnapshot:
+    """Read-only copy of the catalog tables that catalog reads are served from
+
+    A publisher copies SNAPSHOT_TABLES (with their indexes) into an
+    in-memory database inside one read transaction, so the copy is
+    consistent, writes it out with the SQLite backup API and renames it over
+    the previous snapshot. Readers open the file with immutable=1, which
+    skips locking and change detection entirely, and map it into memory; a
+    rename swaps every process to the new file on its next read while
+    queries already running finish on the old one.
+
+    Reads fall back to the live database when the snapshot is older than
+    max_staleness, or older than the last catalog write. Writes are recorded
+    by mark_changed() as the mtime of a marker file next to the snapshot, so
+    every process honours them, not just the one that made the write.
+    """
+
+    def __init__(self, path=CATALOG_SNAPSHOT_PATH, interval=CATALOG_SNAPSHOT_INTERVAL,
+                 max_staleness=CATALOG_SNAPSHOT_MAX_STALENESS, mmap_size=CATALOG_SNAPSHOT_MMAP_SIZE,
+                 enabled=CATALOG_SNAPSHOT):
+        self.path = path
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.mmap_size = mmap_size
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = set()
+        self._current = None  # (identity, taken_at, size) of the published file
+        self._changed_at = 0.0  # last catalog write recorded by any process
+        self._checked_at = float('-inf')
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'published': 0,
+            'publish_errors': 0,
+            'publish_ms': None,
+            'snapshot_reads': 0,
+            'stale_reads': 0,
+            'fresh_reads': 0,
+            'missing_reads': 0,
+            'reopened': 0,
+        }
+
+    # Publishing
+    def publish(self):
+        """Copy the catalog tables from the live database into a new snapshot; returns its age"""
+        started = time.perf_counter()
+        partial = f'{self.path}.{os.getpid()}.tmp'
+        memory = sqlite3.connect(':memory:', isolation_level=None)
+        try:
+            memory.execute('ATTACH DATABASE ? AS live', (database.DATABASE_PATH,))
+            memory.execute(f"PRAGMA busy_timeout = {database.SQLITE_PRAGMAS['busy_timeout']}")
+            placeholders = ','.join('?' * len(SNAPSHOT_TABLES))
+            memory.execute('BEGIN')
+            taken_at = time.time()
+            schema = memory.execute(f"""
+                SELECT type, name, sql FROM live.sqlite_master
+                WHERE type IN ('table', 'index') AND tbl_name IN ({placeholders}) AND sql IS NOT NULL
+            """, SNAPSHOT_TABLES).fetchall()
+            tables = [(name, sql) for kind, name, sql in schema if kind == 'table']
+            for name, sql in tables:
+                memory.execute(sql)
+                memory.execute(f'INSERT INTO main."{name}" SELECT * FROM live."{name}"')
+            # Indexes are cheaper to build once the rows are in
+            for kind, name, sql in schema:
+                if kind == 'index':
+                    memory.execute(sql)
+            memory.execute('COMMIT')
+            memory.execute('DETACH DATABASE live')
+
+            target = sqlite3.connect(partial)
+            try:
+                memory.backup(target)
+            finally:
+                target.close()
+            # The file's mtime records when the copy was taken; readers get it from one stat()
+            os.utime(partial, (taken_at, taken_at))
+            os.replace(partial, self.path)
+        except Exception:
+            with self._lock:
+                self._stats['publish_errors'] += 1
+            try:
+                os.remove(partial)
+            except FileNotFoundError:
+                pass
+            raise
+        finally:
+            memory.close()
+        with self._lock:
+            self._stats['published'] += 1
+            self._stats['publish_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            self._checked_at = float('-inf')
+        return time.time() - taken_at
+
+    def publish_if_due(self):
+        """Publish unless another process did within the interval; returns True if this one did"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(f'{self.path}.lock', 'a')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False  # another worker is publishing right now
+            current = self._published(refresh=True)
+            if current is not None and time.time() - current[1] < self.interval / 2:
+                return False
+            self.publish()
+            return True
+        finally:
+            lock_file.close()
+
+    # Writes
+    def mark_changed(self, changed_at):
+        """Record a catalog write made at changed_at, so no process serves an older snapshot"""
+        if not self.enabled:
+            return
+        marker = f'{self.path}.changed'
+        try:
+            with open(marker, 'a'):
+                pass
+            # Never move the mark back if another process recorded a later write meanwhile
+            if os.stat(marker).st_mtime < changed_at:
+                os.utime(marker, (changed_at, changed_at))
+        except OSError:
+            pass  # other processes fall back once the snapshot is older than max_staleness
+
+    # Reading
+    def _published(self, refresh=False):
+        """(identity, taken_at, size) of the published snapshot file, or None
+
+        The write marker is checked at the same time.
+        """
+        with self._lock:
+            if refresh or time.monotonic() - self._checked_at >= SNAPSHOT_CHECK_INTERVAL:
+                try:
+                    st = os.stat(self.path)
+                except FileNotFoundError:
+                    self._current = None
+                else:
+                    self._current = ((st.st_ino, st.st_mtime_ns), st.st_mtime, st.st_size)
+                try:
+                    self._changed_at = os.stat(f'{self.path}.changed').st_mtime
+                except FileNotFoundError:
+                    self._changed_at = 0.0
+                self._checked_at = time.monotonic()
+            return self._current
+
+    def _open(self):
+        uri = f"file:{quote(os.path.abspath(self.path))}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA mmap_size = {self.mmap_size}').fetchall()
+        return conn
+
+    def connection(self, not_before=None):
+        """This thread's connection to the current snapshot, or None to read from the live database
+
+        `not_before` is the time of the last write the caller must see; writes
+        marked by other processes are honoured as well.
+        """
+        if not self.enabled:
+            return None
+        current = self._published()
+        not_before = max(not_before or 0.0, self._changed_at)
+        if current is None:
+            outcome = 'missing_reads'
+        elif time.time() - current[1] > self.max_staleness:
+            outcome = 'stale_reads'
+        elif current[1] < not_before:
+            outcome = 'fresh_reads'
+        else:
+            outcome = 'snapshot_reads'
+        if outcome != 'snapshot_reads':
+            with self._lock:
+                self._stats[outcome] += 1
+            return None
+
+        local = self._local
+        if getattr(local, 'identity', None) != current[0]:
+            if getattr(local, 'conn', None) is not None:
+                self._close(local.conn)
+            local.conn = self._open()
+            local.identity = current[0]
+            with self._lock:
+                self._connections.add(local.conn)
+                self._stats['reopened'] += 1
+        with self._lock:
+            self._stats['snapshot_reads'] += 1
+        return local.conn
+
+    def reads(self, not_before=None):
+        """Context manager sending execute_query reads to the snapshot when it is usable"""
+        return reading_from(self.connection(not_before))
+
+    def _close(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+        conn.close()
+
+    # Background publisher
+    def _run(self):
+        while True:
+            try:
+                self.publish_if_due()
+            except Exception:
+                pass  # counted in publish_errors; readers fall back once the snapshot is stale
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        """Start publishing snapshots in the background (idempotent; does nothing when disabled)"""
+        if not self.enabled:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='catalog-snapshot', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            conn.close()
+
+    def stats(self):
+        """Publish/read counters and the age (lag) of the current snapshot"""
+        current = self._published() if self.enabled else None
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['lag_seconds'] = round(time.time() - current[1], 3) if current else None
+        stats['size_bytes'] = current[2] if current else 0
+        return stats
+
+catalog_snapshot = CatalogSnapshot()
+atexit.register(catalog_snapshot.stop)
+
+def main(argv=None):
+    """Command line entry point: python snapshot.py [--output catalog-snapshot.db]"""
+    parser = argparse.ArgumentParser(description='Publish a read-only snapshot of the catalog tables')
+    parser.add_argument('--output', default=CATALOG_SNAPSHOT_PATH, help='snapshot file to (re)place')
+    parser.add_argument('--database', help='SQLite database file (defaults to DATABASE_PATH)')
+    args = parser.parse_args(argv)
+
+    if args.database:
+        database.DATABASE_PATH = args.database
+    database.verify_schema()
+
+    snapshot = CatalogSnapshot(path=args.output, enabled=True)
+    snapshot.publish()
+    print(json.dumps(snapshot.stats(), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# perf_counter() when this module was first imported. main.py imports it
+# before anything else, so time measured from here includes loading the app.
+PROCESS_STARTED = time.perf_counter()
+
+class StartupProfile:
+    """Wall-clock timings (ms) of this process's startup phases
+
+    create_app() records its phases here, the warm-up thread adds its own
+    and the first request marks time-to-first-request. Each phase is
+    recorded once; /metrics exposes them as startup_<phase>_ms.
+    """
+
+    def __init__(self, started=PROCESS_STARTED):
+        self.started = started
+        self._phases = {}
+        self._cond = threading.Condition()
+
+    def record(self, name, ms):
+        with self._cond:
+            self._phases.setdefault(name, round(ms, 3))
+            self._cond.notify_all()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the block as phase `name`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def mark(self, name):
+        """Record the time since the process started loading the app as phase `name`"""
+        self.record(name, (time.perf_counter() - self.started) * 1000)
+
+    def first_request(self):
+        """Called by every request; only the first one is recorded"""
+        if 'first_request' not in self._phases:
+            self.mark('first_request')
+
+    def wait_for(self, name, timeout=None):
+        """Block until phase `name` has been recorded; returns its time or None on timeout"""
+        with self._cond:
+            self._cond.wait_for(lambda: name in self._phases, timeout=timeout)
+            return self._phases.get(name)
+
+    def phases(self):
+        with self._cond:
+            return dict(self._phases)
+
+    def stats(self):
+        return {f'{name}_ms': ms for name, ms in self.phases().items()}
+
+startup_profile = StartupProfile()
@@ -0,0 +1,146 @@
+import os
+import re
+import mimetypes
+import threading
+from collections import namedtuple
+
+from cache import make_etag
+from serialization import compress, brotli, COMPRESS_MIN_SIZE
+
+# Cache lifetime for static files whose names are not content hashed (e.g. logo.png)
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', '3600'))
+# Content-hashed files never change under the same name
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Files larger than this are streamed from disk instead of held in memory
+STATIC_INLINE_MAX_SIZE = int(os.environ.get('STATIC_INLINE_MAX_SIZE', str(1024 * 1024)))
+
+# Vite/Rollup output names: <name>-<8 char hash>.<ext>, e.g. index-CAKtsD4_.js.
+# The hash must contain an upper case letter or digit so words like
+# "-products.png" are not mistaken for one.
+HASHED_NAME = re.compile(r'-(?=[A-Za-z0-9_-]*[A-Z0-9])[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/manifest+json', 'application/xml')
+
+# Most preferred first
+ENCODINGS = ('br', 'gzip')
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# `body` is None for files too large to keep in memory; they are sent from `path`
+StaticAsset = namedtuple('StaticAsset', ['path', 'body', 'mimetype', 'etag', 'cache_control', 'variants'])
+
+def is_hashed_name(filename):
+    """True if a file name carries a content hash (safe to cache forever)"""
+    return HASHED_NAME.search(filename) is not None
+
+def is_compressible(mimetype):
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+def build_variants(path, body, mimetype):
+    """Compressed copies of a body: prebuilt .br/.gz files next to it, else compressed now"""
+    variants = {}
+    if body is None or len(body) < COMPRESS_MIN_SIZE or not is_compressible(mimetype):
+        return variants
+    for encoding in ENCODINGS:
+        prebuilt = path + ENCODING_SUFFIXES[encoding]
+        if os.path.isfile(prebuilt):
+            with open(prebuilt, 'rb') as f:
+                compressed = f.read()
+        else:
+            compressed = compress(body, encoding, best=True)
+        # Keep a variant only if it actually saves bytes
+        if compressed is not None and len(compressed) < len(body):
+            variants[encoding] = compressed
+    return variants
+
+def load_asset(path, cache_control, mimetype=None, precompress=True):
+    """Read a file into a StaticAsset with its ETag and (unless precompress=False) compressed variants"""
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if os.path.getsize(path) > STATIC_INLINE_MAX_SIZE:
+        stat = os.stat(path)
+        etag = make_etag(f'{stat.st_size}-{stat.st_mtime_ns}'.encode())
+        return StaticAsset(path, None, mimetype, etag, cache_control, {})
+    with open(path, 'rb') as f:
+        body = f.read()
+    return StaticAsset(path, body, mimetype, make_etag(body), cache_control,
+                       build_variants(path, body, mimetype) if precompress else {})
+
+class StaticManifest:
+    """Every file under the static folder, loaded once at startup
+
+    Lookups are a dict get, so requests never touch the filesystem (except
+    for files above STATIC_INLINE_MAX_SIZE, which are streamed from disk).
+    """
+
+    def __init__(self):
+        self._assets = {}
+        self._lock = threading.Lock()
+        self.index = None
+        self.static_folder = None
+
+    def build(self, static_folder, index_html=None, precompress=True):
+        """Scan static_folder and cache index_html (the rendered SPA shell)
+
+        Compressing the assets is most of the cost; with precompress=False
+        they are served uncompressed until compress_variants() has run.
+        """
+        assets = {}
+        if os.path.isdir(static_folder):
+            for root, _, files in os.walk(static_folder):
+                for name in files:
+                    if name.endswith(tuple(ENCODING_SUFFIXES.values())):
+                        continue  # precompressed variants are loaded with their source file
+                    path = os.path.join(root, name)
+                    relative = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                    if is_hashed_name(name):
+                        cache_control = IMMUTABLE_CACHE_CONTROL
+                    else:
+                        cache_control = f'public, max-age={STATIC_MAX_AGE}'
+                    assets[relative] = load_asset(path, cache_control, precompress=precompress)
+
+        index = None
+        if index_html is not None:
+            body = index_html.encode() if isinstance(index_html, str) else index_html
+            # The shell names the current bundle, so browsers must revalidate it
+            index = StaticAsset(None, body, 'text/html', make_etag(body), 'no-cache',
+                                build_variants('', body, 'text/html') if precompress else {})
+
+        with self._lock:
+            self._assets = assets
+            self.index = index
+            self.static_folder = static_folder
+
+    def compress_variants(self):
+        """Fill in the compressed variants skipped by build(precompress=False)"""
+        with self._lock:
+            assets = list(self._assets.values())
+            if self.index is not None:
+                assets.append(self.index)
+        for asset in assets:
+            if not asset.variants:
+                # Requests check for an encoding before reading it, so adding one is safe
+                asset.variants.update(build_variants(asset.path or '', asset.body, asset.mimetype))
+
+    def get(self, relative_path):
+        """Return the asset for a path relative to the static folder, or None"""
+        return self._assets.get(relative_path)
+
+    def stats(self):
+        """Return file counts and bytes held in memory"""
+        with self._lock:
+            assets = list(self._assets.values())
+            index = self.index
+        files = len(assets)
+        if index is not None:
+            assets.append(index)
+        return {
+            'files': files,
+            'immutable': sum(1 for a in assets if a.cache_control == IMMUTABLE_CACHE_CONTROL),
+            'streamed_from_disk': sum(1 for a in assets if a.body is None),
+            'bytes': sum(len(a.body) for a in assets if a.body is not None),
+            'compressed_bytes': sum(len(v) for a in assets for v in a.variants.values()),
+            'brotli': brotli is not None,
+        }
+
+static_manifest = StaticManifest()
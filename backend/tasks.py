@@ -0,0 +1,76 @@
+import os
+import time
+import logging
+import secrets
+import smtplib
+from email.message import EmailMessage
+
+from database import get_order_by_id, get_order_items, get_user_by_id, create_password_reset, optimize_search_index
+from jobs import job_handler
+from sessions import hash_token
+
+logger = logging.getLogger('shophub.mail')
+
+# Without SMTP_HOST, mail is logged (recipient and subject) instead of being sent
+SMTP_HOST = os.environ.get('SMTP_HOST')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_USER = os.environ.get('SMTP_USER')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') == '1'
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', '10'))
+MAIL_FROM = os.environ.get('MAIL_FROM', 'ShopHub <no-reply@shophub.local>')
+# Development only: also log the body of unsent mail, which includes password reset links
+MAIL_LOG_BODY = os.environ.get('MAIL_LOG_BODY', '0') == '1'
+
+# How long a password reset link works, and where it points ({token} is filled in)
+PASSWORD_RESET_TTL = float(os.environ.get('PASSWORD_RESET_TTL', '3600'))
+PASSWORD_RESET_URL = os.environ.get('PASSWORD_RESET_URL', 'http://localhost:5000/reset-password?token={token}')
+
+def send_mail(to, subject, body):
+    """Send a plain-text email; raises on SMTP errors so the job is retried"""
+    message = EmailMessage()
+    message['From'] = MAIL_FROM
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(body)
+    if not SMTP_HOST:
+        if MAIL_LOG_BODY:
+            logger.info('Mail to %s (SMTP_HOST not set, not sent): %s\n%s', to, subject, body)
+        else:
+            logger.info('Mail to %s (SMTP_HOST not set, not sent): %s', to, subject)
+        return
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as smtp:
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD or '')
+        smtp.send_message(message)
+
+@job_handler('order_confirmation')
+def send_order_confirmation(order_id):
+    order = get_order_by_id(order_id)
+    if order is None or not order['email']:
+        return
+    lines = [f"{item['quantity']} x {item['name']} @ {item['unit_price']:.2f}" for item in get_order_items(order_id)]
+    body = '\n'.join([f"Thank you for your order #{order_id}.", ''] + lines +
+                     ['', f"Total: {order['total']:.2f}"])
+    send_mail(order['email'], f"Your ShopHub order #{order_id}", body)
+
+@job_handler('password_reset')
+def send_password_reset(user_id):
+    """Create a reset token and mail the link; the token only ever exists in the mail"""
+    user = get_user_by_id(user_id)
+    if user is None:
+        return
+    token = secrets.token_urlsafe(32)
+    create_password_reset(hash_token(token), user_id, time.time() + PASSWORD_RESET_TTL)
+    body = (f"Someone asked to reset the password of your ShopHub account.\n\n"
+            f"Open this link within {int(PASSWORD_RESET_TTL // 60)} minutes to choose a new one:\n"
+            f"{PASSWORD_RESET_URL.format(token=token)}\n\n"
+            f"If it wasn't you, ignore this email.")
+    send_mail(user['email'], "Reset your ShopHub password", body)
+
+@job_handler('search_optimize')
+def optimize_search():
+    """Merge the search index after product writes (debounced through a dedupe key)"""
+    optimize_search_index()
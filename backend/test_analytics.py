@@ -0,0 +1,116 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import analytics
+from analytics import AnalyticsRollups
+from database import get_pool, execute_query, reset_analytics, create_cart, add_cart_item, checkout_cart
+
+# Reports are taken at a fixed moment long before anything else in the test
+# database was created, so their windows only hold the rows inserted here
+NOW = datetime(2020, 3, 10, 12, 30, tzinfo=timezone.utc)
+
+def insert_user(created_at):
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO users (name, email, created_at) VALUES (?, ?, ?)",
+                     ('Analytics user', f'analytics-{time.time_ns()}@example.com', created_at))
+        conn.commit()
+
+def insert_order(total, created_at):
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO orders (email, total, created_at) VALUES (?, ?, ?)",
+                     ('buyer@example.com', total, created_at))
+        conn.commit()
+
+@pytest.fixture(scope='module')
+def history(app):
+    """Users and orders in the week up to NOW and the week before it"""
+    insert_user('2020-03-10 12:05:00')
+    insert_user('2020-03-10 09:59:59')
+    insert_user('2020-03-01 08:00:00')
+    insert_order(30, '2020-03-10 12:10:00')
+    insert_order(10, '2020-03-08 23:59:59')
+    insert_order(20, '2020-03-02 00:00:00')
+
+def test_daily_report(history):
+    report = AnalyticsRollups().report('7d', NOW)
+    assert (report['start'], report['end']) == ('2020-03-04', '2020-03-10')
+    assert report['totals'] == {'new_users': 2, 'orders': 2, 'revenue': 40, 'average_order_value': 20}
+    assert report['previous'] == {'new_users': 1, 'orders': 1, 'revenue': 20, 'average_order_value': 20}
+    assert report['change_percent'] == {'new_users': 100.0, 'orders': 100.0, 'revenue': 100.0,
+                                        'average_order_value': 0.0}
+    # One bucket per day, including the empty ones
+    assert [point['bucket'] for point in report['series']] == [f'2020-03-{day:02d}' for day in range(4, 11)]
+    assert report['series'][-1] == {'bucket': '2020-03-10', 'new_users': 2, 'orders': 1, 'revenue': 30,
+                                    'average_order_value': 30}
+    assert report['series'][-2]['orders'] == 0
+
+def test_hourly_report(history):
+    report = AnalyticsRollups().report('24h', NOW)
+    assert (report['start'], report['end']) == ('2020-03-09 13:00:00', '2020-03-10 12:00:00')
+    assert len(report['series']) == 24
+    assert (report['totals']['new_users'], report['totals']['orders']) == (2, 1)
+    assert report['previous']['revenue'] == 10  # 2020-03-08 23:59:59 is in the previous 24 hours
+    assert report['change_percent']['new_users'] is None  # nothing to compare against
+    assert report['change_percent']['revenue'] == 200.0
+
+def test_rebuild_matches_the_triggers(history):
+    before = AnalyticsRollups().report('7d', NOW)
+    rollups = AnalyticsRollups(batch_size=2)
+    assert rollups.rebuild() > 0
+    assert rollups.stats()['backfill_batches'] > 1
+    assert rollups.report('7d', NOW) == before
+
+def test_interrupted_backfill_resumes(history):
+    before = AnalyticsRollups().report('7d', NOW)
+    reset_analytics()
+    rollups = AnalyticsRollups(batch_size=1)
+    rollups.backfill(max_batches=1)
+    assert rollups.backfill_pending()
+    assert not rollups.report('7d', NOW)['complete']
+    rollups.backfill()
+    assert not rollups.backfill_pending()
+    assert rollups.report('7d', NOW) == before
+
+def test_prune_keeps_daily_buckets(app):
+    insert_user('2020-01-05 10:00:00')
+    rollups = AnalyticsRollups(hourly_retention_days=14)
+    assert rollups.prune(NOW) >= 1
+    hourly = execute_query("SELECT COUNT(*) FROM analytics_hourly WHERE bucket = '2020-01-05 10:00:00'", fetch='one')
+    daily = execute_query("SELECT value FROM analytics_daily WHERE metric = 'new_users' AND bucket = '2020-01-05'",
+                          fetch='one')
+    assert hourly[0] == 0
+    assert daily[0] >= 1
+    # Buckets inside the retention window are left alone
+    assert rollups.report('24h', NOW)['totals']['new_users'] == 2
+    assert rollups.stats()['pruned_buckets'] >= 1
+
+def test_analytics_routes(client, admin_client):
+    assert client.get('/api/admin/analytics').status_code == 401
+    assert client.get('/api/admin/dashboard').status_code == 401
+    assert admin_client.get('/api/admin/analytics?period=1y').status_code == 400
+
+    report = admin_client.get('/api/admin/analytics?period=30d').get_json()['analytics']
+    assert report['granularity'] == 'day'
+    assert len(report['series']) == 30
+    dashboard = admin_client.get('/api/admin/dashboard').get_json()['dashboard']
+    assert set(dashboard) == {'today', 'last_24h', 'last_7d', 'last_30d', 'complete'}
+    assert len(dashboard['last_24h']['series']) == 24
+
+def test_new_orders_show_up_today(admin_client, make_product):
+    before = admin_client.get('/api/admin/dashboard').get_json()['dashboard']['today']
+    cart_id = create_cart()
+    add_cart_item(cart_id, make_product('Dashboard lamp', 12.5), 2)
+    checkout_cart(cart_id)
+    today = admin_client.get('/api/admin/dashboard').get_json()['dashboard']['today']
+    assert today['orders'] == before['orders'] + 1
+    assert today['revenue'] == pytest.approx(before['revenue'] + 25)
+
+def test_command_line(cli_database, capsys):
+    assert analytics.main(['--rebuild', '--report', '7d', '--batch-size', '1', '--database', cli_database]) == 0
+    out = capsys.readouterr().out
+    assert out.startswith('Rolled up ')
+    assert '"period": "7d"' in out
+    with pytest.raises(SystemExit):
+        analytics.main(['--batch-size', '0', '--database', cli_database])
@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+import main
+import passwords
+from auth import TokenBuckets, LoginThrottle, PasswordChecker, AuthBusy
+from database import authenticate_admin, create_admin, get_admin_by_id, update_admin_password, execute_query
+from passwords import hash_password, verify_password, needs_rehash, is_password_hash
+
+def test_hash_and_verify():
+    stored = hash_password('correct horse')
+    assert is_password_hash(stored)
+    assert verify_password(stored, 'correct horse')
+    assert not verify_password(stored, 'wrong horse')
+    assert hash_password('correct horse') != stored  # salted
+    assert not verify_password('scrypt$garbage', 'x')
+
+def test_legacy_plaintext_passwords():
+    assert verify_password('admin123', 'admin123')
+    assert not verify_password('admin123', 'admin124')
+    assert needs_rehash('admin123')
+
+def test_changed_cost_needs_rehash(monkeypatch):
+    stored = hash_password('pw')
+    assert not needs_rehash(stored)
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_N', passwords.PASSWORD_HASH_N * 2)
+    assert needs_rehash(stored)
+    assert verify_password(stored, 'pw')  # old parameters still verify
+
+def test_plaintext_admin_password_is_rehashed_on_login(app):
+    create_admin('legacy-admin', 'legacy-pw', 'legacy@example.com')
+    admin_id = execute_query("SELECT id FROM admins WHERE username = 'legacy-admin'", fetch='one')[0]
+    assert authenticate_admin('legacy-admin', 'nope') is None
+    admin = authenticate_admin('legacy-admin', 'legacy-pw')
+    assert admin['id'] == admin_id
+    assert is_password_hash(get_admin_by_id(admin_id)['password'])
+    assert authenticate_admin('legacy-admin', 'legacy-pw')['id'] == admin_id
+    assert authenticate_admin('nobody', 'legacy-pw') is None
+
+def test_token_bucket(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('auth.time.monotonic', lambda: now[0])
+    buckets = TokenBuckets(burst=2, per_minute=60)
+    assert buckets.take('a') == buckets.take('a') == 0
+    assert buckets.take('a') == pytest.approx(1.0)
+    assert buckets.take('b') == 0  # buckets are per key
+    now[0] += 1
+    assert buckets.take('a') == 0
+
+def test_token_buckets_are_bounded():
+    buckets = TokenBuckets(burst=1, per_minute=1, max_keys=2)
+    for key in 'abc':
+        buckets.take(key)
+    assert len(buckets) == 2
+    assert buckets.take('a') == 0  # forgotten, so it starts full again
+
+def test_login_throttle_by_user_and_ip():
+    throttle = LoginThrottle()
+    throttle.by_ip = TokenBuckets(burst=3, per_minute=1)
+    throttle.by_user = TokenBuckets(burst=1, per_minute=1)
+    assert throttle.check('1.1.1.1', 'Alice') == 0
+    assert throttle.check('1.1.1.1', 'alice') > 0  # usernames are case-insensitive
+    throttle.record('1.1.1.1', 'alice', success=True)  # a success resets the user's bucket
+    assert throttle.check('1.1.1.1', 'alice') == 0
+    assert throttle.check('1.1.1.1', 'bob') > 0  # the address is out of attempts
+    stats = throttle.stats()
+    assert (stats['attempts'], stats['throttled_ip'], stats['throttled_user']) == (4, 1, 1)
+
+@pytest.fixture
+def strict_throttle(monkeypatch):
+    throttle = LoginThrottle()
+    throttle.by_ip = TokenBuckets(burst=100, per_minute=1)
+    throttle.by_user = TokenBuckets(burst=2, per_minute=1)
+    monkeypatch.setattr(main, 'login_throttle', throttle)
+    return throttle
+
+def test_admin_login_is_throttled(client, strict_throttle):
+    for _ in range(2):
+        response = client.post('/api/admin/login', json={'username': 'admin', 'password': 'wrong'})
+        assert response.status_code == 401
+    response = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 429
+    assert 50 <= int(response.headers['Retry-After']) <= 61
+
+def test_successful_login_resets_the_user_limit(client, strict_throttle):
+    client.post('/api/admin/login', json={'username': 'admin', 'password': 'wrong'})
+    for _ in range(3):
+        assert client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).status_code == 200
+
+def test_busy_password_checker(client, monkeypatch):
+    monkeypatch.setattr(main, 'password_checker', PasswordChecker(max_pending=0))
+    response = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_password_checker_limits_pending_checks():
+    checker = PasswordChecker(workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(checker.run(slow)))
+    thread.start()
+    started.wait(5)
+    with pytest.raises(AuthBusy):
+        checker.run(lambda: None)
+    release.set()
+    thread.join()
+    assert results == ['done']
+    assert checker.stats()['pending'] == 0
+
+def test_password_change_ends_admin_sessions(app, monkeypatch):
+    import auth
+    monkeypatch.setattr(auth.admin_sessions, 'ttl', 0)
+    create_admin('rotating-admin', 'first-pw', 'rotating@example.com')
+    admin_id = execute_query("SELECT id FROM admins WHERE username = 'rotating-admin'", fetch='one')[0]
+    client = app.test_client()
+    client.post('/api/admin/login', json={'username': 'rotating-admin', 'password': 'first-pw'})
+    assert client.get('/api/admin/check').get_json()['logged_in']
+    update_admin_password(admin_id, 'second-pw')
+    assert not client.get('/api/admin/check').get_json()['logged_in']
+    assert client.get('/api/admin/admins').status_code == 401
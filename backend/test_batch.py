@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+import main
+from database import get_pool
+from validation import validate_ids
+
+@pytest.mark.parametrize('value, ids', [
+    ('3,1,3', [3, 1]),
+    ([2, '5', 2], [2, 5]),
+    (' 7 , 8,', [7, 8]),
+])
+def test_validate_ids(value, ids):
+    assert validate_ids(value, 10) == ids
+
+@pytest.mark.parametrize('value', ['', [], None, 'a,b', [0], [True], '1,2,3'])
+def test_invalid_ids(value):
+    with pytest.raises(ValueError):
+        validate_ids(value, 2)
+
+@pytest.fixture
+def product_queries(monkeypatch):
+    """IDs read from the database by product batch reads"""
+    queries = []
+    real_get_products_by_ids = main.get_products_by_ids
+
+    def counting_get_products_by_ids(product_ids):
+        queries.append(list(product_ids))
+        return real_get_products_by_ids(product_ids)
+
+    monkeypatch.setattr(main, 'get_products_by_ids', counting_get_products_by_ids)
+    return queries
+
+def test_products_in_the_order_asked_for(client, make_product):
+    lamp, rug = make_product('Batch lamp', 3), make_product('Batch rug', 4)
+    body = client.post('/api/products/batch', json={'ids': [rug, 999999999, lamp, rug]}).get_json()
+    assert [product['id'] for product in body['products']] == [rug, lamp]
+    assert body['products'][0]['name'] == 'Batch rug'
+    assert body['missing'] == [999999999]
+    assert client.get(f'/api/products?ids={rug},999999999,{lamp}').get_json() == body
+
+def test_cached_products_cost_no_query(client, make_product, product_queries):
+    lamp, rug = make_product('Cached lamp', 3), make_product('Uncached rug', 4)
+    client.get(f'/api/products/{lamp}')
+    client.post('/api/products/batch', json={'ids': [lamp, rug]})
+    assert product_queries == [[rug]]
+    # Both are cached now, for single and batch reads alike
+    client.post('/api/products/batch', json={'ids': [rug, lamp]})
+    assert product_queries == [[rug]]
+    assert client.get(f'/api/products/{rug}').get_json()['product']['name'] == 'Uncached rug'
+
+def test_batches_see_product_changes(client, admin_client, make_product):
+    lamp = make_product('Repriced batch lamp', 3)
+    client.post('/api/products/batch', json={'ids': [lamp]})
+    admin_client.put(f'/api/admin/products/{lamp}', json={'name': 'Repriced batch lamp', 'price': 8,
+                                                          'description': ''})
+    assert client.post('/api/products/batch', json={'ids': [lamp]}).get_json()['products'][0]['price'] == 8
+    assert client.get(f'/api/products?ids={lamp}').get_json()['products'][0]['price'] == 8
+
+def test_batch_size_is_limited(client, monkeypatch):
+    monkeypatch.setattr(main, 'BATCH_MAX_IDS', 2)
+    assert client.post('/api/products/batch', json={'ids': [1, 2, 3]}).status_code == 400
+    assert client.get('/api/products?ids=1,2,3').status_code == 400
+    assert client.post('/api/users/batch', json={'ids': [1, 2, 3]}).status_code == 400
+    assert client.post('/api/products/batch', json={'ids': [1, 1, 1, 2]}).status_code == 200  # duplicates are dropped
+    assert client.post('/api/products/batch', json=[1]).status_code == 400
+    assert client.get('/api/users?ids=x').status_code == 400
+
+def test_users(client):
+    with get_pool().connection() as conn:
+        ids = [conn.execute("INSERT INTO users (name, email) VALUES (?, ?)",
+                            (name, f'{name.lower()}-{time.time_ns()}@example.com')).lastrowid
+               for name in ('Ada', 'Grace')]
+        conn.commit()
+    body = client.post('/api/users/batch', json={'ids': [ids[1], 999999999, ids[0]]}).get_json()
+    assert [user['name'] for user in body['users']] == ['Grace', 'Ada']
+    assert body['missing'] == [999999999]
+    assert client.get(f'/api/users?ids={ids[1]},999999999,{ids[0]}').get_json() == body
@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import subprocess
+
+import benchmark
+
+def test_summarize():
+    result = benchmark.summarize('x', [0.003, 0.001, 0.002, 0.004], 2.0, errors=1)
+    assert (result['operations'], result['errors'], result['throughput_per_second']) == (4, 1, 2.0)
+    assert (result['p50_ms'], result['max_ms'], result['mean_ms']) == (3.0, 4.0, 2.5)
+    assert benchmark.summarize('empty', [], 1.0)['p95_ms'] is None
+
+def test_measure_counts_failures_as_errors():
+    def operation(i):
+        if i == 1:
+            raise RuntimeError
+        return i != 2
+
+    result = benchmark.measure('x', operation, iterations=5, duration=60)
+    assert (result['operations'], result['errors']) == (3, 2)
+
+def test_measure_stops_at_duration():
+    assert benchmark.measure('x', lambda i: None, iterations=10 ** 9, duration=0.01)['operations'] < 10 ** 9
+
+def write_results(path, **results):
+    path.write_text(json.dumps({'meta': {}, 'results': [
+        {'name': name, 'throughput_per_second': ops, 'p95_ms': p95} for name, (ops, p95) in results.items()]}))
+    return str(path)
+
+def test_compare_flags_regressions(tmp_path, capsys):
+    old = write_results(tmp_path / 'old.json', same=(100, 1.0), slower=(100, 1.0), gone=(1, 1))
+    new = write_results(tmp_path / 'new.json', same=(95, 1.05), slower=(80, 1.5), added=(1, 1))
+    assert benchmark.main(['compare', old, new, '--threshold', '10']) == 1
+    out = capsys.readouterr().out
+    assert [line.split()[0] for line in out.splitlines() if 'REGRESSION' in line] == ['slower']
+    assert 'gone' in out and 'only in old run' in out
+    assert benchmark.compare(old, old, 10) == 0
+
+def test_local_benchmarks_run(tmp_path):
+    # database paths are read at import time, so the suite runs in its own interpreter
+    output = tmp_path / 'results.json'
+    env = dict(os.environ, RATE_LIMIT_DATABASE=str(tmp_path / 'ratelimit.db'),
+               CATALOG_SNAPSHOT_PATH=str(tmp_path / 'snapshot.db'), IMAGE_STORAGE_PATH=str(tmp_path / 'images'))
+    # With the default rate limits: the benchmark must not be throttled by them
+    for name in ('API_RATE_BURST', 'API_ROUTE_LIMITS', 'LOGIN_IP_BURST', 'LOGIN_USER_BURST'):
+        env.pop(name)
+    completed = subprocess.run(
+        [sys.executable, 'benchmark.py', 'all', '--scale', '200', '--iterations', '100', '--duration', '1',
+         '--output', str(output)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, timeout=300)
+    assert completed.returncode == 0, completed.stderr
+    results = json.loads(output.read_text())
+    assert results['meta']['seeded']['products'] == 200
+    names = [result['name'] for result in results['results']]
+    assert 'db.get_product_by_id' in names and 'app GET /api/products' in names
+    assert [(r['name'], r['errors']) for r in results['results'] if r['errors']] == []
@@ -0,0 +1,119 @@
+import sqlite3
+
+import pytest
+
+import bulk_import
+from database import get_product_by_id, upsert_products_batch
+from migrations import migrate, RECOMMENDATION_TRIGGERS
+
+def test_upserting_an_existing_product_twice(make_product):
+    # The first upsert queues the product for recommendations; the second finds it still queued
+    product_id = make_product('Upserted', 1.0)
+    assert upsert_products_batch([(product_id, 'Upserted again', 2.0, 'x')]) == []
+    assert upsert_products_batch([(product_id, 'Upserted twice', 3.0, 'y')]) == []
+    product = get_product_by_id(product_id)
+    assert (product['name'], product['price'], product['description']) == ('Upserted twice', 3.0, 'y')
+
+def test_upgrade_replaces_recommendation_triggers(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'v10.db')
+    migrate(conn, target=10, log=lambda line: None)
+    conn.execute("INSERT INTO products (id, name, price) VALUES (1, 'Old', 1)")
+    conn.commit()
+    migrate(conn, log=lambda line: None)
+    for name, _ in RECOMMENDATION_TRIGGERS:
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()[0]
+        assert 'ON CONFLICT (product_id) DO NOTHING' in sql
+    conn.execute("""
+        INSERT INTO products (id, name, price) VALUES (1, 'New', 2)
+        ON CONFLICT(id) DO UPDATE SET name = excluded.name, price = excluded.price
+    """)
+    assert conn.execute('SELECT name FROM products WHERE id = 1').fetchone()[0] == 'New'
+    conn.close()
+
+def bulk(admin_client, body, content_type, **params):
+    return admin_client.post('/api/admin/products/bulk', data=body, content_type=content_type,
+                             query_string=params)
+
+def test_csv_import(admin_client, client):
+    body = 'name,price,description\nCsv kettle,4500.25,Boils\nCsv toaster,4500.75,\n'
+    report = bulk(admin_client, body, 'text/csv').get_json()
+    assert report['success']
+    assert (report['total'], report['imported'], report['failed']) == (2, 2, 0)
+    products = client.get('/api/products', query_string={'min_price': 4500, 'max_price': 4501,
+                                                         'sort': 'price'}).get_json()['products']
+    assert [(p['name'], p['description']) for p in products] == [('Csv kettle', 'Boils'), ('Csv toaster', '')]
+
+def test_json_upsert_updates_existing_products(admin_client, client, make_product):
+    first = make_product('Json original', 4600.5)
+    second = make_product('Json other', 4600.5)
+    body = ('[{"id": %d, "name": "Json updated", "price": 4600.5},'
+            ' {"id": %d, "name": "Json other updated", "price": 4600.5},'
+            ' {"name": "Json new", "price": 4600.5}]' % (first, second))
+    for _ in range(2):  # importing the same file again updates in place
+        report = bulk(admin_client, body, 'application/json').get_json()
+        assert (report['imported'], report['failed']) == (3, 0)
+    assert get_product_by_id(first)['name'] == 'Json updated'
+    assert client.get(f'/api/products/{second}').get_json()['product']['name'] == 'Json other updated'
+    names = [p['name'] for p in client.get('/api/products', query_string={
+        'min_price': 4600, 'max_price': 4601, 'sort': 'name'}).get_json()['products']]
+    assert names == ['Json new', 'Json new', 'Json other updated', 'Json updated']
+
+def test_bad_rows_are_reported_and_skipped(admin_client, client):
+    body = '\n'.join([
+        '{"name": "Ndjson good", "price": 4700.5}',
+        '{"name": "Ndjson negative", "price": -1}',
+        'not json',
+        '',
+        '[1, 2]',
+        '{"id": "seven", "name": "Ndjson bad id", "price": 1}',
+        '{"name": "Ndjson also good", "price": 4700.5}',
+    ])
+    response = bulk(admin_client, body, 'application/x-ndjson', batch_size=2)
+    report = response.get_json()
+    assert not report['success']
+    assert (report['total'], report['imported'], report['failed']) == (6, 2, 4)
+    assert [(e['row'], e['error'].split(':')[0]) for e in report['errors']] == [
+        (2, 'Price cannot be negative'), (3, 'Invalid JSON'), (5, 'Row must be an object'), (6, 'Invalid id')]
+    products = client.get('/api/products', query_string={'min_price': 4700, 'max_price': 4701}).get_json()
+    assert sorted(p['name'] for p in products['products']) == ['Ndjson also good', 'Ndjson good']
+
+def test_failing_row_does_not_fail_its_batch():
+    # A NOT NULL violation only shows up when the batch is written; the rest of the batch still lands
+    failures = upsert_products_batch([(None, 'Batch good', 4800.5, ''), (None, None, 4800.5, ''),
+                                      (None, 'Batch good too', 4800.5, '')])
+    assert [index for index, _ in failures] == [1]
+    assert 'NOT NULL' in failures[0][1]
+
+def test_rows_are_written_in_batches(admin_client):
+    body = 'name,price\n' + ''.join(f'Batched {n},4900.5\n' for n in range(5))
+    report = bulk(admin_client, body, 'text/csv', batch_size=2).get_json()
+    assert (report['imported'], report['batches']) == (5, 3)
+
+def test_format_from_query_string(admin_client):
+    report = bulk(admin_client, 'name,price\nQuery format,1\n', 'application/octet-stream', format='csv').get_json()
+    assert report['imported'] == 1
+
+@pytest.mark.parametrize('body, content_type, params, error', [
+    ('x', 'text/plain', {}, 'Body must be CSV, JSON or NDJSON'),
+    ('name,price\n', 'text/csv', {'batch_size': 0}, 'batch_size must be positive'),
+    ('{"products": 1}', 'application/json', {}, None),
+])
+def test_invalid_requests(admin_client, body, content_type, params, error):
+    response = bulk(admin_client, body, content_type, **params)
+    if error:
+        assert response.status_code == 400
+        assert error in response.get_json()['error']
+    else:
+        assert response.get_json()['errors'] == [{'row': 1, 'error': 'JSON body must be an array of products'}]
+
+def test_import_requires_admin(client):
+    assert bulk(client, 'name,price\nx,1\n', 'text/csv').status_code == 401
+
+def test_command_line_import(tmp_path, cli_database, capsys):
+    path = tmp_path / 'products.ndjson'
+    path.write_text('{"name": "Cli product", "price": 2}\n{"name": "Cli bad"}\n')
+    assert bulk_import.main([str(path), '--database', cli_database]) == 1
+    assert '"imported": 1' in capsys.readouterr().out
+    conn = sqlite3.connect(cli_database)
+    assert conn.execute('SELECT name FROM products').fetchall() == [('Cli product',)]
+    conn.close()
@@ -0,0 +1,125 @@
+import time
+
+import main
+from cache import ResponseCache, CatalogCache, catalog_cache
+from database import delete_product, create_category
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.set('a', b'1', 'text/plain')
+    cache.set('b', b'2', 'text/plain')
+    cache.get('a')  # a is now the most recently used
+    cache.set('c', b'3', 'text/plain')
+    assert cache.get('b') is None
+    assert cache.get('a').body == b'1'
+    assert cache.stats()['evictions'] == 1
+
+def test_entries_expire():
+    cache = ResponseCache(ttl=0.01, stale_ttl=0)
+    cache.set('a', b'1', 'text/plain')
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.stats()['expired'] == 1
+
+def test_etag_depends_on_body():
+    cache = ResponseCache()
+    assert cache.set('a', b'1', 'text/plain').etag == cache.set('b', b'1', 'text/plain').etag
+    assert cache.set('a', b'1', 'text/plain').etag != cache.set('a', b'2', 'text/plain').etag
+
+def test_write_makes_cached_list_pages_unreachable():
+    cache = CatalogCache()
+    key = cache.list_key('products', [('limit', '10')])
+    cache.set(key, b'old', 'application/json')
+    cache.invalidate_product()
+    assert cache.list_key('products', [('limit', '10')]) != key
+    assert cache.get(cache.list_key('products', [('limit', '10')])) is None
+
+def test_body_built_before_a_write_is_not_cached():
+    cache = CatalogCache()
+    version = cache.version
+    cache.invalidate_product(7)
+    entry = cache.set(cache.product_key(7), b'stale', 'application/json', version=version)
+    assert entry.body == b'stale'
+    assert cache.get(cache.product_key(7)) is None
+
+def test_recommendations_built_before_a_refresh_are_not_cached():
+    cache = CatalogCache()
+    version = cache.version
+    cache.invalidate_recommendations([7])
+    cache.set(cache.recommended_key(7), b'stale', 'application/json', version=version)
+    assert cache.get(cache.recommended_key(7)) is None
+
+def test_product_response_has_etag_and_cache_headers(client, make_product):
+    product_id = make_product('Cached lamp', 30)
+    response = client.get(f'/api/products/{product_id}')
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+
+def test_matching_if_none_match_gets_304(client, make_product):
+    product_id = make_product('Conditional lamp', 30)
+    etag = client.get(f'/api/products/{product_id}').headers['ETag']
+    response = client.get(f'/api/products/{product_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert client.get(f'/api/products/{product_id}', headers={'If-None-Match': '"other"'}).status_code == 200
+
+def test_cached_reads_do_not_query_the_database(client, make_product, monkeypatch):
+    product_id = make_product('Hot lamp', 30)
+    client.get(f'/api/products/{product_id}')
+    calls = []
+    monkeypatch.setattr(main, 'get_product_by_id', lambda *args: calls.append(args))
+    assert client.get(f'/api/products/{product_id}').get_json()['product']['name'] == 'Hot lamp'
+    assert calls == []
+
+def test_admin_update_invalidates_product_and_lists(client, admin_client, make_product):
+    product_id = make_product('Before lamp', 4100.5)
+    params = {'min_price': 4100, 'max_price': 4101}
+    before = client.get(f'/api/products/{product_id}')
+    assert client.get('/api/products', query_string=params).get_json()['products'][0]['name'] == 'Before lamp'
+
+    response = admin_client.put(f'/api/admin/products/{product_id}',
+                                json={'name': 'After lamp', 'price': 4100.5, 'description': ''})
+    assert response.status_code == 200
+
+    after = client.get(f'/api/products/{product_id}', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.get_json()['product']['name'] == 'After lamp'
+    assert after.headers['ETag'] != before.headers['ETag']
+    assert client.get('/api/products', query_string=params).get_json()['products'][0]['name'] == 'After lamp'
+
+def test_admin_update_sets_category_only_when_given(client, admin_client, make_product):
+    category_id = create_category(f'Update category {time.time_ns()}', '')
+    product_id = make_product('Categorized lamp', 5, category_id=category_id)
+    fields = {'name': 'Renamed lamp', 'price': 5, 'description': ''}
+    assert admin_client.put(f'/api/admin/products/{product_id}', json=fields).status_code == 200
+    assert client.get(f'/api/products/{product_id}').get_json()['product']['category_id'] == category_id
+    response = admin_client.put(f'/api/admin/products/{product_id}', json={**fields, 'category_id': None})
+    assert response.status_code == 200
+    assert client.get(f'/api/products/{product_id}').get_json()['product']['category_id'] is None
+
+def test_updating_a_missing_product_keeps_the_cache(admin_client):
+    version = catalog_cache.version
+    response = admin_client.put('/api/admin/products/999999999',
+                                json={'name': 'Nothing', 'price': 1, 'description': '', 'category_id': None})
+    assert response.status_code == 404
+    assert catalog_cache.version == version
+
+def test_admin_create_and_delete_invalidate_lists(client, admin_client):
+    params = {'min_price': 4200, 'max_price': 4201}
+    assert client.get('/api/products', query_string=params).get_json()['products'] == []
+    admin_client.post('/api/admin/products', json={'name': 'New lamp', 'price': 4200.5, 'description': ''})
+    products = client.get('/api/products', query_string=params).get_json()['products']
+    assert [p['name'] for p in products] == ['New lamp']
+
+    admin_client.delete(f"/api/admin/products/{products[0]['id']}")
+    assert client.get('/api/products', query_string=params).get_json()['products'] == []
+    assert client.get(f"/api/products/{products[0]['id']}").status_code == 404
+
+def test_errors_are_not_cached(client, make_product):
+    missing = make_product('Soon gone', 1)
+    delete_product(missing)
+    catalog_cache.invalidate_product(missing)
+    assert client.get(f'/api/products/{missing}').status_code == 404
+    assert catalog_cache.get(catalog_cache.product_key(missing)) is None
@@ -0,0 +1,93 @@
+import pytest
+
+from database import get_cart_quantities, get_available_stock, checkout_cart
+
+def add(client, product_id, quantity=1):
+    return client.post('/api/cart/add', json={'productId': product_id, 'quantity': quantity})
+
+def test_empty_cart(client):
+    assert client.get('/api/cart').get_json()['cart'] == {'items': [], 'total': 0}
+
+def test_add_update_and_remove(client, make_product):
+    lamp = make_product('Cart lamp', 5000.25)
+    rug = make_product('Cart rug', 5000.5)
+    add(client, lamp)
+    add(client, lamp, 2)  # adding again increases the quantity
+    cart = add(client, rug).get_json()['cart']
+    assert [(item['name'], item['quantity'], item['subtotal']) for item in cart['items']] == [
+        ('Cart lamp', 3, 15000.75), ('Cart rug', 1, 5000.5)]
+    assert cart['total'] == 20001.25
+
+    cart = client.put('/api/cart/update', json={'productId': lamp, 'quantity': 1}).get_json()['cart']
+    assert cart['items'][0]['quantity'] == 1
+    cart = client.put('/api/cart/update', json={'productId': lamp, 'quantity': 0}).get_json()['cart']
+    assert [item['product_id'] for item in cart['items']] == [rug]
+    assert client.delete(f'/api/cart/remove/{rug}').get_json()['cart']['items'] == []
+    assert client.delete(f'/api/cart/remove/{rug}').status_code == 404
+
+def test_clear_cart(client, make_product):
+    add(client, make_product('Clear me', 1))
+    assert client.delete('/api/cart/clear').get_json()['cart']['items'] == []
+
+def test_carts_belong_to_the_session(app, make_product):
+    first, second = app.test_client(), app.test_client()
+    add(first, make_product('Mine', 1))
+    assert second.get('/api/cart').get_json()['cart']['items'] == []
+
+def test_invalid_cart_requests(client, make_product):
+    assert add(client, 'x').status_code == 400
+    assert add(client, make_product('Zero', 1), 0).status_code == 400
+    assert client.post('/api/cart/add', json={}).status_code == 400
+    assert add(client, 10 ** 9).status_code == 404
+    assert client.put('/api/cart/update', json={'productId': 1, 'quantity': 1}).status_code == 404
+
+def test_checkout_creates_order_and_empties_cart(client, make_product):
+    lamp = make_product('Ordered lamp', 10.5, stock=5)
+    add(client, lamp, 2)
+    response = client.post('/api/orders', json={'email': 'buyer@example.com'})
+    assert response.status_code == 201
+    order = response.get_json()['order']
+    assert (order['total'], order['email']) == (21.0, 'buyer@example.com')
+    assert [(item['name'], item['unit_price'], item['quantity']) for item in order['items']] == [
+        ('Ordered lamp', 10.5, 2)]
+    assert client.get('/api/cart').get_json()['cart']['items'] == []
+
+    assert [o['id'] for o in client.get('/api/orders').get_json()['orders']] == [order['id']]
+    assert client.get(f"/api/orders/{order['id']}").get_json()['order']['items'] == order['items']
+
+def test_orders_are_private_to_their_session(app, admin_client, make_product):
+    buyer, other = app.test_client(), app.test_client()
+    add(buyer, make_product('Private', 1))
+    order_id = buyer.post('/api/orders').get_json()['order']['id']
+    assert other.get(f'/api/orders/{order_id}').status_code == 404
+    assert other.get('/api/orders').get_json()['orders'] == []
+    assert admin_client.get(f'/api/orders/{order_id}').status_code == 200
+
+def test_checkout_is_all_or_nothing(client, make_product):
+    plenty = make_product('Plenty', 1, stock=10)
+    scarce = make_product('Scarce', 1, stock=1)
+    add(client, plenty, 2)
+    add(client, scarce, 2)
+    response = client.post('/api/orders')
+    assert response.status_code == 409
+    assert 'Insufficient stock' in response.get_json()['error']
+    # Nothing was sold and the cart is untouched
+    assert len(client.get('/api/cart').get_json()['cart']['items']) == 2
+    assert client.get('/api/orders').get_json()['orders'] == []
+    assert get_available_stock([plenty, scarce]) == {plenty: 10, scarce: 1}
+
+def test_checkout_errors(client, make_product):
+    assert client.post('/api/orders').status_code == 409  # no cart yet
+    add(client, make_product('Emailed', 1))
+    assert client.post('/api/orders', json={'email': 'not-an-email'}).status_code == 400
+    client.delete('/api/cart/clear')
+    assert client.post('/api/orders').get_json()['error'] == 'Cart is empty'
+
+def test_checkout_rejects_a_cart_that_changed(client, make_product):
+    product_id = make_product('Changed', 1)
+    add(client, product_id, 1)
+    with client.session_transaction() as session:
+        cart_id = session['cart_id']
+    with pytest.raises(ValueError, match='Cart changed'):
+        checkout_cart(cart_id, expected_items={product_id: 2})
+    assert get_cart_quantities(cart_id) == {product_id: 1}
@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+
+import pytest
+
+import database
+from database import ConnectionPool, get_db_connection, get_pool, run_write_transaction
+
+def test_connections_have_pragmas_applied(app):
+    conn = get_db_connection()
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == database.SQLITE_PRAGMAS['busy_timeout']
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    finally:
+        conn.close()
+
+def test_pool_reuses_connections(app):
+    pool = ConnectionPool(max_size=2)
+    try:
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            assert second is first
+        stats = pool.stats()
+        assert stats['checkouts'] == 2
+        assert stats['connections_created'] == 1
+        assert stats['idle_connections'] == 1
+    finally:
+        pool.close()
+
+def test_pool_is_bounded(app):
+    pool = ConnectionPool(max_size=1, timeout=0.05)
+    try:
+        conn = pool.acquire()
+        with pytest.raises(sqlite3.OperationalError):
+            pool.acquire()
+        stats = pool.stats()
+        assert stats['waits'] == 1
+        assert stats['timeouts'] == 1
+        assert stats['open_connections'] == 1
+        pool.release(conn)
+    finally:
+        pool.close()
+
+def test_waiting_checkout_gets_released_connection(app):
+    pool = ConnectionPool(max_size=1, timeout=5)
+    try:
+        conn = pool.acquire()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+        waiter.start()
+        pool.release(conn)
+        waiter.join()
+        assert got == [conn]
+        pool.release(conn)
+    finally:
+        pool.close()
+
+def test_release_rolls_back_open_transaction(app):
+    pool = ConnectionPool(max_size=1)
+    try:
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO users (name, email) VALUES ('Rollback', 'rollback@example.com')")
+        with pool.connection() as conn:
+            row = conn.execute("SELECT 1 FROM users WHERE email = 'rollback@example.com'").fetchone()
+        assert row is None
+    finally:
+        pool.close()
+
+def test_closed_pool_refuses_checkouts(app):
+    pool = ConnectionPool(max_size=1)
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.acquire()
+
+def test_forked_process_gets_its_own_pool(app, monkeypatch):
+    pool = get_pool()
+    monkeypatch.setattr(database, '_pool', pool)  # put back afterwards
+    monkeypatch.setattr(pool, 'pid', -1)  # as seen from a forked child
+    child_pool = get_pool()
+    assert child_pool is not pool
+    child_pool.close()
+
+def test_write_transaction_retries_when_busy(app):
+    attempts = []
+
+    def work(conn):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        return conn.execute('SELECT 42').fetchone()[0]
+
+    assert run_write_transaction(work, backoff=0) == 42
+    assert len(attempts) == 3
+
+def test_write_transaction_does_not_retry_other_errors(app):
+    attempts = []
+
+    def work(conn):
+        attempts.append(1)
+        raise sqlite3.OperationalError('no such table: nothing')
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_write_transaction(work, backoff=0)
+    assert len(attempts) == 1
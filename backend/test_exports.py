@@ -0,0 +1,79 @@
+import json
+import sqlite3
+
+import pytest
+
+import database
+from database import iter_query, iter_products, create_user
+
+PRICES = {'min_price': 4400, 'max_price': 4401}
+
+@pytest.fixture(scope='module')
+def exported(app):
+    """Five products in this module's price band; returns their names, newest first"""
+    from database import create_product
+    from cache import catalog_cache
+
+    names = [f'Export {number}' for number in range(5)]
+    for name in names:
+        create_product(name, 4400.5, 'Streamed')
+    catalog_cache.invalidate_product()
+    return names[::-1]
+
+def test_ndjson_export(client, exported):
+    response = client.get('/api/products', query_string={'format': 'ndjson', **PRICES})
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    lines = response.data.decode().splitlines()
+    assert [json.loads(line)['name'] for line in lines] == exported
+
+def test_json_stream_export_is_one_document(client, exported):
+    response = client.get('/api/products', query_string={'format': 'json-stream', 'fields': 'name', **PRICES})
+    body = json.loads(response.data)
+    assert body == {'success': True, 'products': [{'name': name} for name in exported]}
+
+def test_exports_are_read_in_batches(exported):
+    batches = list(iter_products(batch_size=2, columns=['name'], min_price=4400, max_price=4401))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [row['name'] for batch in batches for row in batch] == exported
+
+def test_export_starts_after_cursor(client, exported):
+    page = client.get('/api/products', query_string={'limit': 2, **PRICES}).get_json()
+    response = client.get('/api/products', query_string={'format': 'ndjson', 'cursor': page['next_cursor'],
+                                                         **PRICES})
+    assert [json.loads(line)['name'] for line in response.data.decode().splitlines()] == exported[2:]
+
+def test_empty_exports(client):
+    params = {'min_price': 4402, 'max_price': 4403}
+    assert client.get('/api/products', query_string={'format': 'ndjson', **params}).data == b''
+    body = client.get('/api/products', query_string={'format': 'json-stream', **params}).data
+    assert json.loads(body) == {'success': True, 'products': []}
+
+def test_user_export(client):
+    create_user('Exported user', 'exported@example.com')
+    lines = client.get('/api/users', query_string={'format': 'ndjson'}).data.decode().splitlines()
+    assert 'exported@example.com' in [json.loads(line)['email'] for line in lines]
+    body = json.loads(client.get('/api/users', query_string={'format': 'json-stream'}).data)
+    assert 'exported@example.com' in [user['email'] for user in body['users']]
+
+@pytest.mark.parametrize('path', ['/api/products', '/api/users'])
+def test_unknown_format(client, path):
+    response = client.get(path, query_string={'format': 'xml'})
+    assert response.status_code == 400
+    assert 'format must be one of' in response.get_json()['error']
+
+def test_iter_query_closes_its_connection_when_abandoned(app, monkeypatch):
+    opened = []
+    real_connect = database.get_db_connection
+
+    def tracking_connect():
+        conn = real_connect()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(database, 'get_db_connection', tracking_connect)
+    batches = iter_query('SELECT id FROM products', batch_size=1)
+    next(batches)
+    batches.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute('SELECT 1')  # closed
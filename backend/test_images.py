@@ -0,0 +1,128 @@
+import io
+import os
+import hashlib
+
+from PIL import Image
+
+import main
+import images
+from images import ImageStore, image_store, sniff_mimetype, parse_image_hash
+
+def png_bytes(width=600, height=300):
+    """A PNG with a hash of its own (decoders ignore bytes after the IEND chunk)"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(buffer, 'PNG')
+    return buffer.getvalue() + os.urandom(8)
+
+def upload(client, data, name='photo.png', field='image', path='/api/upload/image'):
+    return client.post(path, data={field: (io.BytesIO(data), name)}, content_type='multipart/form-data')
+
+def test_sniff_mimetype():
+    assert sniff_mimetype(b'\x89PNG\r\n\x1a\n....') == 'image/png'
+    assert sniff_mimetype(b'\xff\xd8\xff\xe0') == 'image/jpeg'
+    assert sniff_mimetype(b'RIFF\0\0\0\0WEBPVP8 ') == 'image/webp'
+    assert sniff_mimetype(b'<svg xmlns=') is None
+
+def test_parse_image_hash():
+    image_hash = 'ab' * 32
+    assert parse_image_hash(image_hash) == image_hash
+    assert parse_image_hash(f'/static/images/{image_hash}-480.webp?v=2') == image_hash
+    assert parse_image_hash('/static/images/logo.png') is None
+    assert parse_image_hash(None) is None
+
+def test_variants_are_never_wider_than_the_original(tmp_path):
+    store = ImageStore(root=str(tmp_path), variant_widths=(160, 480, 1024))
+    image_hash = 'cd' * 32
+    os.makedirs(os.path.dirname(store.path(image_hash)))
+    with open(store.path(image_hash), 'wb') as f:
+        f.write(png_bytes(600, 300))
+    assert store.build_variants(image_hash) == [160, 480, 1024]
+    sizes = {}
+    for width in store.variant_widths:
+        with Image.open(store.path(image_hash, width)) as img:
+            assert img.format == 'WEBP'
+            sizes[width] = img.size
+    assert sizes == {160: (160, 80), 480: (480, 240), 1024: (600, 300)}
+
+def test_missing_pillow_is_logged(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(images, 'PIL', None)
+    assert ImageStore(root=str(tmp_path)).build_variants('ef' * 32) == []
+    assert 'Pillow is not installed' in caplog.text
+
+def test_upload_requires_admin(client):
+    assert upload(client, png_bytes()).status_code == 401
+
+def test_upload_is_stored_once_by_hash(admin_client):
+    data = png_bytes()
+    response = upload(admin_client, data)
+    assert response.status_code == 201
+    image = response.get_json()['image']
+    assert image['hash'] == hashlib.sha256(data).hexdigest()
+    assert (image['mimetype'], image['size'], image['width'], image['height']) == ('image/png', len(data), 600, 300)
+    assert image['url'] == f"/static/images/{image['hash']}"
+
+    again = upload(admin_client, data, name='copy.png')
+    assert again.status_code == 200
+    assert again.get_json()['image']['hash'] == image['hash']
+    assert os.listdir(os.path.join(image_store.root, 'tmp')) == []  # spooled uploads are cleaned up
+
+def test_uploads_are_checked(admin_client, monkeypatch):
+    assert upload(admin_client, b'<svg></svg>', name='x.svg').status_code == 400
+    assert upload(admin_client, b'\x89PNG\r\n\x1a\n' + b'not really').get_json()['error'] == 'Image could not be read'
+    assert admin_client.post('/api/upload/image', data={}, content_type='multipart/form-data').status_code == 400
+    monkeypatch.setattr(image_store, 'max_size', 100)
+    assert upload(admin_client, png_bytes()).status_code == 413
+
+def test_multiple_uploads_report_bad_files(admin_client):
+    response = admin_client.post('/api/upload/images', content_type='multipart/form-data', data={
+        'images': [(io.BytesIO(png_bytes()), 'good.png'), (io.BytesIO(b'plain text'), 'bad.txt')],
+    })
+    assert response.status_code == 201
+    body = response.get_json()
+    assert len(body['images']) == 1
+    assert [error['file'] for error in body['errors']] == ['bad.txt']
+
+def test_file_count_is_limited_while_parsing(admin_client, monkeypatch):
+    spooled = []
+    spool = image_store.spool
+    monkeypatch.setattr(images, 'IMAGE_MAX_FILES', 2)
+    monkeypatch.setattr(image_store, 'spool', lambda: spooled.append(1) or spool())
+    response = admin_client.post('/api/upload/images', content_type='multipart/form-data', data={
+        'images': [(io.BytesIO(png_bytes(10 + i)), f'{i}.png') for i in range(4)],
+    })
+    assert response.status_code == 413
+    assert len(spooled) == 2  # parsing stopped at the third file
+
+def test_serving_originals_and_variants(client, admin_client):
+    image = upload(admin_client, png_bytes()).get_json()['image']
+    image_store.stop()  # waits for the variants to be built
+    original = client.get(image['url'])
+    assert original.mimetype == 'image/png'
+    assert original.headers['Cache-Control'] == main.IMMUTABLE_CACHE_CONTROL
+    variant = client.get(image['variants']['160'])
+    assert variant.mimetype == 'image/webp'
+    assert variant.headers['Cache-Control'] == main.IMMUTABLE_CACHE_CONTROL
+    # A variant that doesn't exist (yet) serves the original, but not forever
+    fallback = client.get(f"{image['url']}-999.webp")
+    assert fallback.mimetype == 'image/png'
+    assert 'immutable' not in fallback.headers['Cache-Control']
+    assert client.get(f"/static/images/{'0' * 64}").status_code == 404
+    assert client.get('/static/images/not-a-hash').status_code == 404
+
+def test_images_in_use_are_not_deleted(admin_client):
+    image = upload(admin_client, png_bytes()).get_json()['image']
+    product = {'name': 'Pictured lamp', 'price': 5, 'image': image['hash']}
+    assert admin_client.post('/api/admin/products', json=product).status_code == 201
+    assert admin_client.delete('/api/upload/image', json={'hash': image['hash']}).status_code == 409
+
+    unused = upload(admin_client, png_bytes()).get_json()['image']
+    image_store.stop()
+    assert admin_client.delete('/api/upload/image', json={'imageUrl': unused['url']}).status_code == 200
+    assert not os.path.exists(image_store.path(unused['hash']))
+    assert not os.path.exists(image_store.path(unused['hash'], 160))
+    assert admin_client.delete('/api/upload/image', json={'hash': unused['hash']}).status_code == 404
+    assert admin_client.delete('/api/upload/image', json={}).status_code == 400
+
+def test_products_reject_unknown_images(admin_client):
+    response = admin_client.post('/api/admin/products', json={'name': 'Lamp', 'price': 5, 'image': 'ef' * 32})
+    assert response.get_json()['error'] == 'Image not found'
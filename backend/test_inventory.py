@@ -0,0 +1,114 @@
+import pytest
+
+from database import get_available_stock, get_product_by_id, create_cart, add_cart_item
+from inventory import InventoryManager
+
+@pytest.fixture
+def manager(app):
+    """An inventory manager without its flush thread"""
+    return InventoryManager(counter_ttl=60)
+
+def test_reserve_and_release(manager, make_product):
+    product_id = make_product('Reserved', 1, stock=3)
+    manager.reserve({product_id: 2})
+    with pytest.raises(ValueError, match='Insufficient stock'):
+        manager.reserve({product_id: 2})
+    manager.release({product_id: 2})
+    manager.reserve({product_id: 3})
+    stats = manager.stats()
+    assert (stats['reservations'], stats['rejections'], stats['releases']) == (2, 1, 1)
+    assert stats['inflight_products'] == 1
+
+def test_reservation_is_all_or_nothing(manager, make_product):
+    plenty = make_product('Plenty reserved', 1, stock=5)
+    scarce = make_product('Scarce reserved', 1, stock=1)
+    with pytest.raises(ValueError):
+        manager.reserve({plenty: 1, scarce: 2})
+    manager.reserve({plenty: 5})  # nothing was taken from plenty
+
+def test_untracked_products_are_never_sold_out(manager, make_product):
+    product_id = make_product('Untracked', 1)
+    manager.reserve({product_id: 10 ** 6})
+
+def test_reload_counts_reservations_in_flight(manager, make_product):
+    product_id = make_product('In flight', 1, stock=2)
+    manager.reserve({product_id: 1})
+    manager._counters.clear()  # as if the counter had expired
+    manager.reserve({product_id: 1})
+    with pytest.raises(ValueError):
+        manager.reserve({product_id: 1})
+
+def test_counter_dropped_before_reserve_locks_is_reloaded(manager, make_product, monkeypatch):
+    # A concurrent release(reload=True) or set_stock between loading the counters
+    # and taking the lock used to raise KeyError
+    product_id = make_product('Dropped', 1, stock=2)
+    real_refresh = manager._refresh
+    calls = []
+
+    def refresh_then_drop(items):
+        real_refresh(items)
+        calls.append(items)
+        if len(calls) == 1:
+            manager.set_stock(product_id, 1)
+
+    monkeypatch.setattr(manager, '_refresh', refresh_then_drop)
+    manager.reserve({product_id: 1})
+    assert len(calls) == 2
+    with pytest.raises(ValueError):
+        manager.reserve({product_id: 1})  # the reloaded counter has the new level
+
+def test_checkout_journals_and_flush_applies(manager, make_product):
+    product_id = make_product('Journaled', 1, stock=5)
+    cart_id = create_cart()
+    add_cart_item(cart_id, product_id, 2)
+    flushed = []
+    manager.on_flush = flushed.extend
+    manager.checkout(cart_id)
+    # Sold stock is journaled; products.stock is only updated by the flush
+    assert get_product_by_id(product_id)['stock'] == 5
+    assert get_available_stock([product_id]) == {product_id: 3}
+    assert manager.flush() >= 1
+    assert get_product_by_id(product_id)['stock'] == 3
+    assert get_available_stock([product_id]) == {product_id: 3}
+    assert product_id in flushed
+    assert manager.stats()['inflight_products'] == 0
+
+def test_database_prevents_overselling_between_workers(make_product):
+    # Two processes each have a counter that still says one is left
+    product_id = make_product('Last one', 1, stock=1)
+    first, second = InventoryManager(counter_ttl=60), InventoryManager(counter_ttl=60)
+    carts = []
+    for manager in (first, second):
+        manager.reserve({product_id: 1})
+        manager.release({product_id: 1})
+        cart_id = create_cart()
+        add_cart_item(cart_id, product_id, 1)
+        carts.append(cart_id)
+    first.checkout(carts[0])
+    with pytest.raises(ValueError, match='Insufficient stock'):
+        second.checkout(carts[1])
+    # The failed checkout dropped the stale counter
+    assert product_id not in second._counters
+
+def test_set_stock_replaces_pending_decrements(manager, make_product):
+    product_id = make_product('Restocked', 1, stock=5)
+    cart_id = create_cart()
+    add_cart_item(cart_id, product_id, 4)
+    manager.checkout(cart_id)
+    assert manager.set_stock(product_id, 10) == 1
+    assert get_available_stock([product_id]) == {product_id: 10}
+    manager.reserve({product_id: 10})
+    assert manager.set_stock(10 ** 9, 1) == 0
+
+def test_inventory_routes(client, admin_client, make_product):
+    product_id = make_product('Stocked by admin', 1, stock=1)
+    url = f'/api/admin/inventory/{product_id}'
+    assert client.put(url, json={'quantity': 3}).status_code == 401
+    assert admin_client.put(url, json={'quantity': -1}).status_code == 400
+    assert admin_client.put(url, json={'quantity': 3}).status_code == 200
+    assert get_available_stock([product_id]) == {product_id: 3}
+    page = admin_client.get('/api/admin/inventory', query_string={'after_id': product_id - 1, 'limit': 1})
+    assert page.get_json()['inventory'][0] == {'id': product_id, 'name': 'Stocked by admin', 'stock': 3,
+                                               'pending': 0, 'available': 3}
+    stats = admin_client.get('/api/admin/inventory/stats').get_json()['inventory']
+    assert 'reservation_latency_ms' in stats
@@ -0,0 +1,162 @@
+import re
+import time
+import logging
+
+import pytest
+
+import jobs as jobs_module
+import tasks
+from jobs import JobQueue, HANDLERS, PRIORITY_HIGH, PRIORITY_LOW, retry_delay
+from database import execute_query
+
+def job(job_id):
+    return execute_query("SELECT * FROM jobs WHERE id = ?", (job_id,), fetch='one')
+
+@pytest.fixture
+def queue(app):
+    return JobQueue(workers=0)
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Payloads run by the 'record' job kind"""
+    calls = []
+    monkeypatch.setitem(HANDLERS, 'record', lambda **payload: calls.append(payload))
+    return calls
+
+@pytest.fixture
+def failing(monkeypatch):
+    def fail(**payload):
+        raise RuntimeError('mail server down')
+    monkeypatch.setitem(HANDLERS, 'fail', fail)
+    monkeypatch.setattr(jobs_module, 'retry_delay', lambda attempts: 0)  # retries are ready at once
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """Mail sent by the job handlers, as (to, subject, body)"""
+    sent = []
+    monkeypatch.setattr(tasks, 'send_mail', lambda to, subject, body: sent.append((to, subject, body)))
+    return sent
+
+def test_claim_and_complete(queue, calls):
+    job_id = queue.enqueue('record', {'n': 1})
+    assert job(job_id)['status'] == 'queued'
+    queue.run_until_empty()
+    assert {'n': 1} in calls
+    done = job(job_id)
+    assert (done['status'], done['attempts']) == ('done', 1)
+    assert done['finished_at'] >= done['started_at']
+    assert queue.run_once() == 0  # never handed out twice
+
+def test_unknown_kind(queue):
+    with pytest.raises(ValueError):
+        queue.enqueue('no-such-job')
+
+def test_priority_and_delay(queue, calls):
+    queue.enqueue('record', {'n': 'low'}, priority=PRIORITY_LOW)
+    queue.enqueue('record', {'n': 'high'}, priority=PRIORITY_HIGH)
+    later = queue.enqueue('record', {'n': 'later'}, delay=60)
+    queue.run_until_empty()
+    assert calls == [{'n': 'high'}, {'n': 'low'}]
+    assert job(later)['status'] == 'queued'
+
+def test_failures_are_retried_then_dead(queue, failing):
+    job_id = queue.enqueue('fail', max_attempts=2)
+    queue.run_once()
+    retried = job(job_id)
+    assert (retried['status'], retried['attempts']) == ('queued', 1)
+    assert retried['last_error'] == 'RuntimeError: mail server down'
+    queue.run_until_empty()
+    assert job(job_id)['status'] == 'dead'
+    assert (queue.stats()['retried'], queue.stats()['dead']) == (1, 1)
+
+def test_retry_delay_backs_off():
+    assert 5 <= retry_delay(1, backoff=5) <= 7.5
+    assert 20 <= retry_delay(3, backoff=5) <= 30
+    assert retry_delay(20, backoff=5, max_delay=60) <= 90
+
+def test_dedupe_key(queue, calls):
+    first = queue.enqueue('record', {'n': 'once'}, dedupe_key=f'dedupe-{time.time_ns()}', delay=60)
+    assert first is not None
+    assert queue.enqueue('record', {'n': 'once'}, dedupe_key=job(first)['dedupe_key']) is None
+    assert queue.stats()['deduplicated'] == 1
+
+def test_abandoned_jobs_are_requeued(queue, calls):
+    job_id = queue.enqueue('record', {'n': 'abandoned'}, max_attempts=2)
+    # A worker claimed it and died
+    execute_query("UPDATE jobs SET status = 'running', attempts = 1, locked_until = ? WHERE id = ?",
+                  (time.time() - 1, job_id))
+    assert queue.maintain() >= 1
+    assert (job(job_id)['status'], job(job_id)['last_error']) == ('queued', 'lock expired')
+
+    execute_query("UPDATE jobs SET status = 'running', attempts = 2, locked_until = ? WHERE id = ?",
+                  (time.time() - 1, job_id))
+    queue.maintain()
+    assert job(job_id)['status'] == 'dead'  # out of attempts
+
+def test_slow_worker_does_not_finish_a_requeued_job(queue, monkeypatch):
+    def slow(**payload):
+        # The lock expires while this runs: the job is requeued and claimed by another worker
+        execute_query("UPDATE jobs SET attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                      (time.time() + 60, payload['id']))
+    monkeypatch.setitem(HANDLERS, 'slow', slow)
+    job_id = queue.enqueue('slow', {})
+    execute_query("UPDATE jobs SET payload = ? WHERE id = ?", (f'{{"id": {job_id}}}', job_id))
+    queue.run_until_empty()
+    assert (job(job_id)['status'], job(job_id)['attempts']) == ('running', 2)  # left to its new owner
+    assert queue.stats()['lost'] == 1
+
+def test_dead_jobs_can_be_retried(client, admin_client, queue, failing):
+    job_id = queue.enqueue('fail', max_attempts=1)
+    queue.run_until_empty()
+    assert client.get('/api/admin/jobs').status_code == 401
+    assert admin_client.get('/api/admin/jobs?status=lost').status_code == 400
+    listed = admin_client.get('/api/admin/jobs?status=dead').get_json()
+    assert job_id in [dead['id'] for dead in listed['jobs']]
+    assert listed['stats']['dead_letters'] >= 1
+
+    assert admin_client.post(f'/api/admin/jobs/{job_id}/retry').status_code == 200
+    assert (job(job_id)['status'], job(job_id)['attempts']) == ('queued', 0)
+    assert admin_client.post(f'/api/admin/jobs/{job_id}/retry').status_code == 404
+
+def test_order_confirmation(client, make_product, queue, outbox):
+    email = f'buyer-{time.time_ns()}@example.com'
+    client.post('/api/cart/add', json={'productId': make_product('Mailed lamp', 4.5), 'quantity': 2})
+    order = client.post('/api/orders', json={'email': email}).get_json()['order']
+    queue.run_until_empty()
+    [(subject, body)] = [(subject, body) for to, subject, body in outbox if to == email]
+    assert subject == f"Your ShopHub order #{order['id']}"
+    assert '2 x Mailed lamp @ 4.50' in body
+    assert 'Total: 9.00' in body
+
+def test_password_reset(client, queue, outbox):
+    email = f'forgetful-{time.time_ns()}@example.com'
+    client.post('/api/auth/register', json={'name': 'Forgetful', 'email': email, 'password': 'old-password'})
+    response = client.post('/api/auth/forgot-password', json={'email': email})
+    assert response.status_code == 200
+    unknown = client.post('/api/auth/forgot-password', json={'email': 'nobody-here@example.com'})
+    assert unknown.get_json() == response.get_json()  # no hint whether the email is registered
+    queue.run_until_empty()
+    [body] = [body for to, _, body in outbox if to == email]
+    token = re.search(r'token=(\S+)', body).group(1)
+
+    reset = client.post('/api/auth/reset-password', json={'token': token, 'password': 'new-password'})
+    assert reset.status_code == 200
+    assert client.post('/api/auth/reset-password', json={'token': token, 'password': 'again-password'}).status_code == 400
+    assert client.post('/api/auth/login', json={'email': email, 'password': 'new-password'}).status_code == 200
+
+def test_unsent_mail_is_logged_without_its_body(caplog, monkeypatch):
+    monkeypatch.setattr(tasks, 'SMTP_HOST', None)
+    with caplog.at_level(logging.INFO, logger='shophub.mail'):
+        tasks.send_mail('user@example.com', 'Reset your ShopHub password', 'token=secret-token')
+    assert 'user@example.com' in caplog.text
+    assert 'Reset your ShopHub password' in caplog.text
+    assert 'secret-token' not in caplog.text
+
+    monkeypatch.setattr(tasks, 'MAIL_LOG_BODY', True)
+    with caplog.at_level(logging.INFO, logger='shophub.mail'):
+        tasks.send_mail('user@example.com', 'Reset your ShopHub password', 'token=secret-token')
+    assert 'secret-token' in caplog.text
+
+def test_command_line(cli_database, capsys):
+    assert jobs_module.main(['--drain', '--database', cli_database]) == 0
+    assert 'Ran 0 jobs' in capsys.readouterr().out
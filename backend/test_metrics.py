@@ -0,0 +1,74 @@
+import sqlite3
+
+import main
+from database import execute_query
+from metrics import Histogram, MetricsRegistry, normalize_sql
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.05, 0.05, 0.5, 3.0):
+        histogram.observe(seconds)
+    assert list(histogram.cumulative()) == [(0.01, 1), (0.1, 3), (1.0, 4)]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.99) == 3.0  # past the last bucket: the largest observation
+    assert Histogram().quantile(0.5) is None
+
+def test_placeholder_lists_collapse():
+    assert normalize_sql('SELECT *\n  FROM t WHERE id IN (?, ?,?)') == 'SELECT * FROM t WHERE id IN (?, ...)'
+    assert normalize_sql('SELECT * FROM t WHERE id IN (?)') == 'SELECT * FROM t WHERE id IN (?)'
+
+def test_slow_queries_are_logged_with_their_plan():
+    registry = MetricsRegistry(slow_query_ms=0)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY)')
+    registry.observe_query('SELECT * FROM t WHERE id = ?', (1,), 0.002, 0, None, conn)
+    registry.observe_query('SELECT * FROM missing', (), 0.002, 0, sqlite3.OperationalError('no table'), conn)
+    snapshot = registry.snapshot()
+    assert [entry['statement'] for entry in snapshot['slow_queries']] == ['SELECT * FROM t WHERE id = ?']
+    assert 'SEARCH t USING INTEGER PRIMARY KEY' in snapshot['slow_queries'][0]['plan'][0]
+    assert {q['statement']: q['errors'] for q in snapshot['queries']}['SELECT * FROM missing'] == 1
+
+def test_requests_are_recorded_by_route(client, admin_client, make_product):
+    product_id = make_product('Measured', 1)
+    client.get(f'/api/products/{product_id}')
+    client.get('/api/products/999999999')
+    requests = admin_client.get('/api/admin/metrics').get_json()['metrics']['requests']
+    seen = {(r['method'], r['endpoint'], r['status']) for r in requests}
+    assert {('GET', '/api/products/<int:product_id>', '200'), ('GET', '/api/products/<int:product_id>', '404')} <= seen
+
+def test_queries_are_recorded(admin_client):
+    execute_query('SELECT id FROM products WHERE id IN (?, ?, ?)', (1, 2, 3), fetch='all')
+    queries = admin_client.get('/api/admin/metrics').get_json()['metrics']['queries']
+    assert 'SELECT id FROM products WHERE id IN (?, ...)' in [q['statement'] for q in queries]
+
+def test_prometheus_endpoint(client, admin_client):
+    client.get('/api/products')
+    response = admin_client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    body = response.data.decode()
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",endpoint="/api/products",status="200",le="+Inf"}' in body
+    assert '\ndb_pool_max_size ' in body
+    assert '\ninventory_reservations ' in body
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(main, 'METRICS_TOKEN', 'scrape-me')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'}).status_code == 200
+
+def test_metrics_are_private_by_default(client, admin_client, monkeypatch):
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 401  # no token configured
+    assert admin_client.get('/metrics').status_code == 200
+    monkeypatch.setattr(main, 'METRICS_PUBLIC', True)
+    assert client.get('/metrics').status_code == 200
+
+def test_admin_metrics_require_admin(client):
+    assert client.get('/api/admin/metrics').status_code == 401
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.request_started()
+    registry.request_finished('GET', 'a "quoted"\nlabel', 200, 0.01)
+    assert 'endpoint="a \\"quoted\\"\\nlabel"' in registry.prometheus()
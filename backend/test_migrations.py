@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from migrations import (Migrator, SchemaOutOfDate, migrate, check_schema, current_version, latest_version,
+                        migration)
+
+def quiet(line):
+    pass
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'migrations.db')
+    yield conn
+    conn.close()
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+def test_fresh_database_is_migrated_to_latest(conn):
+    applied = migrate(conn, log=quiet)
+    assert [version for version, *_ in applied] == [version for version, _, _ in migrations.MIGRATIONS]
+    assert check_schema(conn) == latest_version()
+    assert migrate(conn, log=quiet) == []  # nothing left to do
+
+def test_dry_run_changes_nothing(conn):
+    lines = []
+    applied = migrate(conn, dry_run=True, log=lines.append)
+    assert len(applied) == len(migrations.MIGRATIONS)
+    assert current_version(conn) == 0
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+    assert lines[0] == 'Would apply 0001 core tables'
+    assert any(line.strip().startswith('CREATE TABLE IF NOT EXISTS products') for line in lines)
+
+def test_target_version(conn):
+    migrate(conn, target=3, log=quiet)
+    assert current_version(conn) == 3
+    with pytest.raises(SchemaOutOfDate, match='version 3'):
+        check_schema(conn)
+    assert [version for version, *_ in migrate(conn, target=5, log=quiet)] == [4, 5]
+
+def test_database_from_before_versioning_is_upgraded(conn):
+    conn.executescript('''
+        CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, price REAL NOT NULL,
+                               description TEXT, image TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        INSERT INTO products (name, price) VALUES ('Legacy lamp', 5);
+    ''')
+    migrate(conn, log=quiet)
+    assert {'stock', 'category_id'} <= set(columns(conn, 'products'))
+    assert conn.execute("SELECT name FROM products").fetchall() == [('Legacy lamp',)]
+    # Existing rows are picked up by the search index
+    assert conn.execute("SELECT COUNT(*) FROM products_fts WHERE products_fts MATCH 'legacy'").fetchone()[0] == 1
+
+def test_failed_migration_rolls_back(conn, monkeypatch):
+    migrate(conn, target=1, log=quiet)
+
+    def broken(m):
+        m.execute('CREATE TABLE half_done (id INTEGER)')
+        m.execute('THIS IS NOT SQL')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:1] + [(2, 'broken', broken)])
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(conn, log=quiet)
+    assert current_version(conn) == 1
+    assert 'half_done' not in [row[0] for row in conn.execute("SELECT name FROM sqlite_master")]
+
+def test_migrations_must_be_registered_in_order(monkeypatch):
+    monkeypatch.setattr(migrations, 'MIGRATIONS', list(migrations.MIGRATIONS))
+    with pytest.raises(ValueError, match='out of order'):
+        migration(1, 'again')(lambda m: None)
+
+def test_index_build_warms_large_tables(conn):
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, value INTEGER)')
+    conn.executemany('INSERT INTO t (value) VALUES (?)', [(n,) for n in range(50)])
+    conn.commit()
+    lines = []
+    migrator = Migrator(conn, batch_size=10, log=lines.append)
+    migrator.create_index('idx_t_value', 't', 'value')
+    assert migrator.index_exists('idx_t_value')
+    assert lines[0].startswith('    index idx_t_value: 50 rows')
+    migrator.create_index('idx_t_value', 't', 'value')  # already there
+    assert len(lines) == 1
+
+def test_command_line(cli_database, capsys):
+    assert migrations.main(['--status', '--database', cli_database]) == 1
+    assert f'Schema version 0 (latest {latest_version()})' in capsys.readouterr().out
+    assert migrations.main(['--dry-run', '--database', cli_database]) == 0
+    assert 'Would apply 0001 core tables' in capsys.readouterr().out
+    assert migrations.main(['--target', '2', '--database', cli_database]) == 0
+    assert 'Migrated 0 -> 2' in capsys.readouterr().out
+    conn = sqlite3.connect(cli_database)
+    assert current_version(conn) == 2  # stops at the target
+    conn.close()
+    assert migrations.main(['--database', cli_database]) == 0
+    assert migrations.main(['--status', '--database', cli_database]) == 0
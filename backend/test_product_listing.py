@@ -0,0 +1,103 @@
+import pytest
+
+# Prices in this band are only used by these tests, so the price filters isolate their products
+LOW, HIGH = 2000, 2001
+
+@pytest.fixture(scope='module')
+def listed(app):
+    """Seven products in the test price band, some sharing a price; returns their ids"""
+    from database import create_product, get_pool
+    from cache import catalog_cache
+
+    prices = [2000.10, 2000.20, 2000.20, 2000.30, 2000.40, 2000.40, 2000.50]
+    for number, price in enumerate(prices):
+        create_product(f'Listing {number}', price, f'Listed product {number}')
+    catalog_cache.invalidate_product()
+    with get_pool().connection() as conn:
+        rows = conn.execute("SELECT id FROM products WHERE price BETWEEN ? AND ? ORDER BY id", (LOW, HIGH))
+        return [row['id'] for row in rows]
+
+def walk(client, **params):
+    """Follow next_cursor through every page; returns the pages"""
+    params.update(min_price=LOW, max_price=HIGH)
+    pages = []
+    while True:
+        body = client.get('/api/products', query_string=params).get_json()
+        assert body['success']
+        pages.append(body)
+        if not body['has_more']:
+            return pages
+        params['cursor'] = body['next_cursor']
+
+def test_cursor_pages_cover_every_product_once(client, listed):
+    pages = walk(client, limit=3, sort='price')
+    ids = [product['id'] for page in pages for product in page['products']]
+    assert [len(page['products']) for page in pages] == [3, 3, 1]
+    assert sorted(ids) == listed
+    assert pages[-1]['next_cursor'] is None
+
+def test_ties_on_sort_key_are_ordered_by_id(client, listed):
+    products = [p for page in walk(client, limit=2, sort='price') for p in page['products']]
+    keys = [(p['price'], p['id']) for p in products]
+    assert keys == sorted(keys)
+
+def test_descending_order(client, listed):
+    products = [p for page in walk(client, limit=4, sort='price', order='desc') for p in page['products']]
+    keys = [(p['price'], p['id']) for p in products]
+    assert keys == sorted(keys, reverse=True)
+
+def test_default_sort_is_newest_first(client, listed):
+    products = walk(client, limit=50)[0]['products']
+    keys = [(p['created_at'], p['id']) for p in products]
+    assert keys == sorted(keys, reverse=True)
+
+def test_name_sort(client, listed):
+    products = walk(client, limit=50, sort='name')[0]['products']
+    assert [p['name'] for p in products] == [f'Listing {n}' for n in range(7)]
+
+def test_price_filters(client, listed):
+    body = client.get('/api/products', query_string={'min_price': 2000.2, 'max_price': 2000.4,
+                                                     'sort': 'price'}).get_json()
+    assert [p['price'] for p in body['products']] == [2000.2, 2000.2, 2000.3, 2000.4, 2000.4]
+
+def test_fields_projection(client, listed):
+    body = client.get('/api/products', query_string={'min_price': LOW, 'max_price': HIGH,
+                                                     'fields': 'name', 'limit': 2}).get_json()
+    assert all(set(product) == {'name'} for product in body['products'])
+    assert body['has_more'] and body['next_cursor']
+
+@pytest.mark.parametrize('params, error', [
+    ({'sort': 'description'}, 'sort must be one of'),
+    ({'order': 'sideways'}, "order must be 'asc' or 'desc'"),
+    ({'limit': 'ten'}, 'must be numbers'),
+    ({'limit': 0}, 'limit must be positive'),
+    ({'cursor': 'not-a-cursor'}, 'Invalid cursor'),
+    ({'fields': 'name,secret'}, 'Unknown fields: secret'),
+])
+def test_invalid_parameters(client, params, error):
+    response = client.get('/api/products', query_string=params)
+    assert response.status_code == 400
+    assert error in response.get_json()['error']
+
+def test_page_size_is_capped(client):
+    from main import MAX_PAGE_SIZE
+    from database import create_product
+    from cache import catalog_cache
+
+    for number in range(MAX_PAGE_SIZE + 1):
+        create_product(f'Cap {number}', 2002.5, '')
+    catalog_cache.invalidate_product()
+    body = client.get('/api/products', query_string={'min_price': 2002, 'max_price': 2003,
+                                                     'limit': MAX_PAGE_SIZE + 50}).get_json()
+    assert len(body['products']) == MAX_PAGE_SIZE
+    assert body['has_more']
+
+@pytest.mark.parametrize('sort', ['created_at', 'price', 'name'])
+def test_pages_are_read_from_an_index(app, sort):
+    from database import build_products_query, get_pool
+
+    query, params = build_products_query(sort=sort, after=('x', 1))
+    with get_pool().connection() as conn:
+        plan = ' '.join(row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params))
+    assert 'USE TEMP B-TREE' not in plan
+    assert f'idx_products_{sort}' in plan
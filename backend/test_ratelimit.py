@@ -0,0 +1,127 @@
+import time
+import sqlite3
+
+import pytest
+
+import main
+import ratelimit
+from ratelimit import RateLimiter, LoadShedder, SQLiteCounterStore, parse_route_limits, is_guarded
+
+def test_parse_route_limits():
+    limits = parse_route_limits('get /api/products/search=60/300, POST /api/orders=10/30,')
+    assert limits == {('GET', '/api/products/search'): (60, 300), ('POST', '/api/orders'): (10, 30)}
+    assert parse_route_limits('') == {}
+    with pytest.raises(ValueError):
+        parse_route_limits('/api/products=5')
+
+@pytest.mark.parametrize('path, method, guarded', [
+    ('/api/products', 'GET', True),
+    ('/api/orders', 'POST', True),
+    ('/api/products', 'OPTIONS', False),
+    ('/api/admin/products', 'POST', False),
+    ('/static/logo.png', 'GET', False),
+])
+def test_guarded_paths(path, method, guarded):
+    assert is_guarded(path, method) is guarded
+
+def test_per_ip_limit():
+    limiter = RateLimiter(burst=2, per_minute=60, route_limits='', store='memory')
+    assert limiter.check('1.1.1.1', 'GET', '/api/products') == 0
+    assert limiter.check('1.1.1.1', 'GET', '/api/products/<int:product_id>') == 0
+    assert limiter.check('1.1.1.1', 'GET', '/api/products') == pytest.approx(1, abs=0.1)
+    assert limiter.check('2.2.2.2', 'GET', '/api/products') == 0  # limits are per address
+    stats = limiter.stats()
+    assert (stats['checked'], stats['throttled_ip'], stats['tracked_ips']) == (4, 1, 2)
+
+def test_limits_can_be_disabled():
+    limiter = RateLimiter(burst=1, per_minute=1, route_limits='', store='memory', enabled=False)
+    assert [limiter.check('1.1.1.1', 'GET', '/api/products') for _ in range(5)] == [0] * 5
+    assert limiter.stats()['enabled'] is False
+
+def test_route_limits_are_tighter():
+    limiter = RateLimiter(burst=100, per_minute=60, route_limits='POST /api/orders=1/1', store='memory')
+    assert limiter.check('1.1.1.1', 'POST', '/api/orders') == 0
+    assert limiter.check('1.1.1.1', 'POST', '/api/orders') > 50
+    assert limiter.check('1.1.1.1', 'GET', '/api/orders') == 0  # another method, another route
+    assert limiter.stats()['throttled_route'] == 1
+
+def test_sqlite_store_sliding_window(tmp_path):
+    store = SQLiteCounterStore(path=str(tmp_path / 'counters.db'))
+    assert [store.hit('ip a', 2) for _ in range(2)] == [0, 0]
+    assert 0 < store.hit('ip a', 2) <= 60
+    assert store.hit('ip b', 2) == 0
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    first = RateLimiter(per_minute=2, route_limits='', store='sqlite')
+    second = RateLimiter(per_minute=2, route_limits='', store='sqlite')
+    first.store, second.store = SQLiteCounterStore(path), SQLiteCounterStore(path)
+    assert first.check('3.3.3.3', 'GET', '/api/products') == 0
+    assert second.check('3.3.3.3', 'GET', '/api/products') == 0
+    assert first.check('3.3.3.3', 'GET', '/api/products') > 0
+    assert first.stats()['shared']
+
+def test_store_errors_let_requests_through(monkeypatch):
+    limiter = RateLimiter(per_minute=1, route_limits='', store='sqlite')
+
+    def locked(key, per_minute):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(limiter.store, 'hit', locked)
+    assert limiter.check('4.4.4.4', 'GET', '/api/products') == 0
+    assert limiter.stats()['store_errors'] == 1
+
+def test_throttled_requests_get_429(client, monkeypatch):
+    monkeypatch.setattr(main, 'rate_limiter', RateLimiter(burst=2, per_minute=1, route_limits='', store='memory'))
+    assert [client.get('/api/products').status_code for _ in range(2)] == [200, 200]
+    response = client.get('/api/products')
+    assert response.status_code == 429
+    assert 50 <= int(response.headers['Retry-After']) <= 61
+    assert response.get_json()['success'] is False
+    assert client.get('/api/admin/check').status_code == 200  # admin routes aren't limited
+    assert client.get('/').status_code == 200
+
+def test_route_limit_on_a_route(client, make_product, monkeypatch):
+    limiter = RateLimiter(burst=100, per_minute=100, route_limits='GET /api/products/<int:product_id>=1/1',
+                          store='memory')
+    monkeypatch.setattr(main, 'rate_limiter', limiter)
+    product_id = make_product('Limited lamp', 1)
+    assert client.get(f'/api/products/{product_id}').status_code == 200
+    assert client.get(f'/api/products/{product_id}').status_code == 429
+    assert client.get('/api/products').status_code == 200
+
+def test_load_shedding(client, monkeypatch):
+    monkeypatch.setattr(main, 'load_shedder', LoadShedder(max_in_flight=0))
+    response = client.get('/api/products')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert main.load_shedder.stats()['shed_in_flight'] == 1
+
+def test_requests_in_flight_are_released(client):
+    before = main.load_shedder.stats()
+    client.get('/api/products')
+    after = main.load_shedder.stats()
+    assert after['admitted'] == before['admitted'] + 1
+    assert after['in_flight'] == 0
+
+def test_slow_database_sheds_load(monkeypatch):
+    pool = {'checkouts': 0, 'wait_time_ms': 0.0}
+    monkeypatch.setattr(ratelimit, 'get_pool_stats', lambda: dict(pool))
+    monkeypatch.setattr(ratelimit, 'DB_WAIT_SAMPLE_INTERVAL', 0)
+    shedder = LoadShedder(max_in_flight=10, max_db_wait_ms=50)
+    assert shedder.admit()
+    pool.update(checkouts=10, wait_time_ms=1000.0)  # connections waited 100ms each
+    time.sleep(0.001)
+    assert not shedder.admit()
+    pool.update(checkouts=20, wait_time_ms=1000.0)
+    time.sleep(0.001)
+    assert shedder.admit()
+    shedder.release()
+    shedder.release()
+    assert shedder.stats() == {'admitted': 2, 'shed_in_flight': 0, 'shed_db_wait': 1, 'peak_in_flight': 2,
+                               'shed': 1, 'in_flight': 0, 'db_wait_ms': 0.0}
+
+def test_limits_are_in_metrics(admin_client):
+    body = admin_client.get('/metrics').data.decode()
+    assert '\nrate_limit_throttled ' in body
+    assert '\nload_shedding_shed ' in body
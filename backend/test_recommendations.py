@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from database import create_category, create_cart, add_cart_item, checkout_cart, update_product
+from cache import catalog_cache
+from recommendations import recommendations
+
+@pytest.fixture
+def category_id(app):
+    return create_category(f'Category {time.time_ns()}', '')
+
+def recommended(client, product_id):
+    response = client.get(f'/api/products/{product_id}/recommended')
+    return [product['id'] for product in response.get_json()['products']]
+
+def buy(*product_ids):
+    cart_id = create_cart()
+    for product_id in product_ids:
+        add_cart_item(cart_id, product_id, 1)
+    checkout_cart(cart_id)
+
+def test_same_category_price_neighbours(client, make_product, category_id):
+    lamp = make_product('Lamp', 100, category_id=category_id)
+    close = make_product('Close lamp', 110, category_id=category_id)
+    cheaper = make_product('Cheaper lamp', 80, category_id=category_id)
+    make_product('Far lamp', 300, category_id=category_id)  # outside the price band
+    make_product('Sold out lamp', 101, stock=0, category_id=category_id)
+    make_product('Other category lamp', 100)
+    recommendations.refresh_all()
+    assert recommended(client, lamp) == [close, cheaper]
+
+def test_co_purchases_come_first(client, make_product, category_id):
+    lamp = make_product('Bought lamp', 100, category_id=category_id)
+    neighbour = make_product('Neighbour lamp', 100, category_id=category_id)
+    bulb = make_product('Bulb', 2)
+    buy(lamp, bulb)
+    recommendations.refresh_all()
+    assert recommended(client, lamp) == [bulb, neighbour]
+
+def test_changes_refresh_dependent_lists(client, admin_client, make_product, category_id):
+    lamp = make_product('Repriced lamp', 100, category_id=category_id)
+    other = make_product('Repriced neighbour', 120, category_id=category_id)
+    recommendations.refresh_all()
+    assert recommended(client, lamp) == [other]
+    # Repricing the neighbour out of the band drops it from lists that named it
+    admin_client.put(f'/api/admin/products/{other}', json={'name': 'Repriced neighbour', 'price': 500,
+                                                           'description': ''})
+    recommendations.refresh_all()
+    assert recommended(client, lamp) == []
+    update_product(other, 'Repriced neighbour', 101, '')
+    recommendations.refresh_all()
+    assert recommended(client, lamp) == [other]
+    admin_client.delete(f'/api/admin/products/{other}')
+    recommendations.refresh_all()
+    assert recommended(client, lamp) == []
+
+def test_refresh_leaves_list_pages_cached(client, make_product, category_id):
+    lamp = make_product('Cached lamp', 100, category_id=category_id)
+    recommendations.refresh_all()
+    assert recommended(client, lamp) == []
+    other = make_product('Cached neighbour', 110, category_id=category_id)
+    list_key, changed_at = catalog_cache.list_key('products', ()), catalog_cache.changed_at
+    recommendations.refresh_all()
+    # Only the refreshed ids' keys are dropped; list pages keep their keys
+    assert (catalog_cache.list_key('products', ()), catalog_cache.changed_at) == (list_key, changed_at)
+    assert recommended(client, lamp) == [other]
+
+def test_best_sellers_are_featured(client, make_product):
+    seller = make_product('Best seller', 1)
+    cart_id = create_cart()
+    add_cart_item(cart_id, seller, 10 ** 6)
+    checkout_cart(cart_id)
+    recommendations.refresh_all()
+    featured = client.get('/api/products/featured').get_json()['products']
+    assert featured[0]['id'] == seller
+
+def test_recommendations_for_missing_product(client):
+    assert client.get('/api/products/999999999/recommended').status_code == 404
+
+def test_category_routes(client, admin_client, make_product):
+    name = f'Lighting {time.time_ns()}'
+    assert client.post('/api/categories', json={'name': name}).status_code == 401
+    response = admin_client.post('/api/categories', json={'name': name, 'description': 'Lamps'})
+    assert response.status_code == 201
+    category = response.get_json()['category']
+    assert admin_client.post('/api/categories', json={'name': name}).status_code == 409
+    assert admin_client.post('/api/categories', json={}).status_code == 400
+
+    product_id = make_product('Categorized lamp', 1, category_id=category['id'])
+    listed = client.get('/api/categories').get_json()['categories']
+    assert {c['name']: c['product_count'] for c in listed}[name] == 1
+    products = client.get(f"/api/products/category/{category['id']}").get_json()['products']
+    assert [p['id'] for p in products] == [product_id]
+
+    renamed = admin_client.put(f"/api/categories/{category['id']}", json={'name': name + ' renamed'})
+    assert renamed.get_json()['category']['name'] == name + ' renamed'
+    assert admin_client.delete(f"/api/categories/{category['id']}").status_code == 200
+    assert client.get(f"/api/categories/{category['id']}").status_code == 404
+    assert client.get(f"/api/products/category/{category['id']}").status_code == 404
+    assert client.get(f'/api/products/{product_id}').get_json()['product']['category_id'] is None
+    assert admin_client.delete(f"/api/categories/{category['id']}").status_code == 404
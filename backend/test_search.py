@@ -0,0 +1,75 @@
+import pytest
+
+from database import build_fts_query, update_product, delete_product
+
+def search(client, q, **params):
+    response = client.get('/api/products/search', query_string={'q': q, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_name_matches_rank_above_description_matches(client, make_product):
+    in_description = make_product('Plain mug', 5, 'A mug for quokkatea lovers')
+    in_name = make_product('Quokkatea mug', 5, 'A plain mug')
+    ids = [product['id'] for product in search(client, 'quokkatea')['products']]
+    assert ids == [in_name, in_description]
+
+def test_more_matching_terms_rank_higher(client, make_product):
+    one = make_product('Wombatlamp shade', 5, '')
+    both = make_product('Wombatlamp wombatbulb', 5, '')
+    ids = [product['id'] for product in search(client, 'wombatlamp wombatbulb', prefix=0)['products']]
+    assert ids == [both]  # every term has to match
+    ids = [product['id'] for product in search(client, 'wombatlamp')['products']]
+    assert set(ids) == {one, both}
+
+def test_last_term_matches_as_prefix(client, make_product):
+    product_id = make_product('Numbatkettle', 5, '')
+    assert [p['id'] for p in search(client, 'numbatke')['products']] == [product_id]
+    assert search(client, 'numbatke', prefix=0)['products'] == []
+
+def test_diacritics_are_ignored(client, make_product):
+    product_id = make_product('Crème brûlée torch', 5, '')
+    assert [p['id'] for p in search(client, 'creme brulee')['products']] == [product_id]
+
+def test_results_are_highlighted(client, make_product):
+    make_product('Dingocup large', 5, 'Holds a dingocup worth of tea')
+    product = search(client, 'dingocup')['products'][0]
+    assert product['name_highlight'] == '<mark>Dingocup</mark> large'
+    assert '<mark>dingocup</mark>' in product['snippet']
+
+def test_price_filters_and_offset_paging(client, make_product):
+    ids = [make_product(f'Echidnabox {n}', 10 + n, '') for n in range(5)]
+    body = search(client, 'echidnabox', min_price=11, max_price=13)
+    assert sorted(p['id'] for p in body['products']) == ids[1:4]
+
+    first = search(client, 'echidnabox', limit=2)
+    assert first['has_more'] and first['next_offset'] == 2
+    rest = search(client, 'echidnabox', limit=10, offset=2)
+    seen = [p['id'] for p in first['products'] + rest['products']]
+    assert sorted(seen) == ids and not rest['has_more']
+
+def test_index_follows_updates_and_deletes(client, make_product):
+    product_id = make_product('Bilbyspoon', 5, '')
+    update_product(product_id, 'Bandicootfork', 5, '')
+    assert search(client, 'bilbyspoon')['products'] == []
+    assert [p['id'] for p in search(client, 'bandicootfork')['products']] == [product_id]
+    delete_product(product_id)
+    assert search(client, 'bandicootfork')['products'] == []
+
+@pytest.mark.parametrize('q', ['"', 'NEAR(a b)', 'a OR', '*', 'name:x', '-x', '^start'])
+def test_query_syntax_in_input_is_treated_as_text(client, q):
+    assert search(client, q)['success']
+
+def test_build_fts_query_quotes_terms():
+    assert build_fts_query('red "shoes" OR') == '"red" "shoes" "OR"*'
+    assert build_fts_query('a b', prefix=True) == '"a" "b"'  # one-letter prefixes aren't indexed
+    assert build_fts_query('?!') is None
+
+@pytest.mark.parametrize('params, status', [
+    ({}, 400),
+    ({'q': ' '}, 400),
+    ({'q': 'x', 'limit': 0}, 400),
+    ({'q': 'x', 'offset': -1}, 400),
+    ({'q': 'x', 'min_price': 'cheap'}, 400),
+])
+def test_invalid_parameters(client, params, status):
+    assert client.get('/api/products/search', query_string=params).status_code == status
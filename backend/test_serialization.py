@@ -0,0 +1,108 @@
+import gzip
+import json
+import sqlite3
+
+import pytest
+from werkzeug.datastructures import Accept
+
+import main
+import serialization
+from serialization import (RawJSON, rows_to_json, rows_to_ndjson, encode_object, compress, preferred_encoding,
+                           COMPRESS_MIN_SIZE)
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def backend(request, monkeypatch):
+    """Run a test with orjson (when installed) and with the stdlib row templates"""
+    if request.param == 'orjson':
+        if serialization.orjson is None:
+            pytest.skip('orjson is not installed')
+    else:
+        monkeypatch.setattr(serialization, 'orjson', None)
+    return request.param
+
+@pytest.fixture
+def rows():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE t (id INTEGER, name TEXT, price REAL, note TEXT, raw BLOB)')
+    conn.executemany('INSERT INTO t VALUES (?, ?, ?, ?, ?)', [
+        (1, 'Plain', 1.5, None, b'abc'),
+        (2, 'Quote " and \\ backslash', 1e-7, 'line\nbreak', None),
+        (3, 'Ünïcödé ✓', 12345678901234.5, ' ', None),
+    ])
+    return conn.execute('SELECT * FROM t ORDER BY id').fetchall()
+
+def as_dicts(rows, columns=None):
+    columns = columns or rows[0].keys()
+    return [{c: (row[c].decode() if isinstance(row[c], bytes) else row[c]) for c in columns} for row in rows]
+
+def test_rows_to_json_matches_json_module(backend, rows):
+    assert json.loads(rows_to_json(rows)) == as_dicts(rows)
+
+def test_columns_select_and_order_keys(backend, rows):
+    encoded = rows_to_json(rows, ['price', 'id'])
+    assert json.loads(encoded) == as_dicts(rows, ['price', 'id'])
+    assert encoded.startswith(b'[{"price":')
+
+def test_empty_rows(backend):
+    assert rows_to_json([]) == b'[]'
+    assert rows_to_ndjson([]) == b''
+
+def test_ndjson_has_one_object_per_line(backend, rows):
+    lines = rows_to_ndjson(rows).split(b'\n')
+    assert lines[-1] == b''
+    assert [json.loads(line) for line in lines[:-1]] == as_dicts(rows)
+
+def test_non_finite_floats_become_null(monkeypatch):
+    monkeypatch.setattr(serialization, 'orjson', None)
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("SELECT 1e999 AS big, -1e999 AS small").fetchall()
+    assert json.loads(rows_to_json(rows)) == [{'big': None, 'small': None}]
+
+def test_encode_object_splices_raw_json(backend):
+    body = encode_object(success=True, items=RawJSON(b'[1,2]'), name='x')
+    assert body == b'{"success":true,"items":[1,2],"name":"x"}'
+    assert isinstance(body, RawJSON)
+
+def test_compress_round_trip():
+    body = b'{"a":1}' * 500
+    assert gzip.decompress(compress(body, 'gzip')) == body
+    assert len(compress(body, 'gzip', best=True)) <= len(compress(body, 'gzip'))
+    assert compress(body, 'deflate') is None
+
+def test_preferred_encoding():
+    assert preferred_encoding(Accept([('gzip', 1)]), COMPRESS_MIN_SIZE) == 'gzip'
+    assert preferred_encoding(Accept([('gzip', 1)]), COMPRESS_MIN_SIZE - 1) is None
+    assert preferred_encoding(Accept([('identity', 1)]), COMPRESS_MIN_SIZE) is None
+
+@pytest.fixture
+def large_list(make_product):
+    for number in range(30):
+        make_product(f'Compressible lamp {number}', 4300.5, 'A lamp description that compresses well ' * 3)
+    return {'min_price': 4300, 'max_price': 4301}
+
+def test_catalog_responses_are_compressed(client, large_list):
+    plain = client.get('/api/products', query_string=large_list)
+    zipped = client.get('/api/products', query_string=large_list, headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.data) == plain.data
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    # Each representation has its own ETag and revalidates on its own
+    assert zipped.headers['ETag'] != plain.headers['ETag']
+    again = client.get('/api/products', query_string=large_list,
+                       headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']})
+    assert again.status_code == 304
+
+def test_compressed_body_is_reused(client, large_list, monkeypatch):
+    calls = []
+
+    def counting_compress(body, encoding):
+        calls.append(encoding)
+        return compress(body, encoding)
+
+    monkeypatch.setattr(main, 'compress', counting_compress)
+    first = client.get('/api/products', query_string=large_list, headers={'Accept-Encoding': 'gzip'})
+    second = client.get('/api/products', query_string=large_list, headers={'Accept-Encoding': 'gzip'})
+    assert first.data == second.data
+    assert calls == ['gzip']
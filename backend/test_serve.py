@@ -0,0 +1,75 @@
+import json
+import asyncio
+
+import pytest
+
+import serve
+
+@pytest.fixture
+def started(monkeypatch):
+    """Record which server main() would start, and with what options"""
+    calls = []
+    monkeypatch.setattr(serve, 'run_gunicorn', lambda options: calls.append(('gunicorn', options)))
+    monkeypatch.setattr(serve, 'run_uvicorn', lambda options: calls.append(('uvicorn', options)))
+    return calls
+
+def test_options_from_environment(monkeypatch):
+    monkeypatch.setenv('PORT', '8080')
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    monkeypatch.setenv('WEB_THREADS', '2')
+    monkeypatch.setenv('WEB_PRELOAD', '0')
+    options = serve.default_options()
+    assert (options['bind'], options['workers'], options['threads'], options['preload']) == ('0.0.0.0:8080', 3, 2, False)
+    monkeypatch.setenv('WEB_BIND', '127.0.0.1:9000')
+    assert serve.default_options()['bind'] == '127.0.0.1:9000'
+
+def test_gunicorn_is_the_default(started):
+    serve.main([])
+    assert [server for server, _ in started] == ['gunicorn']
+
+def test_command_line_overrides_environment(started, monkeypatch):
+    monkeypatch.setenv('WEB_SERVER', 'uvicorn')
+    serve.main(['--workers', '2', '--no-preload', '--max-requests', '0'])
+    server, options = started[0]
+    assert server == 'uvicorn'
+    assert (options['workers'], options['preload'], options['max_requests']) == (2, False, 0)
+
+def test_asgi_application_serves_the_app(app):
+    pytest.importorskip('a2wsgi')
+    import asgi
+
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': '/api/products', 'raw_path': b'/api/products', 'query_string': b'limit=1',
+             'root_path': '', 'headers': [(b'host', b'test')], 'client': ('127.0.0.1', 1),
+             'server': ('test', 80)}
+    asyncio.run(asgi.application(scope, receive, send))
+    assert messages[0]['status'] == 200
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    assert json.loads(body)['success'] is True
+
+def test_asgi_lifespan_shutdown_flushes_the_worker(app, monkeypatch):
+    pytest.importorskip('a2wsgi')
+    import asgi
+
+    flushed = []
+    monkeypatch.setattr(asgi, 'shutdown_worker', lambda: flushed.append(True))
+    incoming = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    messages = []
+
+    async def receive():
+        return next(incoming)
+
+    async def send(message):
+        messages.append(message['type'])
+
+    asyncio.run(asgi.application({'type': 'lifespan', 'asgi': {'version': '3.0'}}, receive, send))
+    assert messages == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert flushed == [True]
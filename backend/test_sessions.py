@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+import sessions
+from database import get_pool
+from sessions import SessionStore, hash_token
+
+@pytest.fixture
+def user_id(app):
+    with get_pool().connection() as conn:
+        cursor = conn.execute("INSERT INTO users (name, email) VALUES (?, ?)",
+                              ('Session user', f'session-{time.time_ns()}@example.com'))
+        conn.commit()
+    return cursor.lastrowid
+
+@pytest.fixture
+def database_reads(monkeypatch):
+    """Token hashes looked up in the database"""
+    reads = []
+    real_get_session = sessions.get_session
+
+    def counting_get_session(token_hash):
+        reads.append(token_hash)
+        return real_get_session(token_hash)
+
+    monkeypatch.setattr(sessions, 'get_session', counting_get_session)
+    return reads
+
+def test_create_and_validate(user_id, database_reads):
+    store = SessionStore()
+    token, expires_at = store.create(user_id)
+    assert expires_at > time.time()
+    assert store.validate(token) == user_id
+    assert database_reads == []  # cached when created
+    assert SessionStore().validate(token) == user_id  # another process reads it from the database
+    assert database_reads == [hash_token(token)]
+
+def test_expired_sessions_are_rejected(user_id):
+    store = SessionStore(ttl=0.05)
+    token, _ = store.create(user_id)
+    time.sleep(0.06)
+    assert store.validate(token) is None
+    assert SessionStore().validate(token) is None
+
+def test_revoke(user_id):
+    store, other_process = SessionStore(), SessionStore(cache_ttl=0)
+    token, _ = store.create(user_id)
+    assert other_process.validate(token) == user_id
+    store.revoke(token)
+    assert store.validate(token) is None
+    assert other_process.validate(token) is None
+
+def test_revoke_all_keeps_the_current_session(user_id):
+    store = SessionStore()
+    current, _ = store.create(user_id)
+    others = [store.create(user_id)[0] for _ in range(2)]
+    assert store.revoke_all(user_id, keep_token=current) == 2
+    assert [store.validate(token) for token in others] == [None, None]
+    assert store.validate(current) == user_id
+
+def test_rejected_tokens_are_cached(app, database_reads):
+    store = SessionStore()
+    assert store.validate('garbage') is None
+    assert store.validate('garbage') is None
+    assert database_reads == [hash_token('garbage')]
+    assert store.stats()['cached_rejected'] == 1
+
+def test_unknown_tokens_do_not_evict_sessions(user_id, database_reads):
+    store = SessionStore(cache_size=2, rejected_cache_size=2)
+    tokens = [store.create(user_id)[0] for _ in range(2)]
+    for number in range(50):
+        assert store.validate(f'random-{number}') is None
+    del database_reads[:]
+    assert [store.validate(token) for token in tokens] == [user_id, user_id]
+    assert database_reads == []
+    assert store.stats()['cached_rejected'] == 2
+
+def test_cached_entries_are_rechecked(user_id, database_reads):
+    store = SessionStore(cache_ttl=0)
+    token, _ = store.create(user_id)
+    store.validate(token)
+    store.validate('garbage')
+    store.validate('garbage')
+    assert database_reads == [hash_token(token), hash_token('garbage'), hash_token('garbage')]
+
+def test_sweep_deletes_expired_sessions(user_id):
+    store = SessionStore(ttl=-1, sweep_batch_size=2, cache_ttl=0)
+    for _ in range(5):
+        store.create(user_id)
+    store.validate('garbage')
+    assert store.sweep() >= 5
+    assert (store.stats()['cached'], store.stats()['cached_rejected']) == (0, 0)
+
+def test_login_profile_and_logout(client):
+    email = f'login-{time.time_ns()}@example.com'
+    registered = client.post('/api/auth/register', json={'name': 'Logged', 'email': email, 'password': 'secret-pw'})
+    assert registered.status_code == 201
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'secret-pw'})
+    token = response.get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/auth/profile', headers=headers).get_json()['user']['email'] == email
+
+    other = {'Authorization': f"Bearer {registered.get_json()['token']}"}
+    assert client.post('/api/auth/logout', headers=headers).status_code == 200
+    assert client.get('/api/auth/profile', headers=headers).status_code == 401
+    assert client.get('/api/auth/profile', headers=other).status_code == 200
+    assert client.post('/api/auth/logout-all', headers=other).get_json()['revoked'] == 1
+    assert client.get('/api/auth/profile', headers=other).status_code == 401
+
+def test_bad_credentials(client):
+    assert client.post('/api/auth/login', json={'email': 'nobody@example.com', 'password': 'x'}).status_code == 401
+    assert client.get('/api/auth/profile', headers={'Authorization': 'Bearer nope'}).status_code == 401
+    assert client.get('/api/auth/profile').status_code == 401
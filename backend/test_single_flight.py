@@ -0,0 +1,106 @@
+import time
+import threading
+
+import main
+from cache import SingleFlight, IN_FLIGHT
+
+def run_in_threads(count, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError('timed out')
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'built'
+
+    threads, results = run_in_threads(5, lambda: flights.do('key', slow))
+    wait_for(lambda: flights.stats()['coalesced'] == 4)
+    assert flights.stats()['in_flight'] == 1
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['built'] * 5
+    assert len(calls) == 1
+    assert flights.stats() == {'leaders': 1, 'coalesced': 4, 'stale_served': 0, 'wait_timeouts': 0, 'in_flight': 0}
+    assert flights.do('key', lambda: 'again') == 'again'  # nothing is remembered
+
+def test_waiters_get_the_leaders_error():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def broken():
+        release.wait(5)
+        raise RuntimeError('database is locked')
+
+    def attempt():
+        try:
+            return flights.do('key', broken)
+        except RuntimeError as e:
+            return str(e)
+
+    threads, results = run_in_threads(2, attempt)
+    wait_for(lambda: flights.stats()['coalesced'] == 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['database is locked'] * 2
+    assert flights.stats()['leaders'] == 1
+
+def test_stale_readers_do_not_wait():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    leader = threading.Thread(target=lambda: flights.do('key', lambda: started.set() or release.wait(5)))
+    leader.start()
+    started.wait(5)
+    assert flights.do('key', lambda: 'not called', wait=False) is IN_FLIGHT
+    assert flights.do('other', lambda: 'built', wait=False) == 'built'
+    release.set()
+    leader.join()
+    assert flights.stats()['stale_served'] == 1
+
+def test_waiters_give_up_after_the_timeout():
+    flights = SingleFlight(timeout=0.01)
+    started, release = threading.Event(), threading.Event()
+    leader = threading.Thread(target=lambda: flights.do('key', lambda: started.set() or release.wait(5)))
+    leader.start()
+    started.wait(5)
+    assert flights.do('key', lambda: 'built myself') == 'built myself'
+    release.set()
+    leader.join()
+    assert flights.stats()['wait_timeouts'] == 1
+
+def test_concurrent_cache_misses_query_once(app, make_product, monkeypatch):
+    product_id = make_product('Thundering lamp', 7)
+    release = threading.Event()
+    queries = []
+    real_get_product_by_id = main.get_product_by_id
+
+    def slow_get_product_by_id(*args):
+        queries.append(args)
+        release.wait(5)
+        return real_get_product_by_id(*args)
+
+    monkeypatch.setattr(main, 'get_product_by_id', slow_get_product_by_id)
+    coalesced = main.catalog_flights.stats()['coalesced']
+    threads, responses = run_in_threads(4, lambda: app.test_client().get(f'/api/products/{product_id}'))
+    wait_for(lambda: main.catalog_flights.stats()['coalesced'] - coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(queries) == 1
+    assert [response.get_json()['product']['name'] for response in responses] == ['Thundering lamp'] * 4
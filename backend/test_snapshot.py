@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import sqlite3
+
+import pytest
+
+import main
+import snapshot
+from snapshot import CatalogSnapshot, SNAPSHOT_TABLES
+from database import get_pool, get_product_by_id, execute_query
+from cache import catalog_cache
+
+@pytest.fixture
+def catalog(app, tmp_path):
+    store = CatalogSnapshot(path=str(tmp_path / 'snapshot.db'), enabled=True)
+    yield store
+    store.stop()
+
+def test_publish_copies_the_catalog(catalog, make_product):
+    make_product('Snapshot lamp', 2)
+    catalog.publish()
+    conn = sqlite3.connect(catalog.path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert set(SNAPSHOT_TABLES) <= tables
+    assert 'users' not in tables
+    assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == \
+        execute_query("SELECT COUNT(*) FROM products", fetch='one')[0]
+    conn.close()
+    assert not [name for name in os.listdir(os.path.dirname(catalog.path)) if name.endswith('.tmp')]
+    assert catalog.stats()['published'] == 1
+
+def test_reads_come_from_the_snapshot(catalog, make_product):
+    catalog.publish()
+    product_id = make_product('After the snapshot', 2)
+    with catalog.reads():
+        assert get_product_by_id(product_id) is None
+        assert execute_query("SELECT COUNT(*) FROM users", fetch='one') is not None  # not copied: read live
+    assert get_product_by_id(product_id)['name'] == 'After the snapshot'
+    catalog.publish()
+    with catalog.reads():
+        assert get_product_by_id(product_id)['name'] == 'After the snapshot'
+    assert catalog.stats()['reopened'] == 2
+
+def test_when_the_live_database_is_read(catalog, monkeypatch):
+    monkeypatch.setattr(snapshot, 'SNAPSHOT_CHECK_INTERVAL', 0)
+    assert CatalogSnapshot(path=catalog.path, enabled=False).connection() is None
+    assert catalog.connection() is None  # nothing published yet
+    catalog.publish()
+    assert catalog.connection() is not None
+    assert catalog.connection(not_before=time.time() + 1) is None  # older than a write we must see
+    old = time.time() - catalog.max_staleness - 1
+    os.utime(catalog.path, (old, old))
+    assert catalog.connection() is None
+    stats = catalog.stats()
+    assert (stats['missing_reads'], stats['fresh_reads'], stats['stale_reads']) == (1, 1, 1)
+    assert stats['lag_seconds'] > catalog.max_staleness
+
+def test_writes_are_seen_by_other_processes(catalog, monkeypatch):
+    monkeypatch.setattr(snapshot, 'SNAPSHOT_CHECK_INTERVAL', 0)
+    other = CatalogSnapshot(path=catalog.path, enabled=True)  # another worker's view of the same file
+    catalog.publish()
+    assert other.connection() is not None
+    catalog.mark_changed(time.time())
+    assert other.connection() is None
+    catalog.mark_changed(time.time() - 60)  # a late, older mark doesn't hide the newer write
+    assert other.connection() is None
+    catalog.publish()
+    assert other.connection() is not None
+    other.stop()
+
+def test_publish_if_due(catalog):
+    assert catalog.publish_if_due()
+    assert not catalog.publish_if_due()  # another publish so soon isn't needed
+    assert catalog.stats()['published'] == 1
+
+def test_routes_read_the_snapshot_until_a_write(client, catalog, monkeypatch):
+    monkeypatch.setattr(main, 'catalog_snapshot', catalog)
+    catalog.publish()
+    with get_pool().connection() as conn:
+        product_id = conn.execute("INSERT INTO products (name, price) VALUES ('Unpublished lamp', 3)").lastrowid
+        conn.commit()
+    assert client.get(f'/api/products/{product_id}').status_code == 404
+    catalog_cache.invalidate_product()  # what the admin routes do after a write
+    assert client.get(f'/api/products/{product_id}').get_json()['product']['name'] == 'Unpublished lamp'
+
+def test_command_line(app, tmp_path, capsys):
+    output = str(tmp_path / 'cli-snapshot.db')
+    assert snapshot.main(['--output', output]) == 0
+    assert json.loads(capsys.readouterr().out)['published'] == 1
+    assert os.path.exists(output)
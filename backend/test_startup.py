@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+from startup import StartupProfile, startup_profile
+
+def test_phases_are_recorded_once():
+    profile = StartupProfile(started=time.perf_counter())
+    with profile.phase('schema'):
+        time.sleep(0.01)
+    with profile.phase('schema'):
+        pass
+    assert profile.phases()['schema'] >= 10
+    profile.first_request()
+    first = profile.phases()['first_request']
+    time.sleep(0.01)
+    profile.first_request()
+    assert profile.phases()['first_request'] == first
+    assert profile.stats() == {'schema_ms': profile.phases()['schema'], 'first_request_ms': first}
+
+def test_wait_for():
+    profile = StartupProfile()
+    assert profile.wait_for('warm_up', timeout=0.01) is None
+    threading.Timer(0.01, profile.record, ('warm_up', 5)).start()
+    assert profile.wait_for('warm_up', timeout=5) == 5
+
+def test_app_startup_is_profiled(client, admin_client):
+    client.get('/api/products')
+    phases = startup_profile.phases()
+    assert {'import', 'schema', 'static_manifest', 'subsystems', 'warm_up', 'ready', 'first_request'} <= set(phases)
+    assert phases['import'] <= phases['ready'] <= phases['first_request']
+    body = admin_client.get('/metrics').data.decode()
+    assert '\nstartup_schema_ms ' in body
+    assert '\nstartup_first_request_ms ' in body
+
+def test_profile_startup_command(tmp_path):
+    # It starts and stops a worker's background threads, so it runs in its own interpreter
+    env = dict(os.environ, DATABASE_PATH=str(tmp_path / 'startup.db'), STARTUP_WARMUP='background',
+               RATE_LIMIT_DATABASE=str(tmp_path / 'ratelimit.db'), IMAGE_STORAGE_PATH=str(tmp_path / 'images'))
+    completed = subprocess.run([sys.executable, 'serve.py', '--profile-startup', '--json'],
+                               cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True,
+                               text=True, timeout=300)
+    assert completed.returncode == 0, completed.stderr
+    report = json.loads(completed.stdout)
+    assert {'schema', 'warm_up', 'ready', 'first_request'} <= set(report['phases_ms'])
+    assert list(report['first_requests_ms']) == ['GET /', 'GET /api/products']
+    assert report['imports_by_cumulative_ms']
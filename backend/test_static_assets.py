@@ -0,0 +1,89 @@
+import gzip
+
+import pytest
+
+import static_assets
+from static_assets import StaticManifest, IMMUTABLE_CACHE_CONTROL, is_hashed_name
+
+@pytest.mark.parametrize('name, hashed', [
+    ('index-CAKtsD4_.js', True),
+    ('index-zaA4F1vl.css', True),
+    ('vendor-a1b2c3d4.js', True),
+    ('logo.png', False),
+    ('all-products.png', False),
+    ('my-homepage.html', False),
+])
+def test_hashed_names(name, hashed):
+    assert is_hashed_name(name) is hashed
+
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / 'app-B1a2c3D4.js').write_text('console.log("hello");\n' * 200)
+    (tmp_path / 'notes.txt').write_text('tiny')
+    (tmp_path / 'fonts').mkdir()
+    (tmp_path / 'fonts' / 'font.woff2').write_bytes(b'\0' * 2000)
+    return tmp_path
+
+def test_manifest_loads_every_file(static_dir):
+    manifest = StaticManifest()
+    manifest.build(str(static_dir), '<html></html>')
+    script = manifest.get('app-B1a2c3D4.js')
+    assert script.cache_control == IMMUTABLE_CACHE_CONTROL
+    assert script.mimetype in ('application/javascript', 'text/javascript')
+    assert gzip.decompress(script.variants['gzip']) == script.body
+    assert manifest.get('notes.txt').cache_control == f'public, max-age={static_assets.STATIC_MAX_AGE}'
+    assert manifest.get('notes.txt').variants == {}  # too small to be worth compressing
+    assert manifest.get('fonts/font.woff2').variants == {}  # not a compressible type
+    assert manifest.get('missing.js') is None
+    assert manifest.index.cache_control == 'no-cache'
+    assert manifest.stats()['files'] == 3
+
+def test_prebuilt_variants_are_used(static_dir):
+    prebuilt = gzip.compress(b'prebuilt')
+    (static_dir / 'app-B1a2c3D4.js.gz').write_bytes(prebuilt)
+    manifest = StaticManifest()
+    manifest.build(str(static_dir))
+    assert manifest.get('app-B1a2c3D4.js').variants['gzip'] == prebuilt
+    assert manifest.get('app-B1a2c3D4.js.gz') is None
+
+def test_compression_can_be_deferred(static_dir):
+    manifest = StaticManifest()
+    manifest.build(str(static_dir), '<html>' + 'x' * 2000 + '</html>', precompress=False)
+    assert manifest.stats()['compressed_bytes'] == 0
+    manifest.compress_variants()
+    assert 'gzip' in manifest.get('app-B1a2c3D4.js').variants
+    assert 'gzip' in manifest.index.variants
+
+def test_large_files_stay_on_disk(static_dir, monkeypatch):
+    monkeypatch.setattr(static_assets, 'STATIC_INLINE_MAX_SIZE', 1000)
+    manifest = StaticManifest()
+    manifest.build(str(static_dir))
+    assert manifest.get('fonts/font.woff2').body is None
+    assert manifest.get('notes.txt').body == b'tiny'
+    assert manifest.stats()['streamed_from_disk'] == 2
+
+def test_hashed_bundle_is_immutable_and_compressed(client):
+    plain = client.get('/static/index-CAKtsD4_.js')
+    assert plain.status_code == 200
+    assert plain.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    zipped = client.get('/static/index-CAKtsD4_.js', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.data) == plain.data
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    assert zipped.headers['ETag'] != plain.headers['ETag']
+
+def test_static_files_revalidate(client):
+    etag = client.get('/static/logo.png').headers['ETag']
+    response = client.get('/static/logo.png', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['Cache-Control'] == f'public, max-age={static_assets.STATIC_MAX_AGE}'
+
+def test_spa_shell_and_fallback(client):
+    index = client.get('/')
+    assert index.mimetype == 'text/html'
+    assert index.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/products/7').data == index.data  # client-side routes get the shell
+    assert client.get('/assets/index-zaA4F1vl.css').mimetype == 'text/css'
+
+def test_missing_static_file(client):
+    assert client.get('/static/nope.js').status_code == 404
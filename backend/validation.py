@@ -0,0 +1,98 @@
+import re
+import math
+
+def validate_product(data):
+    """Validate product input shared by the admin routes and bulk import
+
+    Returns a (name, price, description) tuple, or raises ValueError with a
+    message suitable for returning to the client.
+    """
+    if not data or 'name' not in data or 'price' not in data:
+        raise ValueError("Name and price are required")
+    
+    name = str(data['name']).strip()
+    
+    try:
+        price = float(data['price'])
+    except (ValueError, TypeError):
+        raise ValueError("Invalid price format")
+    if not math.isfinite(price):
+        raise ValueError("Invalid price format")
+    if price < 0:
+        raise ValueError("Price cannot be negative")
+    
+    description = (data.get('description') or '').strip()
+    
+    return name, price, description
+
+MIN_PASSWORD_LENGTH = 8
+
+def validate_email(email):
+    """Normalize an email address or raise ValueError"""
+    email = str(email).strip()
+    if '@' not in email or '.' not in email:
+        raise ValueError("Invalid email format")
+    return email
+
+def validate_password(password):
+    """Raise ValueError unless the password is acceptable"""
+    if not isinstance(password, str) or len(password) < MIN_PASSWORD_LENGTH:
+        raise ValueError(f"Password must be at least {MIN_PASSWORD_LENGTH} characters")
+    return password
+
+def validate_registration(data):
+    """Validate /api/auth/register input; returns (name, email, password)"""
+    if not data or not data.get('name') or not data.get('email') or 'password' not in data:
+        raise ValueError("Name, email and password are required")
+    return str(data['name']).strip(), validate_email(data['email']), validate_password(data['password'])
+
+def validate_category_id(value):
+    """Parse an optional category ID; None/blank means uncategorized"""
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        category_id = int(value)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid category_id")
+    if category_id < 1:
+        raise ValueError("Invalid category_id")
+    return category_id
+
+def validate_category(data):
+    """Validate category input; returns (name, description)"""
+    if not data or not str(data.get('name') or '').strip():
+        raise ValueError("Name is required")
+    return str(data['name']).strip(), (data.get('description') or '').strip()
+
+IMAGE_HASH = re.compile(r'^[0-9a-f]{64}$')
+
+def validate_image_hash(value):
+    """Parse an optional image hash (as returned by the upload routes); None/blank means no image"""
+    if value is None or str(value).strip() == '':
+        return None
+    image_hash = str(value).strip().lower()
+    if not IMAGE_HASH.match(image_hash):
+        raise ValueError("Invalid image")
+    return image_hash
+
+def validate_ids(value, max_ids):
+    """Parse a batch of IDs from a list or a comma separated string; duplicates are dropped, order is kept"""
+    if isinstance(value, str):
+        value = [part for part in value.split(',') if part.strip()]
+    if not isinstance(value, list) or not value:
+        raise ValueError("ids must be a non-empty list of IDs")
+    ids = []
+    for item in value:
+        if isinstance(item, bool):
+            raise ValueError("Invalid id")
+        try:
+            item_id = int(str(item).strip())
+        except ValueError:
+            raise ValueError(f"Invalid id: {item}")
+        if item_id < 1:
+            raise ValueError(f"Invalid id: {item}")
+        ids.append(item_id)
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > max_ids:
+        raise ValueError(f"At most {max_ids} ids per request")
+    return ids
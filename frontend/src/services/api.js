@@ -56,6 +56,7 @@ export const authAPI = {
 export const productsAPI = {
   getAll: (params = {}) => api.get('/products', { params }),
   getById: (id) => api.get(`/products/${id}`),
+  getByIds: (ids) => api.post('/products/batch', { ids }),
   create: (productData) => api.post('/admin/products', productData),
   update: (id, productData) => api.put(`/admin/products/${id}`, productData),
   delete: (id) => api.delete(`/admin/products/${id}`),